@@ -3,15 +3,26 @@ Entry module of the application.
 """
 
 import sys
+import time
+import threading
 import pygame
 from appstate import AppState
 import settings
 import events
 from view import view
 from view import agentevents
+from view import profilesummary
+from view import metricssampler
+from view import tracerecorder
+from view import checkpointer
 from controller import controller
 import experiment.basic
+import model.agent
 import webserver
+from utilities.profiler import Profiler
+import utilities.logger
+
+logger = utilities.logger.get_logger("EnactiveAgents")
 
 class HeartBeat(events.EventListener):
     """
@@ -25,7 +36,14 @@ class HeartBeat(events.EventListener):
 
         self.halt = False
 
-        print("Starting heartbeat.")
+        if settings.DECOUPLED_SIMULATION:
+            if any(isinstance(agent, model.agent.HumanAgent) for agent in AppState.get_state().get_world().get_agents()):
+                logger.warning("Human agents cannot be controlled in a decoupled simulation; not decoupling the simulation.")
+            else:
+                self.run_decoupled()
+                return
+
+        logger.info("Starting heartbeat.")
         time_elapsed = 0
         while True:
 
@@ -34,8 +52,9 @@ class HeartBeat(events.EventListener):
             ticked = False
 
             if AppState.get_state().is_running() and time_elapsed >= settings.SIMULATION_STEP_TIME:
-                print "------- t = %s" % AppState.get_state().get_t()
+                logger.debug("------- t = %s", AppState.get_state().get_t())
                 AppState.get_state().get_event_manager().post_event(events.TickEvent())
+                AppState.get_state().get_event_manager().post_event(events.TickEndEvent())
                 time_elapsed = 0
                 ticked = True
 
@@ -46,8 +65,61 @@ class HeartBeat(events.EventListener):
             if ticked:
                 AppState.get_state().increment_t()
 
+    def run_decoupled(self):
+        """
+        Run the simulation in its own thread, ticking as fast as possible, and
+        process PyGame events and draw until halt is true. Views capture the
+        world between two ticks and draw the captured world, such that ticks
+        that cannot be drawn in time are skipped.
+        """
+        self.halt = False
+        self.lock = threading.Lock()
+
+        logger.info("Starting decoupled heartbeat.")
+        simulation = threading.Thread(target = self.simulate, name = "Simulation")
+        simulation.daemon = True
+        simulation.start()
+
+        t = None
+        try:
+            while True:
+
+                with self.lock:
+                    AppState.get_state().get_event_manager().post_event(events.ControlEvent())
+                    AppState.get_state().get_event_manager().post_event(events.CaptureEvent())
+                    ticked = AppState.get_state().get_t() != t
+                    t = AppState.get_state().get_t()
+
+                AppState.get_state().get_event_manager().post_event(events.DrawEvent(ticked and AppState.get_state().get_save_simulation_renders()))
+
+                AppState.get_state().get_clock().tick(settings.MAX_FPS)
+        finally:
+            # Stop the simulation after its current tick
+            self.halt = True
+            simulation.join()
+
+    def simulate(self):
+        """
+        Tick the simulation as fast as possible until halt is true.
+        """
+        while not self.halt:
+            with self.lock:
+                running = AppState.get_state().is_running() and not self.halt
+                if running:
+                    logger.debug("------- t = %s", AppState.get_state().get_t())
+                    AppState.get_state().get_event_manager().post_event(events.TickEvent())
+                    AppState.get_state().get_event_manager().post_event(events.TickEndEvent())
+                    AppState.get_state().increment_t()
+
+            if running:
+                # Let the draw loop acquire the lock
+                time.sleep(0)
+            else:
+                time.sleep(0.01)
+
     def notify(self, event):
         if isinstance(event, events.QuitEvent):
+            utilities.logger.flush()
             sys.exit()
 
 def init():
@@ -76,6 +148,9 @@ def main():
     """
     Main function of the application.
     """
+    # Set up the application log.
+    utilities.logger.setup()
+
     # Initialize the event manager.
     event_manager = events.EventManager()
     AppState.get_state().set_event_manager(event_manager)
@@ -103,6 +178,28 @@ def main():
     trace_view = agentevents.AgentEvents()
     event_manager.register_listener(trace_view)
 
+    # Initialize the trace recorder.
+    if settings.TRACE_RECORDING:
+        trace_recorder = tracerecorder.TraceRecorder(world = world)
+        event_manager.register_listener(trace_recorder)
+        logger.info("Recording traces to %s", trace_recorder.get_file_path())
+
+    # Initialize the background checkpointer.
+    if settings.CHECKPOINT_INTERVAL > 0:
+        checkpointer_ = checkpointer.Checkpointer()
+        event_manager.register_listener(checkpointer_)
+        logger.info("Writing checkpoints to %s", checkpointer_.get_directory())
+
+    # Initialize the profiling summary view.
+    if settings.PROFILING:
+        Profiler.get_profiler().enable()
+    profile_view = profilesummary.ProfileSummary()
+    event_manager.register_listener(profile_view)
+
+    # Initialize the metrics sampler.
+    metrics_sampler = metricssampler.MetricsSampler()
+    event_manager.register_listener(metrics_sampler)
+
     # Initialize and register the controller.
     main_controller = controller.Controller()
     event_manager.register_listener(main_controller)
@@ -112,6 +209,7 @@ def main():
 
     # Start the webserver.
     webserver.trace_view = trace_view
+    webserver.profile_view = profile_view
     webserver.start()
 
     # Start the heartbeat.
@@ -9,6 +9,11 @@ from appstate import AppState
 import pygame
 import events
 import settings
+import model.snapshot
+from utilities.profiler import Profiler
+from utilities.logger import get_logger
+
+logger = get_logger(__name__)
 
 class Controller(events.EventListener):
     """
@@ -56,6 +61,9 @@ class Controller(events.EventListener):
                 elif event.key == pygame.K_e and pygame.key.get_pressed()[pygame.K_LCTRL]:
                     self.save_experiment()
                     return
+                elif event.key == pygame.K_n and pygame.key.get_pressed()[pygame.K_LCTRL]:
+                    self.save_snapshot()
+                    return
                 elif event.key == pygame.K_h:
                     self.help()
                     return
@@ -66,6 +74,14 @@ class Controller(events.EventListener):
                     else:
                         print "No longer saving simulation renders to file."
                     return
+                elif event.key == pygame.K_p:
+                    Profiler.get_profiler().toggle()
+                    if Profiler.get_profiler().is_enabled():
+                        logger.info("Profiling enabled.")
+                    else:
+                        logger.info("Profiling disabled.")
+                        logger.info("\n".join(Profiler.get_profiler().format_summary()))
+                    return
             
             if self.experiment_controller:
                 if pygame.mouse.get_focused():
@@ -189,6 +205,32 @@ class Controller(events.EventListener):
 
         print "---"
 
+    def save_snapshot(self):
+        """
+        Save a snapshot of the world, its agents and the experiment to file.
+        """
+        print "---"
+        print "Saving a snapshot to file..."
+
+        # Create output directory if it does not exist
+        if not os.path.exists(settings.SNAPSHOT_DIR):
+            os.makedirs(settings.SNAPSHOT_DIR)
+
+        state = AppState.get_state()
+        file_name = "%s - t%s.snap" % (strftime("%Y%m%dT%H%M%S"), state.get_t())
+        file_path = os.path.join(settings.SNAPSHOT_DIR, file_name)
+
+        print " - Saving snapshot to %s" % file_path
+        model.snapshot.save_world(
+            state.get_world(),
+            file_path,
+            state.get_t(),
+            state.get_experiment(),
+            settings.SNAPSHOT_COMPRESS)
+
+        print "Snapshot saved."
+        print "---"
+
     def help(self):
         """
         Show controller help information.
@@ -200,8 +242,10 @@ class Controller(events.EventListener):
         print " - [control] + s - save the agents to file"
         print " - [control] + w - save the world to file"
         print " - [control] + e - save the experiment to file"
+        print " - [control] + n - save a snapshot of the world, agents and experiment"
         print " - h             - show this help information"
         print " - r             - toggle saving simulation renders to disk"
+        print " - p             - toggle profiling of the simulation hot paths"
         print ""
         print "Press any key to continue."
         while True:
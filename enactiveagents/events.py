@@ -4,7 +4,6 @@ Module implementing the event manager (mediator).
 See also: http://pygame.org/wiki/tut_design
 """
 
-import pygame.event
 import abc
 
 class Event:
@@ -25,6 +24,15 @@ class TickEvent(Event):
     def __init__(self):
         self.name = "Tick Event"
 
+class TickEndEvent(Event):
+    """
+    Class representing the end of a game tick: all listeners have processed
+    the tick event, and the simulation is in a consistent state.
+    """
+
+    def __init__(self):
+        self.name = "Tick End Event"
+
 class DrawEvent(Event):
     """
     Class representing a game draw event. E.g., notifies views to update.
@@ -42,6 +50,16 @@ class DrawEvent(Event):
     def get_save_to_file(self):
         return self.save_to_file
 
+class CaptureEvent(Event):
+    """
+    Class representing a capture event. Notifies views to capture the state
+    of the world they draw, while the simulation is not updating it (e.g.,
+    when the simulation runs in its own thread).
+    """
+
+    def __init__(self):
+        self.name = "Capture Event"
+
 class ControlEvent(Event):
     """
     Class representing a game control event. E.g., notifies the controller to update.
@@ -71,6 +89,17 @@ class AgentPreparationEvent(Event):
         self.action = action
         self.valence = valence
 
+class AgentIntentionEvent(Event):
+    """
+    Class representing an agent intention event. This event holds the
+    (possibly composite) interaction an agent decided to attempt to enact.
+    """
+
+    def __init__(self, agent, action):
+        self.name = "Agent Intention Event"
+        self.agent = agent
+        self.action = action
+
 class AgentEnactionEvent(Event):
     """
     Class representing an agent enaction event. This event holds the action and
@@ -7,7 +7,6 @@ import model.agent
 import experiment
 import agentprogram.agentprogram
 from elements import Elements
-import pygame
 
 class LoadWorldExperiment(experiment.Experiment):
     """
@@ -340,6 +339,8 @@ class BasicHomeostaticVisionExperiment(experiment.Experiment):
                     entity.set_perception_handler(model.perceptionhandler.BasicPerceptionHandler())
 
     def controller(self, event, coords):
+        import pygame
+
         if event.type == pygame.KEYDOWN:
             if event.key == pygame.K_f:
                 food = model.structure.Food()
@@ -538,6 +539,8 @@ class BasicVisionCoexsistenceDestroyExperiment(experiment.Experiment):
                 entity.add_motivations(motivation)
 
     def controller(self, event, coords):
+        import pygame
+
         if event.type == pygame.KEYDOWN:
             if event.key == pygame.K_f:
                 food = model.structure.Food()
@@ -6,6 +6,7 @@ import model.world
 import model.structure
 import model.agent
 import model.perceptionhandler
+import model.snapshot
 
 class Experiment(object):
 
@@ -140,4 +141,59 @@ class Experiment(object):
         else:       
             file_path = os.path.join(settings.EXPERIMENT_DIR, file_name)
             e = dill.load(open(file_path, "rb"))
-            return e
\ No newline at end of file
+            return e
+
+    def load_agent_snapshot(self, file_name, index = 0, mapped = False):
+        """
+        Load an agent from a snapshot file.
+
+        :param file_name: The name of the file to load the agent from (e.g., "20161118T035805 - Agent DZX26I.snap").
+        :param index: The index of the agent in the snapshot.
+        :param mapped: Whether to memory-map the agent's interaction memory,
+                       such that composite interactions are only loaded when
+                       they are needed (for large memories).
+        :return: The loaded agent.
+        """
+        file_path = os.path.join(settings.SNAPSHOT_DIR, file_name)
+
+        if mapped:
+            try:
+                import model.mappedinteractionmemory
+            except ImportError:
+                print "ERROR: Module 'numpy' is required to memory-map agents."
+                return None
+            else:
+                return model.mappedinteractionmemory.load_agent(file_path, index)
+
+        return model.snapshot.Snapshot.read(file_path).create_agent(index)
+
+    def restore_snapshot(self, file_name):
+        """
+        Restore a world snapshot onto the world of this experiment. The agents
+        in the world keep the enact logic set up by this experiment.
+
+        :param file_name: The name of the file to load the snapshot from (e.g., "20161118T035805 - t1500.snap").
+        :return: The simulation time of the snapshot.
+        """
+        file_path = os.path.join(settings.SNAPSHOT_DIR, file_name)
+        snapshot = model.snapshot.Snapshot.read(file_path)
+        snapshot.restore_world(self.get_world())
+        return snapshot.get_t()
+
+    @staticmethod
+    def load_snapshot(file_name):
+        """
+        Load an experiment from a snapshot file: the experiment the snapshot
+        was taken of is created, and the snapshot is restored onto its world.
+
+        :param file_name: The name of the file to load the experiment from (e.g., "20161118T035805 - t1500.snap").
+        :return: The loaded experiment and the simulation time of the snapshot.
+        """
+        file_path = os.path.join(settings.SNAPSHOT_DIR, file_name)
+        snapshot = model.snapshot.Snapshot.read(file_path)
+        if snapshot.get_experiment() is None:
+            raise ValueError("The snapshot was not taken of an experiment")
+
+        e = model.snapshot.load_class(snapshot.get_experiment())()
+        snapshot.restore_world(e.get_world())
+        return (e, snapshot.get_t())
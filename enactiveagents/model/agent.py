@@ -6,13 +6,16 @@ import sys
 import string
 import abc
 import random
-import pygame
 import entity
 import interaction
 import interactionmemory
+import selectionpolicy
 import events
 from appstate import AppState
 import settings
+from utilities.logger import get_logger
+
+logger = get_logger(__name__)
 
 class Agent(entity.Entity):
     """
@@ -21,6 +24,9 @@ class Agent(entity.Entity):
 
     color = (3, 124, 146, 255)
 
+    #: The policy used to select interactions
+    selection_policy = selectionpolicy.GreedySelectionPolicy()
+
     def __init__(self):
         super(Agent, self).__init__()
         self.setup_interaction_memory()
@@ -62,11 +68,24 @@ class Agent(entity.Entity):
         """ 
         raise NotImplementedError("Should be implemented by child.")
 
+    def get_preparation_data(self, interaction):
+        """
+        Get the data prepare_interaction returns together with a prepared
+        primitive interaction. Used to replay preparations without deciding.
+
+        :param interaction: The prepared primitive interaction
+        :return: The data that is passed to enacted_interaction
+        """
+        return None
+
     def setup_interaction_memory(self):
         """
         Setup the interaction memory of this agent.
         """
-        self.interaction_memory = interactionmemory.InteractionMemory()
+        if settings.ARRAY_INTERACTION_MEMORY:
+            self.interaction_memory = interactionmemory.ArrayInteractionMemory()
+        else:
+            self.interaction_memory = interactionmemory.InteractionMemory()
 
     def get_name(self):
         """
@@ -88,13 +107,28 @@ class Agent(entity.Entity):
     def has_perception_handler(self):
         return hasattr(self, "perception_handler")
 
+    def get_selection_policy(self):
+        return self.selection_policy
+
+    def set_selection_policy(self, selection_policy):
+        self.selection_policy = selection_policy
+
     def add_primitives(self, primitives):
         for primitive in primitives:
             self.interaction_memory.add_interaction(primitive)
 
     def add_motivations(self, motivation):
         for primitive, valence in motivation.iteritems():
-            self.interaction_memory.set_valence(primitive, valence)
+            self.set_valence(primitive, valence)
+
+    def set_valence(self, primitive, valence):
+        """
+        Set the valence of a primitive interaction.
+
+        :param primitive: The primitive interaction
+        :param valence: The valence
+        """
+        self.interaction_memory.set_valence(primitive, valence)
 
     def get_interaction_memory(self):
         return self.interaction_memory
@@ -102,31 +136,71 @@ class Agent(entity.Entity):
     def set_interaction_memory(self, interaction_memory):
         self.interaction_memory = interaction_memory
 
+    def get_snapshot_state(self, table):
+        """
+        Get the state of this agent that is not held by its entity attributes
+        or interaction memory, to store in a snapshot.
+
+        :param table: The interaction table of this agent's memory, used to
+                      refer to interactions by id
+        :return: A dictionary with the state of this agent
+        """
+        state = {"name": self.name}
+        if self.has_perception_handler():
+            state["perception_handler"] = self.perception_handler
+        state["selection_policy"] = self.selection_policy
+        return state
+
+    def set_snapshot_state(self, state, table):
+        """
+        Restore the state of this agent from a snapshot.
+
+        :param state: The state as returned by get_snapshot_state
+        :param table: The interaction table of this agent's memory
+        """
+        self.name = state["name"]
+        if "perception_handler" in state:
+            self.perception_handler = state["perception_handler"]
+        if "selection_policy" in state:
+            self.selection_policy = state["selection_policy"]
+
     def collidable(self):
         return False
 
 class SimpleAgent(Agent):
     """
     An agent with a simple existence.
+
+    With the greedy selection policy, decisions are made from compiled
+    anticipations: for each (pre) interaction, the anticipated post
+    interaction with the highest valence. These are compiled from the
+    interaction memory when first needed, updated as the agent learns
+    composite interactions, and compiled again when the memory is otherwise
+    modified (see InteractionMemory.get_modification_count).
     """
     enacted = None
 
+    #: The compiled anticipations, as (post interaction, valence) tuples by
+    #: pre interaction
+    anticipations = None
+    compiled_memory = None
+    compiled_modification_count = 0
+
     def anticipate(self):
         """
         Anticipate the possible interactions based on the current context.
         
         :return: A list of possible (primitive) interactions.
         """
-        interactions = []
-        for composite_interaction in self.interaction_memory.get_composite_interactions():
-            if composite_interaction.get_pre() == self.enacted:
-                interactions.append(composite_interaction.get_post())
+        if self.enacted is None:
+            return []
 
-        return interactions
+        return [composite_interaction.get_post() for composite_interaction in self.interaction_memory.get_activated_interactions([self.enacted])]
 
     def select_experiment(self, anticipations):
         """
-        Select the best interaction from a list of anticipated interactions.
+        Select the best interaction from a list of anticipated interactions,
+        by valence, using the agent's selection policy.
 
         If the list of anticipated interactions is empty or if the best 
         interaction has negative valence, return a random primitive interaction.
@@ -136,12 +210,9 @@ class SimpleAgent(Agent):
 
         :return: A chosen primitive interaction.
         """
-        anticipations.sort(
-            key = lambda x: self.interaction_memory.get_valence(x),
-            reverse = True
-        )
-        if len(anticipations) > 0 and self.interaction_memory.get_valence(anticipations[0]) > 0:
-            return anticipations[0]
+        experiment = self.selection_policy.select(anticipations, self.interaction_memory.get_valence)
+        if experiment is not None and self.interaction_memory.get_valence(experiment) > 0:
+            return experiment
         else:
             return random.choice(self.interaction_memory.get_primitive_interactions())
 
@@ -153,25 +224,93 @@ class SimpleAgent(Agent):
         :param enacted: The newly enecated interaction (post-interaction).
         """
         composite = interaction.CompositeInteraction(context, enacted)
-        if composite not in self.interaction_memory.get_composite_interactions():
+        if not self.interaction_memory.has_interaction(composite):
+            compiled = self.is_compiled()
             self.interaction_memory.add_interaction(composite)
+            if compiled:
+                self.compile_anticipation(composite)
+                self.compiled_modification_count = self.interaction_memory.get_modification_count()
         else:
             self.interaction_memory.increment_weight(composite)
 
+    def compile_anticipations(self):
+        """
+        Compile the anticipations from the interaction memory.
+        """
+        self.anticipations = {}
+        self.compiled_memory = self.interaction_memory
+        self.compiled_modification_count = self.interaction_memory.get_modification_count()
+        for composite_interaction in self.interaction_memory.get_composite_interactions():
+            self.compile_anticipation(composite_interaction)
+
+    def is_compiled(self):
+        """
+        :return: True if the compiled anticipations are up to date with the
+                 interaction memory
+        """
+        return (
+            self.anticipations is not None
+            and self.compiled_memory is self.interaction_memory
+            and self.compiled_modification_count == self.interaction_memory.get_modification_count())
+
+    def compile_anticipation(self, composite_interaction):
+        """
+        Update the compiled anticipations with a composite interaction in the
+        interaction memory (that was added after the other composite
+        interactions).
+
+        :param composite_interaction: The composite interaction
+        """
+        pre = composite_interaction.get_pre()
+        post = composite_interaction.get_post()
+        valence = self.interaction_memory.get_valence(post)
+
+        # As with selection from the anticipations, the first post interaction
+        # with the highest valence is kept
+        anticipation = self.anticipations.get(pre)
+        if anticipation is None or valence > anticipation[1]:
+            self.anticipations[pre] = (post, valence)
+
+    def get_best_anticipation(self):
+        """
+        Get the anticipated interaction with the highest valence, based on
+        the current context.
+
+        :return: A (post interaction, valence) tuple, or None if there are no
+                 anticipated interactions
+        """
+        if self.enacted is None:
+            return None
+
+        if not self.is_compiled():
+            self.compile_anticipations()
+
+        return self.anticipations.get(self.enacted)
+
     def prepare_interaction(self):
-        anticipations = self.anticipate()
-        experiment = self.select_experiment(anticipations)
+        if type(self.selection_policy) is selectionpolicy.GreedySelectionPolicy:
+            # Decide from the compiled anticipations
+            anticipation = self.get_best_anticipation()
+            if anticipation is not None and anticipation[1] > 0:
+                (experiment, valence) = anticipation
+            else:
+                experiment = random.choice(self.interaction_memory.get_primitive_interactions())
+                valence = self.interaction_memory.get_valence(experiment)
+        else:
+            anticipations = self.anticipate()
+            experiment = self.select_experiment(anticipations)
+            valence = self.interaction_memory.get_valence(experiment)
 
         # Post interaction preparation event
         AppState.state.get_event_manager().post_event(events.AgentPreparationEvent(
             self, 
             experiment, 
-            self.interaction_memory.get_valence(experiment)))
+            valence))
         return experiment
 
     def enacted_interaction(self, interaction, data):
         # Learn interaction if it is not yet known
-        if interaction not in self.interaction_memory.get_primitive_interactions():
+        if not self.interaction_memory.has_interaction(interaction):
             self.interaction_memory.add_interaction(interaction)
 
         # Post enacted interaction event
@@ -185,6 +324,15 @@ class SimpleAgent(Agent):
             self.learn_composite_interaction(self.enacted, interaction)
         self.enacted = interaction
 
+    def get_snapshot_state(self, table):
+        state = super(SimpleAgent, self).get_snapshot_state(table)
+        state["enacted"] = -1 if self.enacted is None else table.get_id(self.enacted)
+        return state
+
+    def set_snapshot_state(self, state, table):
+        super(SimpleAgent, self).set_snapshot_state(state, table)
+        self.enacted = table.get_interaction(state["enacted"])
+
 class ConstructiveAgent(Agent):
     """
     An agent with a fully recursive existence. It considers all experiment as 
@@ -207,12 +355,7 @@ class ConstructiveAgent(Agent):
         Known composite interactions whose pre-interaction belongs to the 
         context are activated.
         """
-        activated = []
-        for composite_interaction in self.interaction_memory.get_composite_interactions():
-            if composite_interaction.get_pre() in self.context:
-                activated.append(composite_interaction)
-
-        return activated
+        return self.interaction_memory.get_activated_interactions(self.context)
 
     def propose_interactions(self):
         """
@@ -254,26 +397,39 @@ class ConstructiveAgent(Agent):
         adjusted to reflect this.
         """
         proposed = self.propose_interactions()
-
-        proposed = map(lambda (proposed_interaction, weight):
-            (
-                proposed_interaction,
-                weight * self.interaction_memory.get_valence(proposed_interaction, process_boredom = True)
-            ), proposed)
-
-        n = 0
-
-        proposed_interactions = map(lambda (proposed_interaction, proclivity): proposed_interaction, proposed)
-
-        for (proposed_interaction, proclivity) in proposed:
-            for alternative in self.interaction_memory.get_alternative_interactions(proposed_interaction):
-                if alternative in proposed_interactions:
-                    print "%s - Anticipating alternative %s for %s" % (self.name, alternative, proposed_interaction)
-                    proclivity += self.interaction_memory.get_proclivity(alternative)
-            proposed[n] = (proposed_interaction, proclivity)
-            n += 1
-
-        return proposed
+        proposed_interactions = []
+        weights = []
+        for (proposed_interaction, weight) in proposed:
+            proposed_interactions.append(proposed_interaction)
+            weights.append(weight)
+
+        # Score all proposed interactions in one batch
+        valences = self.interaction_memory.get_valences(proposed_interactions, process_boredom = True)
+        proclivities = [weight * valence for (weight, valence) in zip(weights, valences)]
+
+        # Find the proposed interactions that are alternatives of other
+        # proposed interactions, through the interactions each proposed
+        # interaction is registered to as an alternative
+        proposed_indices = dict((proposed_interaction, n) for (n, proposed_interaction) in enumerate(proposed_interactions))
+        anticipated = []
+        anticipated_alternatives = {}
+        for alternative in proposed_interactions:
+            for interaction_ in self.interaction_memory.get_interactions_with_alternative(alternative):
+                n = proposed_indices.get(interaction_)
+                if n is not None:
+                    anticipated.append((n, alternative))
+                    anticipated_alternatives[alternative] = None
+
+        if len(anticipated) > 0:
+            # Get the proclivities of the anticipated alternatives in one batch
+            alternatives = anticipated_alternatives.keys()
+            anticipated_alternatives = dict(zip(alternatives, self.interaction_memory.get_proclivities(alternatives)))
+
+            for (n, alternative) in anticipated:
+                logger.debug("%s - Anticipating alternative %s for %s", self.name, alternative, proposed_interactions[n])
+                proclivities[n] += anticipated_alternatives[alternative]
+
+        return zip(proposed_interactions, proclivities)
 
 
     def select_intended_interaction(self):
@@ -285,15 +441,11 @@ class ConstructiveAgent(Agent):
 
         The intended interaction is selected from the proposed interactions
         based on the weight of the activated interactions and the values of the
-        proposed post interactions.
+        proposed post interactions, using the agent's selection policy.
         """
 
-        proposed = self.consider_alternative_interactions()
-        proposed.sort(
-            key = lambda x: x[1],
-            reverse = True
-        )
-        proposed = map(lambda x: x[0], proposed)
+        proposed = self.selection_policy.select(self.consider_alternative_interactions(), key = lambda x: x[1])
+        intended = None if proposed is None else proposed[0]
 
         """
         Without alternatives:
@@ -305,16 +457,16 @@ class ConstructiveAgent(Agent):
         proposed = map(lambda x: x[0], proposed)
         """
 
-        if len(proposed) > 0 and self.interaction_memory.get_proclivity(proposed[0]) > 0:
-            return proposed[0]
-        elif len(proposed) == 0:
+        if intended is not None and self.interaction_memory.get_proclivity(intended) > 0:
+            return intended
+        elif intended is None:
             # TODO: in Katja's implementation the activated interactions contain
             # some set of default interactions. The paper itself does not seem 
             # to mention how to deal with an empty activated set.
-            print "%s - No proposed interactions: exploring" % self.name
+            logger.debug("%s - No proposed interactions: exploring", self.name)
             return random.choice(self.interaction_memory.get_primitive_interactions())
         else:
-            print "%s - Negative proclivity: exploring" % self.name
+            logger.debug("%s - Negative proclivity: exploring", self.name)
             return random.choice(self.interaction_memory.get_primitive_interactions())
 
     def update_context(self, enacted_interaction, learned_or_reinforced):
@@ -358,30 +510,78 @@ class ConstructiveAgent(Agent):
         """
         
 
+    def get_active_interactions(self):
+        """
+        Get the interactions the agent is currently using: the interaction it
+        is enacting, its context, and its history.
+
+        :return: A list of interactions
+        """
+        if self.enacting_interaction:
+            return [self.intended_interaction] + self.context + self.history
+        else:
+            return self.context + self.history
+
+    def intend_interaction(self, intended_interaction):
+        """
+        Start enacting the sequence of primitives of an intended interaction.
+
+        :param intended_interaction: The (primitive or composite) interaction
+                                     to enact
+        """
+        self.enacting_interaction = True
+        self.enacting_interaction_step = 0
+        self.enacted_sequence = []
+        self.intended_interaction = intended_interaction
+        self.enacting_interaction_sequence = intended_interaction.unwrap()
+
+    def get_snapshot_state(self, table):
+        state = super(ConstructiveAgent, self).get_snapshot_state(table)
+        state["enacting_interaction"] = self.enacting_interaction
+        state["enacting_interaction_step"] = self.enacting_interaction_step
+        if self.enacting_interaction:
+            state["intended_interaction"] = table.get_id(self.intended_interaction)
+        state["enacted_sequence"] = [table.get_id(interaction_) for interaction_ in self.enacted_sequence]
+        state["context"] = [table.get_id(interaction_) for interaction_ in self.context]
+        state["history"] = [table.get_id(interaction_) for interaction_ in self.history]
+        return state
+
+    def set_snapshot_state(self, state, table):
+        super(ConstructiveAgent, self).set_snapshot_state(state, table)
+        if state["enacting_interaction"]:
+            self.intend_interaction(table.get_interaction(state["intended_interaction"]))
+        self.enacting_interaction = state["enacting_interaction"]
+        self.enacting_interaction_step = state["enacting_interaction_step"]
+        self.enacted_sequence = [table.get_interaction(interaction_id) for interaction_id in state["enacted_sequence"]]
+        self.context = [table.get_interaction(interaction_id) for interaction_id in state["context"]]
+        self.history = [table.get_interaction(interaction_id) for interaction_id in state["history"]]
+
     def prepare_interaction(self):
         if not self.enacting_interaction:
             # Decisional mechanism.
             # We are not currently enacting the primitives in a sequence of
             # interactions. Choose a new interaction to enact (steps 1-3).
-            self.enacting_interaction = True
-            self.enacting_interaction_step = 0
-            self.enacted_sequence = []
 
             # Exploration
             if random.random() <= 0.1:
                 # Choose a random primitive interaction (not a primitive perception interaction)
-                self.intended_interaction = random.choice(filter(lambda x: isinstance(x, interaction.PrimitiveInteraction), self.interaction_memory.get_primitive_interactions()))
-                print "%s - EXPLORING" % (self.name)
+                intended_interaction = random.choice(filter(lambda x: isinstance(x, interaction.PrimitiveInteraction), self.interaction_memory.get_primitive_interactions()))
+                logger.debug("%s - EXPLORING", self.name)
             else:
-                self.intended_interaction = self.select_intended_interaction()
+                intended_interaction = self.select_intended_interaction()
+
+            self.intend_interaction(intended_interaction)
+            logger.debug("%s - Intending: %s", self.name, self.intended_interaction)
 
-            self.enacting_interaction_sequence = self.intended_interaction.unwrap()
-            print "%s - Intending: %s" % (self.name, self.intended_interaction)
+            # Post interaction intention event
+            AppState.state.get_event_manager().post_event(events.AgentIntentionEvent(
+                self,
+                self.intended_interaction))
 
         # Enact a primitive interaction from the sequence we are currently
         # enacting.
         intended_interaction = self.enacting_interaction_sequence[self.enacting_interaction_step]
-        print "%s - > %s" % (self.name, intended_interaction)
+        logger.debug("%s - > %s", self.name, intended_interaction)
 
         # Step 4 of the sequential system, enact the interaction:
         # Post interaction preparation event
@@ -391,6 +591,9 @@ class ConstructiveAgent(Agent):
             self.interaction_memory.get_valence(intended_interaction, process_boredom = True)))
         return (intended_interaction, intended_interaction)
 
+    def get_preparation_data(self, interaction):
+        return interaction
+
     def enacted_interaction(self, interaction_, data):
         self.enacting_interaction_step += 1
         intended_primitive_interaction = data
@@ -398,7 +601,7 @@ class ConstructiveAgent(Agent):
         self.enacted_sequence.append(interaction_)
 
         # Learn interaction if it is not yet known
-        if interaction_ not in self.interaction_memory.get_primitive_interactions():
+        if not self.interaction_memory.has_interaction(interaction_):
             self.interaction_memory.add_interaction(interaction_)
 
         # Post enacted interaction event
@@ -419,12 +622,12 @@ class ConstructiveAgent(Agent):
             # Reconstruct enacted interaction from hierarchy of intended
             # interaction
             enacted = self.intended_interaction.reconstruct_from_hierarchy(self.enacted_sequence)
-            print "%s - Enacted: %s" % (self.name, enacted)
+            logger.debug("%s - Enacted: %s", self.name, enacted)
 
             # Add the interaction as an alternative interaction if the intended interaction failed
             if enacted != self.intended_interaction:
                 if self.interaction_memory.add_alternative_interaction(self.intended_interaction, enacted):
-                    print "%s - Interaction added as alternative" % self.name
+                    logger.debug("%s - Interaction added as alternative", self.name)
 
             # Step 5: add new or reinforce existing composite interactions
             learned_or_reinforced = []
@@ -450,7 +653,7 @@ class ConstructiveAgent(Agent):
                     t2_t1enacted = interaction.CompositeInteraction(penultimate, t1enacted)
                     learned_or_reinforced.append(t2_t1enacted)
             for composite in learned_or_reinforced:
-                if composite not in self.interaction_memory.get_composite_interactions():
+                if not self.interaction_memory.has_interaction(composite):
                     self.interaction_memory.add_interaction(composite)
                 else:
                     self.interaction_memory.increment_weight(composite)
@@ -474,10 +677,26 @@ class ConstructiveAgent(Agent):
 
             # Step 6: update context
             self.update_context(enacted, learned_or_reinforced)
+
+            # Weights are only reinforced here, so they decay per completed
+            # enaction
+            self.interaction_memory.advance_consolidation()
         else: 
             # Not done
             pass
 
+        # Consolidate the interaction memory a little at each step, without
+        # forgetting the interactions that are being enacted or are used to
+        # learn and to activate interactions
+        if settings.CONSOLIDATION_BATCH_SIZE > 0:
+            self.interaction_memory.protect(self.get_active_interactions())
+            self.interaction_memory.consolidate(
+                settings.CONSOLIDATION_BATCH_SIZE,
+                settings.CONSOLIDATION_DECAY,
+                settings.CONSOLIDATION_MIN_WEIGHT,
+                settings.CONSOLIDATION_STABLE_WEIGHT,
+                settings.CONSOLIDATION_MAX_SIZE)
+
 class HomeostaticConstructiveAgent(ConstructiveAgent):
     """
     A homeostatic agent is a constructive agent where valences of interactions
@@ -497,16 +716,33 @@ class HomeostaticConstructiveAgent(ConstructiveAgent):
     def add_to_homeostatic_value(self, homeostatic_property, delta_value):
         self.homeostasis[homeostatic_property] += delta_value
 
+    def get_snapshot_state(self, table):
+        state = super(HomeostaticConstructiveAgent, self).get_snapshot_state(table)
+        state["homeostasis"] = dict(self.homeostasis)
+        return state
+
+    def set_snapshot_state(self, state, table):
+        super(HomeostaticConstructiveAgent, self).set_snapshot_state(state, table)
+        self.homeostasis = dict(state["homeostasis"])
+
     def setup_interaction_memory(self):
-        self.interaction_memory = interactionmemory.HomeostaticInteractionMemory(self)
+        if settings.ARRAY_INTERACTION_MEMORY:
+            self.interaction_memory = interactionmemory.ArrayHomeostaticInteractionMemory(self)
+        else:
+            self.interaction_memory = interactionmemory.HomeostaticInteractionMemory(self)
 
 class HumanAgent(Agent):
     """
     An agent that is controlled by the user.
+
+    The agent reads the user's input with pygame, which is only imported when
+    the agent is used, such that the model can be loaded without pygame.
     """
     color = (146, 124, 3, 255)
 
     def prepare_interaction(self):
+        import pygame
+
         chosen = None
         self.color_old = self.color # Temporarily change color to indicate this agent has to be controlled
         self.color = (255,255,0,255)
@@ -534,7 +770,7 @@ class HumanAgent(Agent):
             chosen, 
             -1))
 
-        print "%s - > %s" % (self.name, chosen)
+        logger.debug("%s - > %s", self.name, chosen)
         return chosen
 
     def enacted_interaction(self, interaction, data):
@@ -545,12 +781,14 @@ class HumanAgent(Agent):
             -1))
         self.interaction_memory.add_interaction_to_history(interaction)
 
-        print "%s - Enacted: %s" % (self.name, interaction)
+        logger.debug("%s - Enacted: %s", self.name, interaction)
 
     def get_interaction_from_input(self):
         """
         Get the interaction the agent should enact from user input
         """
+        import pygame
+
         for event in pygame.event.get():
             if event.type == pygame.QUIT: 
                 quitEvent = events.QuitEvent()
@@ -571,6 +809,8 @@ class HumanAgent(Agent):
         Method to choose interaction from a list of all interactions known by 
         this agent.
         """
+        import pygame
+
         interactions = self.interaction_memory.get_primitive_interactions()
 
         print "Choose an interaction from the following list:"
@@ -650,6 +890,12 @@ class ProgrammableAgent(Agent):
                 percept = None
 
             interaction_ = self.program.get_interaction(percept)
+
+            # Post interaction preparation event
+            AppState.state.get_event_manager().post_event(events.AgentPreparationEvent(
+                self,
+                interaction_,
+                -1))
             return interaction_
 
     def enacted_interaction(self, interaction, data):
@@ -660,7 +906,7 @@ class ProgrammableAgent(Agent):
             -1))
         self.interaction_memory.add_interaction_to_history(interaction)
 
-        print "%s - Enacted: %s" % (self.name, interaction)
+        logger.debug("%s - Enacted: %s", self.name, interaction)
 
     def set_program(self, program):
         """
@@ -24,6 +24,22 @@ class BoredomHandler(object):
         """
         raise NotImplementedError("Should be implemented by child")
 
+    def process_boredom_batch(self, interaction_memory, interactions, unmodified_valences):
+        """
+        Modifies the valences of a batch of interactions such that boredom is
+        handled. Handlers can override this to compute the state shared by
+        all interactions (e.g., the interaction history) only once.
+
+        :param interaction_memory: The interaction memory
+        :param interactions: The list of interactions to process boredom for
+        :param unmodified_valences: The list of unmodified (raw) valences of
+                                    the interactions
+        :return: The list of modified valences taking boredom into account
+        """
+        return [
+            self.process_boredom(interaction_memory, interaction, unmodified_valence)
+            for (interaction, unmodified_valence) in zip(interactions, unmodified_valences)]
+
 
 class PassthroughBoredomHandler(BoredomHandler):
     """
@@ -32,6 +48,9 @@ class PassthroughBoredomHandler(BoredomHandler):
     def process_boredom(self, interaction_memory, interaction, unmodified_valence):
         return unmodified_valence
 
+    def process_boredom_batch(self, interaction_memory, interactions, unmodified_valences):
+        return list(unmodified_valences)
+
 class WeightBoredomHandler(BoredomHandler):
     """
     A boredom handler taking into account the weight of interactions. The sum
@@ -69,6 +88,17 @@ class WeightBoredomHandler(BoredomHandler):
         else:
             return unmodified_valence
 
+    def process_boredom_batch(self, interaction_memory, interactions, unmodified_valences):
+        sum = float(interaction_memory.get_total_weight())
+        valences = []
+        for (interaction, unmodified_valence) in zip(interactions, unmodified_valences):
+            if unmodified_valence > 0:
+                weight = self.interaction_total_weight(interaction_memory, interaction)
+                valences.append(unmodified_valence * (1 - float(weight)/sum))
+            else:
+                valences.append(unmodified_valence)
+        return valences
+
 class RepetitiveBoredomHandler(BoredomHandler):
     """
     A boredom handler taking into the account the last few (primitive)
@@ -131,6 +161,15 @@ class RepetitiveBoredomHandler(BoredomHandler):
 
         return unmodified_valence * modifier
 
+    def process_boredom_batch(self, interaction_memory, interactions, unmodified_valences):
+        # The history is the same for all interactions; count it once
+        history = interaction_memory.get_interaction_history()[-self.HISTORY_CONSIDER_SIZE:]
+        history_count = self.count_interactions(history)
+
+        return [
+            unmodified_valence * (1 - self.similarity(history_count, self.count_interactions(interaction.unwrap())))
+            for (interaction, unmodified_valence) in zip(interactions, unmodified_valences)]
+
 class WeightRepetitiveBoredomHandler(BoredomHandler):
     """
     A boredom handler combining the weight boredom handler and repetitive
@@ -147,3 +186,10 @@ class WeightRepetitiveBoredomHandler(BoredomHandler):
             +
             self.repetitiveBoredomHandler.process_boredom(interaction_memory, interaction, unmodified_valence)
             ) / 2
+
+    def process_boredom_batch(self, interaction_memory, interactions, unmodified_valences):
+        return [
+            (weight_valence + repetitive_valence) / 2
+            for (weight_valence, repetitive_valence) in zip(
+                self.weightBoredomHandler.process_boredom_batch(interaction_memory, interactions, unmodified_valences),
+                self.repetitiveBoredomHandler.process_boredom_batch(interaction_memory, interactions, unmodified_valences))]
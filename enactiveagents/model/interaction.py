@@ -153,7 +153,7 @@ class CompositeInteraction(Interaction):
         self.pre = pre
         self.post = post
 
-        self.hash = hash((hash(self.pre), hash(self.post)))
+        self.hash = hash((pre.hash, post.hash))
 
     def get_pre(self):
         return self.pre
@@ -178,8 +178,11 @@ class CompositeInteraction(Interaction):
             return pre
 
     def __eq__(self, other):
-        if isinstance(other, CompositeInteraction):
-            return self.pre == other.pre and self.post == other.post
+        if self is other:
+            return True
+        elif isinstance(other, CompositeInteraction):
+            # Compare the (cached) hashes first to avoid walking deep trees
+            return self.hash == other.hash and self.pre == other.pre and self.post == other.post
         else:
             return False
 
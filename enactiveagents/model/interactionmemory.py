@@ -2,8 +2,13 @@
 Module that holds classes that represent an agent's memory of interactions.
 """
 
+import array
+import collections
+import copy
+import heapq
 import interaction
 import model.boredomhandler
+from utilities.metrics import Metrics
 
 class InteractionMemory(object):
     """
@@ -12,16 +17,34 @@ class InteractionMemory(object):
 
     INTERACTION_ENACTION_HISTORY_SIZE = 50
 
+    #: The number of modifications of the memory (see get_modification_count)
+    modification_count = 0
+
     def __init__(self, boredom_handler = model.boredomhandler.RepetitiveBoredomHandler):
         self.primitive_interactions = []
         self.composite_interactions = []
         self.valences = {}
         self.weights = {}
+        # Alternatives of interactions, and the interactions alternatives
+        # were registered to, as insertion-ordered sets (the values are None)
         self.alternative_interactions = {}
+        self.alternative_of = {}
         self.weight_sum = 0
         self.boredom_handler = boredom_handler()
         self.interaction_enaction_history = []
 
+        # State of the (incremental) consolidation of the memory
+        self.consolidation_step = 0
+        self.consolidation_marking = True
+        self.consolidation_position = 0
+        self.consolidation_decay_step = 0
+        self.consolidation_decay = 1
+        self.consolidation_protected = set()
+        self.consolidation_active = set()
+        self.consolidation_weights = array.array("d")
+        self.consolidation_excess = 0
+        self.consolidation_threshold = 0
+
     def add_interaction(self, interaction_, weight=1, valence=0):
         """
         Add an interaction to the interaction memory.
@@ -36,11 +59,13 @@ class InteractionMemory(object):
             self.valences[interaction_] = valence
         elif isinstance(interaction_, interaction.CompositeInteraction):
             self.composite_interactions.append(interaction_)
+            Metrics.get_metrics().count("InteractionMemory.composites_learned")
         else:
             raise TypeError("Expected interaction_ to be either primitive, primitive perception, or composite.")
 
         self.weights[interaction_] = weight
         self.weight_sum += weight
+        self.modification_count += 1
 
     def add_alternative_interaction(self, interaction_, alternative_interaction):
         """
@@ -51,14 +76,18 @@ class InteractionMemory(object):
         :return: True if the alternative was added, false if it was already registered to the interaction
         """
 
-        # Create alternative interaction list for this interaction if it does not yet exist
+        # Create alternative interaction set for this interaction if it does not yet exist
         if interaction_ not in self.alternative_interactions:
-            self.alternative_interactions[interaction_] = []
+            self.alternative_interactions[interaction_] = collections.OrderedDict()
 
-        # Add the alternative interaction to the list of alternatives for this interaction
-        # if it is not yet in the list of alternatives for this interaction
+        # Add the alternative interaction to the set of alternatives for this interaction
+        # if it is not yet in the set of alternatives for this interaction
         if alternative_interaction not in self.alternative_interactions[interaction_]:
-            self.alternative_interactions[interaction_].append(alternative_interaction)
+            self.alternative_interactions[interaction_][alternative_interaction] = None
+
+            if alternative_interaction not in self.alternative_of:
+                self.alternative_of[alternative_interaction] = collections.OrderedDict()
+            self.alternative_of[alternative_interaction][interaction_] = None
             return True
         else:
             return False
@@ -95,7 +124,29 @@ class InteractionMemory(object):
         if interaction_ not in self.alternative_interactions:
             return []
         else:
-            return self.alternative_interactions[interaction_]
+            return self.alternative_interactions[interaction_].keys()
+
+    def get_interactions_with_alternative(self, alternative_interaction):
+        """
+        Get the interactions an interaction is registered to as an
+        alternative.
+
+        :param alternative_interaction: The alternative interaction.
+        :return: A list of interactions the alternative is registered to.
+        """
+        if alternative_interaction not in self.alternative_of:
+            return []
+        else:
+            return self.alternative_of[alternative_interaction].keys()
+
+    def get_alternative_interaction_items(self):
+        """
+        Get all interactions that have alternatives, with their alternatives.
+
+        :return: A list of (interaction, list of alternative interactions)
+                 tuples.
+        """
+        return [(interaction_, alternatives.keys()) for (interaction_, alternatives) in self.alternative_interactions.iteritems()]
 
     def increment_weight(self, interaction):
         """
@@ -115,6 +166,7 @@ class InteractionMemory(object):
         """
         self.weight_sum = self.weight_sum - self.weights[interaction] + weight
         self.weights[interaction] = weight
+        self.modification_count += 1
 
     def get_weight(self, interaction):
         """
@@ -127,6 +179,17 @@ class InteractionMemory(object):
         else:
             return 0
 
+    def get_modification_count(self):
+        """
+        Get the number of modifications of the memory: interactions added or
+        forgotten, and valences or weights set. Incrementing weights (i.e.,
+        reinforcing interactions) is not counted. Caches derived from the
+        memory are stale when the count has changed.
+
+        :return: The number of modifications
+        """
+        return self.modification_count
+
     def get_total_weight(self):
         """
         Get the sum of weights of all known interactions.
@@ -144,6 +207,7 @@ class InteractionMemory(object):
         """
         if isinstance(interaction_, interaction.PrimitiveInteraction):
             self.valences[interaction_] = valence
+            self.modification_count += 1
         else:
             raise TypeError("Expected interaction to be primitive.")
 
@@ -179,12 +243,311 @@ class InteractionMemory(object):
         """
         return self.get_weight(interaction) * self.get_valence(interaction)
 
+    def get_primitive_valence(self, interaction_):
+        """
+        Get the valence of a primitive interaction.
+
+        :param interaction_: The primitive interaction to get the valence of.
+        """
+        return self.valences[interaction_]
+
+    def get_valences(self, interactions, process_boredom = False):
+        """
+        Get the valences of a batch of interactions, as get_valence does for
+        a single interaction. The valence of each primitive interaction is
+        looked up only once, and boredom is processed for the batch as a
+        whole.
+
+        :param interactions: The list of interactions to get the valences of.
+        :param process_boredom: Whether to process boredom.
+        :return: The list of valences of the interactions.
+        """
+        primitive_valences = {}
+        valences = []
+        for interaction_ in interactions:
+            valence = 0
+            for primitive in interaction_.unwrap():
+                if isinstance(primitive, interaction.PrimitivePerceptionInteraction):
+                    primitive = primitive.get_primitive_interaction()
+                primitive_valence = primitive_valences.get(primitive)
+                if primitive_valence is None:
+                    primitive_valence = primitive_valences[primitive] = self.get_primitive_valence(primitive)
+                valence += primitive_valence
+
+            if not isinstance(interaction_, interaction.CompositeInteraction):
+                # Primitive valences are not summed
+                valence = primitive_valence
+            valences.append(valence)
+
+        if process_boredom:
+            return self.boredom_handler.process_boredom_batch(self, interactions, valences)
+        else:
+            return valences
+
+    def get_proclivities(self, interactions):
+        """
+        Get the proclivities of a batch of interactions, as get_proclivity
+        does for a single interaction.
+
+        :param interactions: The list of interactions to get the proclivities
+                             of.
+        :return: The list of proclivities of the interactions.
+        """
+        return [
+            self.get_weight(interaction_) * valence
+            for (interaction_, valence) in zip(interactions, self.get_valences(interactions))]
+
+    def has_interaction(self, interaction_):
+        """
+        Check whether an interaction is known.
+
+        :param interaction_: The interaction to check.
+        :return: True if the interaction is in the interaction memory.
+        """
+        return interaction_ in self.weights
+
+    def get_activated_interactions(self, context):
+        """
+        Get the known composite interactions whose pre-interaction belongs to
+        a context.
+
+        :param context: A list of interactions.
+        :return: The list of activated composite interactions.
+        """
+        return [composite_interaction for composite_interaction in self.composite_interactions if composite_interaction.get_pre() in context]
+
     def get_primitive_interactions(self):
         return self.primitive_interactions
 
     def get_composite_interactions(self):
         return self.composite_interactions
 
+    def get_composite_count(self):
+        """
+        :return: The number of composite interactions in the memory
+        """
+        return len(self.composite_interactions)
+
+    def get_composite_interactions_between(self, start, end):
+        """
+        Get the composite interactions between two positions in the order
+        they were added to the memory.
+
+        :param start: The start position (inclusive)
+        :param end: The end position (exclusive)
+        :return: The list of composite interactions
+        """
+        return self.composite_interactions[start:end]
+
+    def forget_composite_interactions(self, start, end, forgotten):
+        """
+        Remove composite interactions from the memory, together with their
+        alternatives.
+
+        :param start: The start position of the composite interactions to
+                      remove from (inclusive)
+        :param end: The end position of the composite interactions to remove
+                    from (exclusive)
+        :param forgotten: The set of composite interactions to remove, all
+                          between the start and end positions
+        """
+        self.composite_interactions[start:end] = [
+            composite_interaction
+            for composite_interaction in self.composite_interactions[start:end]
+            if composite_interaction not in forgotten]
+
+        Metrics.get_metrics().count("InteractionMemory.composites_forgotten", len(forgotten))
+        self.modification_count += 1
+        for composite_interaction in forgotten:
+            self.weight_sum -= self.weights.pop(composite_interaction)
+            self.forget_alternatives(composite_interaction)
+
+    def forget_alternatives(self, interaction_):
+        """
+        Remove the alternatives of an interaction, and remove the interaction
+        as an alternative of other interactions.
+
+        :param interaction_: The interaction
+        """
+        for alternative in self.alternative_interactions.pop(interaction_, ()):
+            del self.alternative_of[alternative][interaction_]
+            if len(self.alternative_of[alternative]) == 0:
+                del self.alternative_of[alternative]
+
+        for other_interaction in self.alternative_of.pop(interaction_, ()):
+            del self.alternative_interactions[other_interaction][interaction_]
+            if len(self.alternative_interactions[other_interaction]) == 0:
+                del self.alternative_interactions[other_interaction]
+
+    def freeze(self):
+        """
+        Get a copy of the memory that does not change when the memory changes,
+        e.g., to read it on another thread while the agent continues. Only the
+        containers of the memory are copied, not the interactions, which is
+        much faster than reading the memory. The copy can only be read.
+
+        :return: The frozen copy of the memory
+        """
+        frozen = copy.copy(self)
+        frozen.primitive_interactions = list(self.primitive_interactions)
+        frozen.composite_interactions = list(self.composite_interactions)
+        frozen.valences = dict(self.valences)
+        frozen.weights = dict(self.weights)
+        frozen.alternative_interactions = dict((interaction_, dict(alternatives)) for (interaction_, alternatives) in self.alternative_interactions.iteritems())
+        frozen.alternative_of = {}
+        frozen.interaction_enaction_history = list(self.interaction_enaction_history)
+        frozen.consolidation_protected = set(self.consolidation_protected)
+        frozen.consolidation_active = set(self.consolidation_active)
+        frozen.consolidation_weights = self.consolidation_weights[:]
+        return frozen
+
+    def get_consolidation_state(self):
+        """
+        Get the state of the consolidation of the memory.
+
+        :return: A dictionary with the consolidation state; the protected
+                 interactions are given as a list
+        """
+        return {
+            "step": self.consolidation_step,
+            "marking": self.consolidation_marking,
+            "position": self.consolidation_position,
+            "decay_step": self.consolidation_decay_step,
+            "decay": self.consolidation_decay,
+            "protected": list(self.consolidation_protected),
+            "weights": array.array("d", self.consolidation_weights),
+            "excess": self.consolidation_excess,
+            "threshold": self.consolidation_threshold
+        }
+
+    def set_consolidation_state(self, state):
+        """
+        Restore the state of the consolidation of the memory.
+
+        :param state: The state as returned by get_consolidation_state
+        """
+        self.consolidation_step = state["step"]
+        self.consolidation_marking = state["marking"]
+        self.consolidation_position = state["position"]
+        self.consolidation_decay_step = state["decay_step"]
+        self.consolidation_decay = state["decay"]
+        self.consolidation_protected = set(state["protected"])
+        self.consolidation_weights = state["weights"]
+        self.consolidation_excess = state["excess"]
+        self.consolidation_threshold = state["threshold"]
+
+    def protect_parts(self, composite_interaction):
+        """
+        Protect the (composite) interactions a composite interaction consists
+        of from being forgotten in the current consolidation pass.
+
+        :param composite_interaction: The composite interaction
+        """
+        parts = [composite_interaction.get_pre(), composite_interaction.get_post()]
+        while len(parts) > 0:
+            part = parts.pop()
+            if isinstance(part, interaction.CompositeInteraction) and part not in self.consolidation_protected:
+                self.consolidation_protected.add(part)
+                parts.append(part.get_pre())
+                parts.append(part.get_post())
+
+    def protect(self, interactions):
+        """
+        Protect the interactions the agent is currently using (e.g., its
+        intended interaction and context) from being forgotten, until protect
+        is called again.
+
+        :param interactions: The interactions
+        """
+        self.consolidation_active = set(interactions)
+
+    def advance_consolidation(self):
+        """
+        Advance the clock of the consolidation by one step. Weights are only
+        reinforced when an enaction completes, so the agent advances the
+        clock on completed enactions: weights decay per completed enaction,
+        not per tick.
+        """
+        self.consolidation_step += 1
+
+    def consolidate(self, batch_size, decay = 1.0, min_weight = 1, stable_weight = 3, max_size = 0):
+        """
+        Run a step of the consolidation of the memory. Consolidation
+        alternates between two passes over the composite interactions, run a
+        batch at a time:
+
+        1. The composite interactions that stabilized interactions consist of
+           are protected, as are the interactions the agent is using (see
+           protect).
+        2. The weights of composite interactions decay (by the decay factor
+           for each consolidation step since the previous pass, see
+           advance_consolidation), and unprotected composite interactions
+           with a weight below the minimum weight (or with the lowest
+           weights, if there are more composite interactions than the maximum
+           size) are forgotten. With a maximum size, nothing is forgotten
+           while the memory is not larger than the maximum size.
+
+        :param batch_size: The number of composite interactions to process
+        :param decay: The factor to multiply weights with per consolidation
+                      step
+        :param min_weight: The weight below which composite interactions are
+                           forgotten
+        :param stable_weight: The weight above which composite interactions
+                              are stabilized
+        :param max_size: The maximum number of composite interactions to
+                         keep (0 = unbounded)
+        """
+        count = self.get_composite_count()
+        start = self.consolidation_position
+        end = min(start + batch_size, count)
+        composite_interactions = self.get_composite_interactions_between(start, end)
+
+        if self.consolidation_marking:
+            for composite_interaction in composite_interactions:
+                weight = self.get_weight(composite_interaction)
+                self.consolidation_weights.append(weight)
+                if weight > stable_weight:
+                    self.protect_parts(composite_interaction)
+            self.consolidation_position = end
+
+            if end >= count:
+                # Determine the weight up to which composite interactions are
+                # forgotten to keep the memory at its maximum size
+                self.consolidation_excess = count - max_size if max_size > 0 else 0
+                if self.consolidation_excess > 0:
+                    self.consolidation_threshold = heapq.nsmallest(self.consolidation_excess, self.consolidation_weights)[-1]
+                self.consolidation_weights = array.array("d")
+
+                self.consolidation_decay = decay ** (self.consolidation_step - self.consolidation_decay_step)
+                self.consolidation_decay_step = self.consolidation_step
+                self.consolidation_marking = False
+                self.consolidation_position = 0
+        else:
+            forgotten = set()
+            for composite_interaction in composite_interactions:
+                weight = self.get_weight(composite_interaction)
+                if (
+                    (max_size <= 0 or count - len(forgotten) > max_size)
+                    and
+                    composite_interaction not in self.consolidation_protected
+                    and
+                    composite_interaction not in self.consolidation_active
+                    and
+                    (weight < min_weight or (self.consolidation_excess > 0 and weight <= self.consolidation_threshold))):
+                    forgotten.add(composite_interaction)
+                    self.consolidation_excess -= 1
+                elif self.consolidation_decay != 1:
+                    self.set_weight(composite_interaction, weight * self.consolidation_decay)
+
+            if len(forgotten) > 0:
+                self.forget_composite_interactions(start, end, forgotten)
+            self.consolidation_position = end - len(forgotten)
+
+            if end >= count:
+                self.consolidation_protected = set()
+                self.consolidation_marking = True
+                self.consolidation_position = 0
+
     def get_all_interactions(self):
         return self.primitive_interactions + self.composite_interactions
 
@@ -232,3 +595,420 @@ class HomeostaticInteractionMemory(InteractionMemory):
             return self.boredom_handler.process_boredom(self, interaction_, valence)
         else:
             return valence
+
+    def get_primitive_valence(self, interaction_):
+        return self.valences[interaction_](self.agent)
+
+    def get_valences(self, interactions, process_boredom = False):
+        # As in get_valence, boredom is not processed for homeostatic valences
+        return super(HomeostaticInteractionMemory, self).get_valences(interactions)
+
+class ArrayInteractionMemory(InteractionMemory):
+    """
+    Class to represent the interaction memory of an agent, where each
+    interaction is identified by a dense integer id.
+
+    The pre and post interaction ids, weights and ranks (the order in which
+    interactions were added) of interactions are stored in array columns,
+    instead of in dictionaries keyed on interaction objects. Composite
+    interaction objects are only created when they are needed, and a limited
+    number of them is cached. This uses several times less memory per
+    composite interaction, and allows bulk operations on the columns (e.g.,
+    with NumPy).
+
+    The primitive interactions and their valences are kept as in the
+    InteractionMemory.
+    """
+
+    #: Maximum number of composite interaction objects (and their ids) to cache
+    CACHE_SIZE = 50000
+
+    def __init__(self, boredom_handler = model.boredomhandler.RepetitiveBoredomHandler):
+        # Not using super: subclasses mixing in other interaction memories
+        # have a different constructor signature
+        InteractionMemory.__init__(self, boredom_handler)
+
+        #: The id of the first interaction in the columns
+        self.id_offset = 0
+        #: The rank to give the next interaction that is added
+        self.next_rank = 0
+
+        self.pres = array.array("i")
+        self.posts = array.array("i")
+        self.id_weights = array.array("d")
+        self.ranks = array.array("i")
+
+        # The ids of the composite interactions, in the order they were added
+        self.order = array.array("i")
+        # Composite interaction ids by (pre id, post id) key
+        self.composite_ids = {}
+        # Ids of the composite interactions by pre interaction id
+        self.activations = {}
+        # Ids of the alternatives of interactions by interaction id, ids of
+        # the interactions alternatives were registered to by alternative id,
+        # and the (interaction id, alternative id) keys of all alternatives
+        self.alternative_ids = {}
+        self.alternative_of_ids = {}
+        self.alternative_keys = set()
+
+        self.primitive_ids = {}
+        self.primitives = {}
+        self.cache = {}
+        self.cache_ids = {}
+
+    @staticmethod
+    def composite_key(pre_id, post_id):
+        """
+        :return: The key of a composite interaction in composite_ids
+        """
+        return (pre_id << 32) | post_id
+
+    def get_size(self):
+        """
+        :return: The number of interaction ids
+        """
+        return self.id_offset + len(self.pres)
+
+    def new_id(self, pre_id, post_id):
+        """
+        Create a new interaction id.
+
+        :param pre_id: The id of the pre interaction (-1 for primitives)
+        :param post_id: The id of the post interaction (-1 for primitives)
+        :return: The new id
+        """
+        interaction_id = self.get_size()
+        self.pres.append(pre_id)
+        self.posts.append(post_id)
+        self.id_weights.append(0)
+        self.ranks.append(-1)
+        return interaction_id
+
+    def find_composite(self, pre_id, post_id):
+        """
+        Find the id of a composite interaction.
+
+        :param pre_id: The id of the pre interaction
+        :param post_id: The id of the post interaction
+        :return: The id of the composite interaction, or None
+        """
+        return self.composite_ids.get(self.composite_key(pre_id, post_id))
+
+    def get_pre_post_ids(self, interaction_id):
+        """
+        :return: The pre and post interaction ids of a composite interaction
+        """
+        index = interaction_id - self.id_offset
+        return (self.pres[index], self.posts[index])
+
+    def get_rank(self, interaction_id):
+        """
+        :return: The rank of an interaction, or -1 if the interaction is not
+                 in the memory (but only referred to)
+        """
+        return self.ranks[interaction_id - self.id_offset]
+
+    def get_id_weight(self, interaction_id):
+        return self.id_weights[interaction_id - self.id_offset]
+
+    def set_id_weight(self, interaction_id, weight):
+        self.id_weights[interaction_id - self.id_offset] = weight
+
+    def get_activated_ids(self, pre_id):
+        """
+        :return: The ids of the composite interactions in the memory with a
+                 pre interaction
+        """
+        return self.activations.get(pre_id, ())
+
+    def get_composite_order(self):
+        """
+        :return: The ids of the composite interactions in the memory, in the
+                 order they were added
+        """
+        return self.order
+
+    def unstore(self, interaction_id):
+        """
+        Remove a composite interaction id from the memory. The id remains, as
+        the interaction may still be referred to.
+
+        :param interaction_id: The id of the interaction
+        """
+        self.ranks[interaction_id - self.id_offset] = -1
+
+        (pre_id, post_id) = self.get_pre_post_ids(interaction_id)
+        activated_ids = self.activations[pre_id]
+        activated_ids.remove(interaction_id)
+        if len(activated_ids) == 0:
+            del self.activations[pre_id]
+
+    def store(self, interaction_id):
+        """
+        Add an interaction id to the memory.
+
+        :param interaction_id: The id of the interaction
+        """
+        self.ranks[interaction_id - self.id_offset] = self.next_rank
+        self.next_rank += 1
+
+        (pre_id, post_id) = self.get_pre_post_ids(interaction_id)
+        if pre_id >= 0:
+            self.order.append(interaction_id)
+            if pre_id not in self.activations:
+                self.activations[pre_id] = array.array("i")
+            self.activations[pre_id].append(interaction_id)
+
+    def get_id(self, interaction_, create = False):
+        """
+        Get the id of an interaction.
+
+        :param interaction_: The interaction
+        :param create: Whether to create an id if the interaction has none
+        :return: The id of the interaction, or None
+        """
+        if isinstance(interaction_, interaction.CompositeInteraction):
+            interaction_id = self.cache_ids.get(interaction_)
+            if interaction_id is not None:
+                return interaction_id
+
+            pre_id = self.get_id(interaction_.get_pre(), create)
+            if pre_id is None:
+                return None
+            post_id = self.get_id(interaction_.get_post(), create)
+            if post_id is None:
+                return None
+
+            interaction_id = self.find_composite(pre_id, post_id)
+            if interaction_id is None:
+                if not create:
+                    return None
+                interaction_id = self.new_id(pre_id, post_id)
+                self.composite_ids[self.composite_key(pre_id, post_id)] = interaction_id
+            self.cache_interaction(interaction_id, interaction_)
+            return interaction_id
+        else:
+            interaction_id = self.primitive_ids.get(interaction_)
+            if interaction_id is None and create:
+                interaction_id = self.new_id(-1, -1)
+                self.primitive_ids[interaction_] = interaction_id
+                self.primitives[interaction_id] = interaction_
+            return interaction_id
+
+    def get_interaction(self, interaction_id):
+        """
+        Get the interaction with an id, creating the interaction object if
+        needed.
+
+        :param interaction_id: The id of the interaction
+        :return: The interaction
+        """
+        if interaction_id < 0:
+            return None
+
+        interaction_ = self.primitives.get(interaction_id)
+        if interaction_ is None:
+            interaction_ = self.cache.get(interaction_id)
+        if interaction_ is None:
+            (pre_id, post_id) = self.get_pre_post_ids(interaction_id)
+            interaction_ = interaction.CompositeInteraction(self.get_interaction(pre_id), self.get_interaction(post_id))
+            self.cache_interaction(interaction_id, interaction_)
+        return interaction_
+
+    def cache_interaction(self, interaction_id, interaction_):
+        """
+        Cache a composite interaction object and its id.
+
+        :param interaction_id: The id of the interaction
+        :param interaction_: The interaction
+        """
+        if len(self.cache) >= self.CACHE_SIZE:
+            self.cache.clear()
+            self.cache_ids.clear()
+        self.cache[interaction_id] = interaction_
+        self.cache_ids[interaction_] = interaction_id
+
+    def get_stored_id(self, interaction_):
+        """
+        Get the id of an interaction in the memory.
+
+        :param interaction_: The interaction
+        :return: The id of the interaction, or None if it is not in the memory
+        """
+        interaction_id = self.get_id(interaction_)
+        if interaction_id is None or self.get_rank(interaction_id) < 0:
+            return None
+        return interaction_id
+
+    def add_interaction(self, interaction_, weight=1, valence=0):
+        if isinstance(interaction_, interaction.PrimitiveInteraction) or isinstance(interaction_, interaction.PrimitivePerceptionInteraction):
+            self.primitive_interactions.append(interaction_)
+            self.valences[interaction_] = valence
+        elif not isinstance(interaction_, interaction.CompositeInteraction):
+            raise TypeError("Expected interaction_ to be either primitive, primitive perception, or composite.")
+
+        interaction_id = self.get_id(interaction_, True)
+        if self.get_rank(interaction_id) < 0:
+            self.store(interaction_id)
+            if isinstance(interaction_, interaction.CompositeInteraction):
+                Metrics.get_metrics().count("InteractionMemory.composites_learned")
+        self.set_id_weight(interaction_id, weight)
+        self.weight_sum += weight
+        self.modification_count += 1
+
+    def add_alternative_id(self, interaction_id, alternative_id):
+        """
+        Add an alternative to an interaction by id.
+
+        :param interaction_id: The id of the interaction
+        :param alternative_id: The id of the alternative interaction
+        :return: True if the alternative was added, false if it was already
+                 registered to the interaction
+        """
+        key = self.composite_key(interaction_id, alternative_id)
+        if key in self.alternative_keys:
+            return False
+        self.alternative_keys.add(key)
+
+        if interaction_id not in self.alternative_ids:
+            self.alternative_ids[interaction_id] = array.array("i")
+        self.alternative_ids[interaction_id].append(alternative_id)
+
+        if alternative_id not in self.alternative_of_ids:
+            self.alternative_of_ids[alternative_id] = array.array("i")
+        self.alternative_of_ids[alternative_id].append(interaction_id)
+        return True
+
+    def forget_alternative_ids(self, interaction_id):
+        """
+        Remove the alternatives of an interaction by id, and remove the
+        interaction as an alternative of other interactions.
+
+        :param interaction_id: The id of the interaction
+        """
+        for alternative_id in self.alternative_ids.pop(interaction_id, ()):
+            self.alternative_keys.discard(self.composite_key(interaction_id, alternative_id))
+            self.alternative_of_ids[alternative_id].remove(interaction_id)
+            if len(self.alternative_of_ids[alternative_id]) == 0:
+                del self.alternative_of_ids[alternative_id]
+
+        for other_id in self.alternative_of_ids.pop(interaction_id, ()):
+            self.alternative_keys.discard(self.composite_key(other_id, interaction_id))
+            self.alternative_ids[other_id].remove(interaction_id)
+            if len(self.alternative_ids[other_id]) == 0:
+                del self.alternative_ids[other_id]
+
+    def add_alternative_interaction(self, interaction_, alternative_interaction):
+        return self.add_alternative_id(self.get_id(interaction_, True), self.get_id(alternative_interaction, True))
+
+    def get_alternative_interactions(self, interaction_):
+        interaction_id = self.get_id(interaction_)
+        if interaction_id not in self.alternative_ids:
+            return []
+        else:
+            return [self.get_interaction(alternative_id) for alternative_id in self.alternative_ids[interaction_id]]
+
+    def get_interactions_with_alternative(self, alternative_interaction):
+        alternative_id = self.get_id(alternative_interaction)
+        if alternative_id not in self.alternative_of_ids:
+            return []
+        else:
+            return [self.get_interaction(interaction_id) for interaction_id in self.alternative_of_ids[alternative_id]]
+
+    def get_alternative_interaction_items(self):
+        return [
+            (self.get_interaction(interaction_id), [self.get_interaction(alternative_id) for alternative_id in alternative_ids])
+            for interaction_id, alternative_ids in self.alternative_ids.iteritems()]
+
+    def has_interaction(self, interaction_):
+        return self.get_stored_id(interaction_) is not None
+
+    def get_activated_interactions(self, context):
+        activated_ids = set()
+        for interaction_ in context:
+            pre_id = self.get_id(interaction_)
+            if pre_id is not None:
+                activated_ids.update(self.get_activated_ids(pre_id))
+
+        return [self.get_interaction(interaction_id) for interaction_id in sorted(activated_ids, key = self.get_rank)]
+
+    def increment_weight(self, interaction):
+        interaction_id = self.get_stored_id(interaction)
+        self.set_id_weight(interaction_id, self.get_id_weight(interaction_id) + 1)
+        self.weight_sum += 1
+
+    def set_weight(self, interaction, weight):
+        interaction_id = self.get_stored_id(interaction)
+        self.weight_sum = self.weight_sum - self.get_id_weight(interaction_id) + weight
+        self.set_id_weight(interaction_id, weight)
+        self.modification_count += 1
+
+    def get_weight(self, interaction):
+        interaction_id = self.get_stored_id(interaction)
+        if interaction_id is None:
+            return 0
+        return self.get_id_weight(interaction_id)
+
+    def get_composite_interactions(self):
+        """
+        Get all composite interactions. Note: this creates all composite
+        interaction objects.
+
+        :return: The list of composite interactions
+        """
+        return [self.get_interaction(interaction_id) for interaction_id in self.get_composite_order()]
+
+    def get_all_interactions(self):
+        return self.primitive_interactions + self.get_composite_interactions()
+
+    def get_composite_count(self):
+        return len(self.order)
+
+    def get_composite_interactions_between(self, start, end):
+        return [self.get_interaction(interaction_id) for interaction_id in self.order[start:end]]
+
+    def forget_composite_interactions(self, start, end, forgotten):
+        forgotten_ids = set(self.get_stored_id(composite_interaction) for composite_interaction in forgotten)
+        self.order[start:end] = array.array("i", [
+            interaction_id
+            for interaction_id in self.order[start:end]
+            if interaction_id not in forgotten_ids])
+
+        Metrics.get_metrics().count("InteractionMemory.composites_forgotten", len(forgotten_ids))
+        self.modification_count += 1
+        for interaction_id in forgotten_ids:
+            self.weight_sum -= self.get_id_weight(interaction_id)
+            self.set_id_weight(interaction_id, 0)
+            self.unstore(interaction_id)
+            self.forget_alternative_ids(interaction_id)
+
+    def forget_alternatives(self, interaction_):
+        interaction_id = self.get_id(interaction_)
+        if interaction_id is not None:
+            self.forget_alternative_ids(interaction_id)
+
+    def freeze(self):
+        frozen = InteractionMemory.freeze(self)
+        frozen.pres = self.pres[:]
+        frozen.posts = self.posts[:]
+        frozen.id_weights = self.id_weights[:]
+        frozen.ranks = self.ranks[:]
+        frozen.order = self.order[:]
+        frozen.composite_ids = dict(self.composite_ids)
+        frozen.activations = {}
+        frozen.alternative_ids = dict((interaction_id, alternative_ids[:]) for (interaction_id, alternative_ids) in self.alternative_ids.iteritems())
+        frozen.alternative_of_ids = {}
+        frozen.alternative_keys = set()
+        frozen.primitive_ids = dict(self.primitive_ids)
+        frozen.primitives = dict(self.primitives)
+        frozen.cache = {}
+        frozen.cache_ids = {}
+        return frozen
+
+class ArrayHomeostaticInteractionMemory(ArrayInteractionMemory, HomeostaticInteractionMemory):
+    """
+    An array-backed interaction memory of a homeostatic agent.
+    """
+    def __init__(self, agent, boredom_handler = model.boredomhandler.RepetitiveBoredomHandler):
+        ArrayInteractionMemory.__init__(self, boredom_handler)
+        self.agent = agent
@@ -0,0 +1,256 @@
+"""
+Module that holds an interaction memory backed by a memory-mapped snapshot.
+
+The interaction table of an agent in a (non-compressed) snapshot file is
+memory-mapped instead of read. Primitive interactions, alternatives and the
+enaction history are loaded when the memory is created, but composite
+interactions are only materialized as CompositeInteraction objects when they
+are needed, e.g., when they are activated by the agent's context. Loading is
+near-instant, and resident memory is proportional to the working set of the
+agent.
+
+The file is mapped copy-on-write: weights of stored composites are updated in
+place in the mapping, without writing back to the file. Composites learned
+after loading are kept as in the array-backed interaction memory this memory
+extends.
+
+Requires NumPy.
+"""
+
+import mmap
+import array
+import numpy
+import interaction
+import interactionmemory
+import snapshot
+import model.boredomhandler
+
+class MappedInteractionMemory(interactionmemory.ArrayInteractionMemory):
+    """
+    Class to represent an interaction memory backed by a memory-mapped
+    interaction table. The ids of the interactions in the table are their ids
+    in the table; interactions added after loading get ids after those, and
+    are stored as in the ArrayInteractionMemory.
+    """
+
+    def __init__(self, file_path, index = 0, boredom_handler = model.boredomhandler.RepetitiveBoredomHandler, valences = None):
+        """
+        :param file_path: The path of the snapshot file
+        :param index: The index of the agent in the snapshot whose interaction
+                      table to map
+        :param boredom_handler: The boredom handler class
+        :param valences: Optional, the valences of primitive interactions to
+                         use if they were not stored (e.g., valence functions)
+        """
+        interactionmemory.ArrayInteractionMemory.__init__(self, boredom_handler)
+
+        with open(file_path, "rb") as fp:
+            if fp.read(2) == "\x1f\x8b":
+                raise IOError("Compressed snapshots cannot be memory-mapped")
+            fp.seek(0)
+            manifest = snapshot.Snapshot.read_manifest(fp)
+            data_offset = fp.tell()
+            self.mmap = mmap.mmap(fp.fileno(), 0, access = mmap.ACCESS_COPY)
+
+        self.state = manifest["agents"][index]
+        table = manifest["tables"][index]
+
+        columns = {}
+        for name, (typecode, offset, length) in table["columns"].iteritems():
+            columns[name] = numpy.frombuffer(self.mmap, numpy.dtype(typecode), length, data_offset + offset)
+
+        self.kinds = columns["kinds"]
+        self.table_pres = columns["a"]
+        self.table_posts = columns["b"]
+        self.table_weights = columns["weights"]
+        self.table_size = len(self.kinds)
+        self.id_offset = self.table_size
+
+        # The ranks of the interactions in the table, following their order in
+        # the stored memory (-1 for interactions that are only referred to)
+        order = columns["order"]
+        self.table_ranks = numpy.empty(self.table_size, numpy.int32)
+        self.table_ranks.fill(-1)
+        self.table_ranks[order] = numpy.arange(len(order), dtype = numpy.int32)
+        self.next_rank = len(order)
+        composite_order = order[self.kinds[order] == snapshot.INTERACTION_COMPOSITE]
+        self.order = array.array("i")
+        self.order.fromstring(composite_order.astype(self.order.typecode).tostring())
+
+        # Index of the composites in the table by pre interaction id
+        composite_ids = numpy.flatnonzero(self.kinds == snapshot.INTERACTION_COMPOSITE)
+        composites_by_pre = numpy.argsort(self.table_pres[composite_ids], kind = "mergesort")
+        self.composites_by_pre = composite_ids[composites_by_pre]
+        self.composite_pres = self.table_pres[self.composites_by_pre]
+
+        self.weight_sum = float(self.table_weights[composite_order].sum())
+
+        # Primitive interactions are all created, such that interactions can
+        # be looked up by their pre and post interaction ids
+        names = table["names"]
+        perceptions = table["perceptions"]
+        for interaction_id in numpy.flatnonzero(self.kinds != snapshot.INTERACTION_COMPOSITE).tolist():
+            a = int(self.table_pres[interaction_id])
+            b = int(self.table_posts[interaction_id])
+            if self.kinds[interaction_id] == snapshot.INTERACTION_PRIMITIVE_PERCEPTION:
+                interaction_ = interaction.PrimitivePerceptionInteraction(self.primitives[a], perceptions[b])
+            else:
+                (name, result) = names[a]
+                interaction_ = interaction.PrimitiveInteraction(name, result)
+            self.primitive_ids[interaction_] = interaction_id
+            self.primitives[interaction_id] = interaction_
+
+        if valences is None:
+            valences = {}
+        table_valences = columns["valences"]
+        int_valences = set(table.get("int_valences", ()))
+        for interaction_id in order[self.kinds[order] != snapshot.INTERACTION_COMPOSITE].tolist():
+            interaction_ = self.primitives[interaction_id]
+            valence = table_valences[interaction_id]
+            if valence != valence:
+                valence = valences.get(interaction_, 0)
+            elif interaction_id in int_valences:
+                valence = int(valence)
+            else:
+                valence = float(valence)
+            self.primitive_interactions.append(interaction_)
+            self.valences[interaction_] = valence
+            self.weight_sum += self.table_weights[interaction_id]
+
+        alternatives = columns["alternatives"].tolist()
+        for i in xrange(0, len(alternatives), 2):
+            self.add_alternative_id(alternatives[i], alternatives[i + 1])
+
+        for interaction_id in columns["history"].tolist():
+            self.add_interaction_to_history(self.primitives[interaction_id])
+
+        if table.get("consolidation") is not None:
+            state = dict(table["consolidation"])
+            state["protected"] = [self.get_interaction(interaction_id) for interaction_id in state["protected"]]
+            self.set_consolidation_state(state)
+
+    def get_snapshot_state(self):
+        """
+        Get the state of the agent (other than its interaction memory) stored
+        in the snapshot, to restore onto the agent using this memory.
+
+        :return: The state of the agent
+        """
+        return self.state
+
+    def get_table_composite_ids(self, pre_id):
+        """
+        Get the ids of the composites in the table with a pre interaction.
+
+        :param pre_id: The id of the pre interaction
+        :return: An array of composite ids, in ascending order
+        """
+        start = numpy.searchsorted(self.composite_pres, pre_id, "left")
+        end = numpy.searchsorted(self.composite_pres, pre_id, "right")
+        return self.composites_by_pre[start:end]
+
+    def find_composite(self, pre_id, post_id):
+        if pre_id < self.table_size and post_id < self.table_size:
+            composite_ids = self.get_table_composite_ids(pre_id)
+            matches = composite_ids[self.table_posts[composite_ids] == post_id]
+            if len(matches) > 0:
+                return int(matches[0])
+        return super(MappedInteractionMemory, self).find_composite(pre_id, post_id)
+
+    def get_pre_post_ids(self, interaction_id):
+        if interaction_id < self.table_size:
+            return (int(self.table_pres[interaction_id]), int(self.table_posts[interaction_id]))
+        return super(MappedInteractionMemory, self).get_pre_post_ids(interaction_id)
+
+    def get_rank(self, interaction_id):
+        if interaction_id < self.table_size:
+            return int(self.table_ranks[interaction_id])
+        return super(MappedInteractionMemory, self).get_rank(interaction_id)
+
+    def get_id_weight(self, interaction_id):
+        if interaction_id < self.table_size:
+            return float(self.table_weights[interaction_id])
+        return super(MappedInteractionMemory, self).get_id_weight(interaction_id)
+
+    def set_id_weight(self, interaction_id, weight):
+        if interaction_id < self.table_size:
+            self.table_weights[interaction_id] = weight
+        else:
+            super(MappedInteractionMemory, self).set_id_weight(interaction_id, weight)
+
+    def get_activated_ids(self, pre_id):
+        activated_ids = []
+        if pre_id < self.table_size:
+            composite_ids = self.get_table_composite_ids(pre_id)
+            activated_ids = composite_ids[self.table_ranks[composite_ids] >= 0].tolist()
+        activated_ids.extend(super(MappedInteractionMemory, self).get_activated_ids(pre_id))
+        return activated_ids
+
+    def unstore(self, interaction_id):
+        if interaction_id < self.table_size:
+            # The interaction remains in the index of the table
+            self.table_ranks[interaction_id] = -1
+        else:
+            super(MappedInteractionMemory, self).unstore(interaction_id)
+
+    def store(self, interaction_id):
+        if interaction_id < self.table_size:
+            # An interaction in the table that was only referred to; it is
+            # already in the index of the table
+            self.table_ranks[interaction_id] = self.next_rank
+            self.next_rank += 1
+            if self.kinds[interaction_id] == snapshot.INTERACTION_COMPOSITE:
+                self.order.append(interaction_id)
+        else:
+            super(MappedInteractionMemory, self).store(interaction_id)
+
+    def freeze(self):
+        frozen = super(MappedInteractionMemory, self).freeze()
+        # The other columns of the table do not change
+        frozen.table_weights = self.table_weights.copy()
+        frozen.table_ranks = self.table_ranks.copy()
+        return frozen
+
+class MappedHomeostaticInteractionMemory(MappedInteractionMemory, interactionmemory.HomeostaticInteractionMemory):
+    """
+    A memory-mapped interaction memory of a homeostatic agent.
+    """
+
+    def __init__(self, agent, file_path, index = 0, boredom_handler = model.boredomhandler.RepetitiveBoredomHandler, valences = None):
+        MappedInteractionMemory.__init__(self, file_path, index, boredom_handler, valences)
+        self.agent = agent
+
+def map_agent_memory(agent_, file_path, index = 0):
+    """
+    Restore an agent from a snapshot file, memory-mapping its interaction
+    memory. The valences that were not stored (e.g., valence functions) and
+    the boredom handler of the agent's current memory are kept.
+
+    :param agent_: The agent to restore onto
+    :param file_path: The path of the snapshot file
+    :param index: The index of the agent in the snapshot
+    """
+    old_memory = agent_.get_interaction_memory()
+    if isinstance(old_memory, interactionmemory.HomeostaticInteractionMemory):
+        memory = MappedHomeostaticInteractionMemory(agent_, file_path, index, valences = old_memory.valences)
+    else:
+        memory = MappedInteractionMemory(file_path, index, valences = old_memory.valences)
+    memory.boredom_handler = old_memory.boredom_handler
+
+    agent_.set_interaction_memory(memory)
+    agent_.set_snapshot_state(memory.get_snapshot_state(), memory)
+
+def load_agent(file_path, index = 0):
+    """
+    Load an agent from a snapshot file, memory-mapping its interaction memory.
+
+    :param file_path: The path of the snapshot file
+    :param index: The index of the agent in the snapshot
+    :return: The loaded agent
+    """
+    with snapshot.Snapshot.open(file_path) as fp:
+        manifest = snapshot.Snapshot.read_manifest(fp)
+
+    agent_ = snapshot.load_class(manifest["agents"][index]["class"])()
+    map_agent_memory(agent_, file_path, index)
+    return agent_
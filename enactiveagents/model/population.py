@@ -0,0 +1,358 @@
+"""
+Module that holds a population engine: a swarm of homogeneous simple agents
+(see model.agent.SimpleAgent) stepped together.
+
+Instead of an agent object with its own interaction memory per agent, the
+state of the whole swarm is held in arrays: the positions, rotations and
+contexts (last enacted primitive interactions) of the agents, and the
+weights of their composite interactions as an agents x pre x post table of
+primitive interaction ids. Decisions, enaction and learning are computed for
+all agents at once with NumPy.
+
+The agents share their primitive interactions and (constant) motivations,
+and live on a grid of static obstacles. The primitive interactions are
+enacted following the rules of experiment.elements.Elements:
+
+- Step: move forward, unless there is an obstacle in front (Step, Fail);
+- Turn Left and Turn Right: rotate 90 degrees;
+- Feel: succeed if there is an obstacle in front;
+- Cuddle: succeed if another agent is at the same position.
+
+Other interactions always succeed. Unlike in a world, all agents enact
+their interaction at the same time: cuddling is checked against the
+positions of the agents at the start of the step. Cells outside the grid
+are obstacles.
+
+Requires NumPy.
+"""
+
+import numpy
+import events
+import interaction
+import interactionmemory
+
+#: The change in position of a step for each rotation (in quarter turns)
+MOVE_DELTAS = numpy.array([(1, 0), (0, -1), (-1, 0), (0, 1)])
+
+class Population(events.EventListener):
+    """
+    Class to represent a population of simple agents sharing their primitive
+    interactions and motivations.
+    """
+
+    def __init__(self, obstacles, primitives, motivation, seed = None):
+        """
+        :param obstacles: A 2D boolean array (rows by columns) marking the
+                          cells with obstacles
+        :param primitives: The list of primitive interactions of the agents
+        :param motivation: A dictionary mapping primitive interactions to
+                           their (numeric) valences
+        :param seed: Optional, the seed of the random number generator used
+                     to explore
+        """
+        self.obstacles = numpy.asarray(obstacles, dtype = bool)
+        self.primitives = list(primitives)
+        self.primitive_ids = dict((primitive, primitive_id) for (primitive_id, primitive) in enumerate(self.primitives))
+        self.valences = numpy.array([motivation.get(primitive, 0) for primitive in self.primitives], dtype = float)
+        self.random = numpy.random.RandomState(seed)
+        self.t = 0
+
+        size = len(self.primitives)
+        self.positions = numpy.zeros((0, 2), dtype = numpy.int32)
+        self.rotations = numpy.zeros(0, dtype = numpy.int32)
+        self.contexts = numpy.zeros(0, dtype = numpy.int32)
+        self.weights = numpy.zeros((0, size, size), dtype = numpy.int32)
+        # The order in which the composite interactions of each agent were
+        # learned (-1 = not learned)
+        self.ranks = numpy.zeros((0, size, size), dtype = numpy.int32)
+        self.next_ranks = numpy.zeros(0, dtype = numpy.int32)
+
+        self.compile_rules()
+
+    def compile_rules(self):
+        """
+        Compile the enaction rules: for each primitive interaction, the
+        (primitive interaction id) outcomes of success and failure.
+        """
+        def get_id(name, result):
+            return self.primitive_ids.get(interaction.PrimitiveInteraction(name, result), -1)
+
+        size = len(self.primitives)
+        self.actions = {}
+        self.succeed_ids = numpy.arange(size, dtype = numpy.int32)
+        self.fail_ids = numpy.arange(size, dtype = numpy.int32)
+        for (primitive_id, primitive) in enumerate(self.primitives):
+            name = primitive.get_name()
+            self.actions.setdefault(name, []).append(primitive_id)
+            succeed_id = get_id(name, "Succeed")
+            fail_id = get_id(name, "Fail")
+            if succeed_id >= 0:
+                self.succeed_ids[primitive_id] = succeed_id
+            if fail_id >= 0:
+                self.fail_ids[primitive_id] = fail_id
+
+    @staticmethod
+    def from_world(world, primitives, motivation, seed = None):
+        """
+        Create a population from a world: collidable entities become
+        obstacles, and each agent in the world becomes an agent in the
+        population.
+
+        :param world: The world
+        :param primitives: The list of primitive interactions of the agents
+        :param motivation: A dictionary mapping primitive interactions to
+                           their valences
+        :param seed: Optional, the seed of the random number generator
+        :return: The population
+        """
+        import agent
+
+        obstacles = numpy.zeros((world.get_height(), world.get_width()), dtype = bool)
+        positions = []
+        rotations = []
+        for entity in world.get_entities():
+            if isinstance(entity, agent.Agent):
+                positions.append((int(round(entity.get_position().get_x())), int(round(entity.get_position().get_y()))))
+                rotations.append(entity.get_rotation())
+            elif entity.collidable():
+                for position in entity.get_spanning_positions():
+                    obstacles[int(round(position.get_y())), int(round(position.get_x()))] = True
+
+        population = Population(obstacles, primitives, motivation, seed)
+        population.add_agents(positions, rotations)
+        return population
+
+    def add_agents(self, positions, rotations = None):
+        """
+        Add agents to the population, without any composite interactions.
+
+        :param positions: A sequence of (x, y) positions of the agents
+        :param rotations: Optional, a sequence of rotations (in degrees, a
+                          multiple of 90) of the agents
+        """
+        count = len(positions)
+        if rotations is None:
+            rotations = numpy.zeros(count)
+        size = len(self.primitives)
+
+        self.positions = numpy.concatenate((self.positions, numpy.asarray(positions, dtype = numpy.int32).reshape(count, 2)))
+        self.rotations = numpy.concatenate((self.rotations, (numpy.asarray(rotations, dtype = numpy.int32) // 90) % 4))
+        self.contexts = numpy.concatenate((self.contexts, numpy.full(count, -1, dtype = numpy.int32)))
+        self.weights = numpy.concatenate((self.weights, numpy.zeros((count, size, size), dtype = numpy.int32)))
+        self.ranks = numpy.concatenate((self.ranks, numpy.full((count, size, size), -1, dtype = numpy.int32)))
+        self.next_ranks = numpy.concatenate((self.next_ranks, numpy.zeros(count, dtype = numpy.int32)))
+
+    def spawn(self, count):
+        """
+        Add agents at random free cells, with random rotations.
+
+        :param count: The number of agents to add
+        """
+        free = numpy.flatnonzero(~self.obstacles)
+        cells = free[self.random.randint(len(free), size = count)]
+        (ys, xs) = numpy.unravel_index(cells, self.obstacles.shape)
+        self.add_agents(numpy.column_stack((xs, ys)), self.random.randint(4, size = count) * 90)
+
+    def get_size(self):
+        """
+        :return: The number of agents in the population
+        """
+        return len(self.positions)
+
+    def get_agent(self, index):
+        """
+        Get a view of an agent in the population.
+
+        :param index: The index of the agent
+        :return: The agent view
+        """
+        return AgentView(self, index)
+
+    def get_agents(self):
+        """
+        :return: A list of views of all agents in the population
+        """
+        return [AgentView(self, index) for index in xrange(self.get_size())]
+
+    def is_obstacle(self, positions):
+        """
+        Test whether there are obstacles at positions.
+
+        :param positions: An array of (x, y) positions
+        :return: A boolean array
+        """
+        (height, width) = self.obstacles.shape
+        xs = positions[:, 0]
+        ys = positions[:, 1]
+        inside = (xs >= 0) & (xs < width) & (ys >= 0) & (ys < height)
+        obstacle = ~inside
+        obstacle[inside] = self.obstacles[ys[inside], xs[inside]]
+        return obstacle
+
+    def decide(self):
+        """
+        Let all agents decide on the primitive interaction to enact: the
+        anticipated interaction with the highest valence (the first learned
+        one of those with the same valence), or a random primitive
+        interaction if no interaction with a positive valence is anticipated.
+
+        :return: An array of the intended primitive interaction ids
+        """
+        count = self.get_size()
+        intended = numpy.full(count, -1, dtype = numpy.int32)
+
+        agents = numpy.flatnonzero(self.contexts >= 0)
+        if len(agents) > 0:
+            ranks = self.ranks[agents, self.contexts[agents]]
+            known = ranks >= 0
+            scores = numpy.where(known, self.valences, -numpy.inf)
+            best_scores = scores.max(axis = 1)
+            best = known & (scores == best_scores[:, numpy.newaxis])
+            choices = numpy.where(best, ranks, numpy.iinfo(numpy.int32).max).argmin(axis = 1)
+            positive = best_scores > 0
+            intended[agents[positive]] = choices[positive]
+
+        exploring = numpy.flatnonzero(intended < 0)
+        intended[exploring] = self.random.randint(len(self.primitives), size = len(exploring))
+        return intended
+
+    def enact(self, intended):
+        """
+        Let all agents enact their intended primitive interactions.
+
+        :param intended: An array of the intended primitive interaction ids
+        :return: An array of the enacted primitive interaction ids
+        """
+        succeed = numpy.ones(len(intended), dtype = bool)
+
+        in_front = self.positions + MOVE_DELTAS[self.rotations]
+        blocked = self.is_obstacle(in_front)
+
+        for (name, primitive_ids) in self.actions.iteritems():
+            agents = numpy.flatnonzero(numpy.in1d(intended, primitive_ids))
+            if len(agents) == 0:
+                continue
+
+            if name == "Step":
+                succeed[agents] = ~blocked[agents]
+            elif name == "Feel":
+                succeed[agents] = blocked[agents]
+            elif name == "Cuddle":
+                cells = self.positions[:, 1] * self.obstacles.shape[1] + self.positions[:, 0]
+                (_, inverse, counts) = numpy.unique(cells, return_inverse = True, return_counts = True)
+                succeed[agents] = counts[inverse[agents]] > 1
+            elif name == "Turn Left":
+                self.rotations[agents] = (self.rotations[agents] + 1) % 4
+            elif name == "Turn Right":
+                self.rotations[agents] = (self.rotations[agents] - 1) % 4
+
+        # Move the agents that stepped
+        moving = numpy.flatnonzero(numpy.in1d(intended, self.actions.get("Step", [])) & succeed)
+        self.positions[moving] = in_front[moving]
+
+        return numpy.where(succeed, self.succeed_ids[intended], self.fail_ids[intended]).astype(numpy.int32)
+
+    def learn(self, enacted):
+        """
+        Let all agents learn (or reinforce) the composite interaction of
+        their context and the interaction they enacted, and update their
+        contexts.
+
+        :param enacted: An array of the enacted primitive interaction ids
+        """
+        agents = numpy.flatnonzero(self.contexts >= 0)
+        pres = self.contexts[agents]
+        posts = enacted[agents]
+
+        new = self.ranks[agents, pres, posts] < 0
+        new_agents = agents[new]
+        self.ranks[new_agents, pres[new], posts[new]] = self.next_ranks[new_agents]
+        self.next_ranks[new_agents] += 1
+        self.weights[agents, pres, posts] += 1
+
+        self.contexts = enacted
+
+    def step(self):
+        """
+        Step all agents: decide, enact and learn.
+
+        :return: An array of the enacted primitive interaction ids
+        """
+        enacted = self.enact(self.decide())
+        self.learn(enacted)
+        self.t += 1
+        return enacted
+
+    def notify(self, event):
+        if isinstance(event, events.TickEvent):
+            self.step()
+
+class AgentView(object):
+    """
+    A view of an agent in a population, for inspection.
+    """
+
+    def __init__(self, population, index):
+        """
+        :param population: The population
+        :param index: The index of the agent in the population
+        """
+        self.population = population
+        self.index = index
+
+    def get_position(self):
+        """
+        :return: The (x, y) position of the agent
+        """
+        return tuple(self.population.positions[self.index].tolist())
+
+    def get_rotation(self):
+        """
+        :return: The rotation of the agent in degrees
+        """
+        return int(self.population.rotations[self.index]) * 90
+
+    def get_enacted(self):
+        """
+        :return: The last enacted primitive interaction, or None
+        """
+        context = self.population.contexts[self.index]
+        if context < 0:
+            return None
+        return self.population.primitives[context]
+
+    def get_composite_interactions(self):
+        """
+        :return: A list of the learned composite interactions, in the order
+                 they were learned
+        """
+        primitives = self.population.primitives
+        ranks = self.population.ranks[self.index]
+        (pres, posts) = numpy.nonzero(ranks >= 0)
+        order = numpy.argsort(ranks[pres, posts])
+        return [interaction.CompositeInteraction(primitives[pre], primitives[post]) for (pre, post) in zip(pres[order].tolist(), posts[order].tolist())]
+
+    def get_weight(self, composite_interaction):
+        """
+        :param composite_interaction: A composite interaction of primitive
+                                      interactions
+        :return: The weight of the composite interaction
+        """
+        primitive_ids = self.population.primitive_ids
+        pre = primitive_ids[composite_interaction.get_pre()]
+        post = primitive_ids[composite_interaction.get_post()]
+        return int(self.population.weights[self.index, pre, post])
+
+    def get_interaction_memory(self):
+        """
+        Build the interaction memory of the agent, as a simple agent would
+        have it.
+
+        :return: The interaction memory
+        """
+        memory = interactionmemory.InteractionMemory()
+        for (primitive, valence) in zip(self.population.primitives, self.population.valences.tolist()):
+            memory.add_interaction(primitive, 1, valence)
+        for composite_interaction in self.get_composite_interactions():
+            memory.add_interaction(composite_interaction, self.get_weight(composite_interaction))
+        return memory
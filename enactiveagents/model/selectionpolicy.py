@@ -0,0 +1,111 @@
+"""
+Module that holds classes that represent an agent's selection policy: the
+way an agent selects an interaction from the interactions it considers.
+
+Policies select in a single pass over the (scored) interactions; they never
+sort them.
+"""
+
+import abc
+import heapq
+import math
+import random
+
+class SelectionPolicy(object):
+    """
+    Abstract selection policy class.
+    """
+
+    @abc.abstractmethod
+    def select(self, items, key):
+        """
+        Select an item.
+
+        :param items: An iterable of items to select from
+        :param key: A function giving the score of an item
+        :return: The selected item, or None if there are no items
+        """
+        raise NotImplementedError("Should be implemented by child")
+
+    def select_top(self, items, key, k):
+        """
+        Get the items with the highest scores.
+
+        :param items: An iterable of items to select from
+        :param key: A function giving the score of an item
+        :param k: The number of items to get
+        :return: A list of at most k items, from high to low score (items
+                 with equal scores in their original order)
+        """
+        return heapq.nlargest(k, items, key = key)
+
+class GreedySelectionPolicy(SelectionPolicy):
+    """
+    A selection policy selecting the (first) item with the highest score.
+    """
+
+    def select(self, items, key):
+        selected = None
+        highest_score = None
+        for item in items:
+            score = key(item)
+            if selected is None or score > highest_score:
+                selected = item
+                highest_score = score
+        return selected
+
+class SoftmaxSelectionPolicy(SelectionPolicy):
+    """
+    A selection policy sampling an item with probability proportional to
+    exp(score / temperature).
+
+    Items are sampled in a single pass with the Gumbel-max trick: the item
+    with the highest score / temperature plus Gumbel-distributed noise is
+    selected.
+    """
+
+    def __init__(self, temperature = 1.0):
+        """
+        :param temperature: The temperature; the higher, the more uniform the
+                            selection
+        """
+        self.temperature = temperature
+
+    def select(self, items, key):
+        selected = None
+        highest_score = None
+        for item in items:
+            # -log(Exp(1)) is Gumbel-distributed
+            noise = random.expovariate(1.0)
+            if noise == 0:
+                return item
+            score = key(item) / float(self.temperature) - math.log(noise)
+            if selected is None or score > highest_score:
+                selected = item
+                highest_score = score
+        return selected
+
+class EpsilonGreedySelectionPolicy(GreedySelectionPolicy):
+    """
+    A selection policy selecting a uniformly random item with probability
+    epsilon, and the (first) item with the highest score otherwise.
+    """
+
+    def __init__(self, epsilon = 0.1):
+        """
+        :param epsilon: The probability of selecting a random item
+        """
+        self.epsilon = epsilon
+
+    def select(self, items, key):
+        if random.random() >= self.epsilon:
+            return super(EpsilonGreedySelectionPolicy, self).select(items, key)
+
+        # Reservoir sample a single item
+        selected = None
+        n = 0
+        for item in items:
+            n += 1
+            if random.randrange(n) == 0:
+                selected = item
+        return selected
@@ -0,0 +1,715 @@
+"""
+Module implementing a fast, versioned snapshot format for worlds and agents.
+
+Instead of pickling the whole object graph, a snapshot stores:
+
+- an interaction table per agent: the interactions in the agent's memory
+  are numbered such that composite interactions come after their pre and
+  post interactions, and are stored as (pre id, post id) integer pairs in
+  flat columns, together with weight and valence columns and the order of
+  the interactions in the memory;
+- a compact entity table with the class, position, rotation and size of
+  every entity;
+- the remaining agent state (e.g., the context of constructive agents),
+  referring to interactions by their id.
+
+A snapshot file starts with a header (the magic string ``EASNAP\\0\\0``, the
+format version as an unsigned short, 6 padding bytes and the manifest length
+as an unsigned long long), followed by the manifest (pickled with the highest
+protocol and padded to a multiple of 8 bytes), followed by the data section
+holding the raw columns (in native byte order, each aligned to 8 bytes).
+Columns are located by their offset in the data section, so the columns of
+large tables can be read or memory-mapped directly. Snapshot files can
+optionally be gzip-compressed.
+
+Enact logic and valence functions (e.g., of homeostatic agents) are not
+stored; they are provided by the experiment when a snapshot is restored onto
+a world created by that experiment.
+"""
+
+import array
+import gzip
+import struct
+import cPickle
+import importlib
+import interaction
+import agent
+
+MAGIC = "EASNAP\0\0"
+VERSION = 2
+
+#: The magic string and format version at the start of every snapshot file
+SIGNATURE = struct.Struct("<8sH")
+#: The header; padded such that the data section is aligned
+HEADER = struct.Struct("<8sH6xQ")
+#: The rest of the header after the signature, by format version (the header
+#: of version 1 was not padded)
+HEADER_REST = {
+    1: struct.Struct("<Q"),
+    2: struct.Struct("<6xQ")
+}
+ALIGNMENT = 8
+
+INTERACTION_PRIMITIVE = 0
+INTERACTION_PRIMITIVE_PERCEPTION = 1
+INTERACTION_COMPOSITE = 2
+
+def class_path(obj):
+    """
+    Get the importable path of the class of an object.
+
+    :param obj: The object
+    :return: The path of the class (e.g., "model.structure.Wall")
+    """
+    return "%s.%s" % (obj.__class__.__module__, obj.__class__.__name__)
+
+def load_class(path):
+    """
+    Get a class by its importable path.
+
+    :param path: The path of the class (e.g., "model.structure.Wall")
+    :return: The class
+    """
+    (module_name, class_name) = path.rsplit(".", 1)
+    return getattr(importlib.import_module(module_name), class_name)
+
+class InteractionTable(object):
+    """
+    Class representing the interactions of an interaction memory as a table
+    of integer ids.
+    """
+
+    def __init__(self):
+        self.ids = {}
+        self.interactions = []
+        self.kinds = []
+        self.a = []
+        self.b = []
+        self.stored = []
+        self.weights = []
+        self.valences = []
+        self.names = []
+        self.perceptions = []
+        self.int_valences = []
+        self.order = []
+        self.alternatives = []
+        self.history = []
+        self.consolidation = None
+
+    def get_id(self, interaction_, stored = False):
+        """
+        Get the id of an interaction, adding the interaction (and the
+        interactions it consists of) to the table if it is not in it yet.
+
+        :param interaction_: The interaction
+        :param stored: Whether the interaction is stored in the memory (as
+                       opposed to only being referred to)
+        :return: The id of the interaction
+        """
+        interaction_id = self.ids.get(interaction_)
+        if interaction_id is not None:
+            if stored:
+                self.stored[interaction_id] = 1
+            return interaction_id
+
+        if isinstance(interaction_, interaction.CompositeInteraction):
+            kind = INTERACTION_COMPOSITE
+            a = self.get_id(interaction_.get_pre())
+            b = self.get_id(interaction_.get_post())
+        elif isinstance(interaction_, interaction.PrimitivePerceptionInteraction):
+            kind = INTERACTION_PRIMITIVE_PERCEPTION
+            a = self.get_id(interaction_.get_primitive_interaction())
+            b = len(self.perceptions)
+            self.perceptions.append(interaction_.perception)
+        else:
+            kind = INTERACTION_PRIMITIVE
+            a = len(self.names)
+            b = -1
+            self.names.append((interaction_.get_name(), interaction_.get_result()))
+
+        interaction_id = len(self.interactions)
+        self.ids[interaction_] = interaction_id
+        self.interactions.append(interaction_)
+        self.kinds.append(kind)
+        self.a.append(a)
+        self.b.append(b)
+        self.stored.append(1 if stored else 0)
+        self.weights.append(0.0)
+        self.valences.append(float("nan"))
+        return interaction_id
+
+    def get_interaction(self, interaction_id):
+        """
+        Get the interaction with a given id, creating it (and the interactions
+        it consists of) if needed.
+
+        :param interaction_id: The id of the interaction
+        :return: The interaction
+        """
+        if interaction_id < 0:
+            return None
+        if len(self.interactions) < len(self.kinds):
+            self.materialize()
+        return self.interactions[interaction_id]
+
+    def materialize(self):
+        """
+        Create the interaction objects of all ids in the table (of a table
+        read from a snapshot file).
+        """
+        kinds = self.kinds
+        a = self.a
+        b = self.b
+        names = self.names
+        perceptions = self.perceptions
+        interactions = self.interactions = [None] * len(kinds)
+
+        for interaction_id in xrange(len(kinds)):
+            kind = kinds[interaction_id]
+            if kind == INTERACTION_COMPOSITE:
+                interaction_ = interaction.CompositeInteraction(interactions[a[interaction_id]], interactions[b[interaction_id]])
+            elif kind == INTERACTION_PRIMITIVE_PERCEPTION:
+                interaction_ = interaction.PrimitivePerceptionInteraction(interactions[a[interaction_id]], perceptions[b[interaction_id]])
+            else:
+                (name, result) = names[a[interaction_id]]
+                interaction_ = interaction.PrimitiveInteraction(name, result)
+            interactions[interaction_id] = interaction_
+
+    @staticmethod
+    def from_memory(memory, table = None):
+        """
+        Build the interaction table of an interaction memory.
+
+        :param memory: The interaction memory
+        :param table: Optional, the table to add the interactions to, e.g.,
+                      holding the interactions the agent's state refers to
+        :return: The interaction table
+        """
+        if table is None:
+            table = InteractionTable()
+        get_weight = memory.get_weight
+
+        for interaction_ in memory.get_primitive_interactions():
+            interaction_id = table.get_id(interaction_, True)
+            table.order.append(interaction_id)
+            table.weights[interaction_id] = get_weight(interaction_)
+            valence = memory.valences.get(interaction_)
+            if valence is not None and not callable(valence):
+                table.valences[interaction_id] = float(valence)
+                if isinstance(valence, (int, long)):
+                    table.int_valences.append(interaction_id)
+
+        # Composites are numbered after their pre and post interactions, so
+        # the pre and post interactions usually have an id already. Their
+        # order in the memory is kept separately
+        ids = table.ids
+        order = table.order
+        interactions = table.interactions
+        kinds = table.kinds
+        a = table.a
+        b = table.b
+        stored = table.stored
+        weights = table.weights
+        valences = table.valences
+        nan = float("nan")
+        for interaction_ in memory.get_composite_interactions():
+            weight = get_weight(interaction_)
+            pre_id = ids.get(interaction_.pre)
+            post_id = ids.get(interaction_.post)
+            if pre_id is None or post_id is None:
+                interaction_id = table.get_id(interaction_, True)
+                order.append(interaction_id)
+                weights[interaction_id] = weight
+                continue
+            interaction_id = ids.setdefault(interaction_, len(interactions))
+            order.append(interaction_id)
+            if interaction_id < len(interactions):
+                stored[interaction_id] = 1
+                weights[interaction_id] = weight
+                continue
+            interactions.append(interaction_)
+            kinds.append(INTERACTION_COMPOSITE)
+            a.append(pre_id)
+            b.append(post_id)
+            stored.append(1)
+            weights.append(weight)
+            valences.append(nan)
+
+        for interaction_, alternatives in memory.get_alternative_interaction_items():
+            interaction_id = table.get_id(interaction_)
+            for alternative in alternatives:
+                table.alternatives.append(interaction_id)
+                table.alternatives.append(table.get_id(alternative))
+
+        table.history = [table.get_id(interaction_) for interaction_ in memory.get_interaction_history()]
+
+        table.consolidation = memory.get_consolidation_state()
+        table.consolidation["protected"] = [table.get_id(interaction_) for interaction_ in table.consolidation["protected"]]
+
+        return table
+
+    def restore_memory(self, memory):
+        """
+        Fill an (empty) interaction memory with the interactions in the table.
+        Valences that were not stored (e.g., valence functions) are kept if
+        the memory already has them.
+
+        :param memory: The interaction memory
+        """
+        old_valences = memory.valences
+        memory.valences = {}
+
+        interactions = self.interactions
+        kinds = self.kinds
+        table_weights = self.weights
+        table_valences = self.valences
+        int_valences = set(self.int_valences)
+        add_interaction = memory.add_interaction
+
+        for interaction_id in self.order:
+            interaction_ = interactions[interaction_id]
+            if kinds[interaction_id] == INTERACTION_COMPOSITE:
+                add_interaction(interaction_, table_weights[interaction_id])
+            else:
+                valence = table_valences[interaction_id]
+                if valence != valence:
+                    valence = old_valences.get(interaction_, 0)
+                elif interaction_id in int_valences:
+                    valence = int(valence)
+                add_interaction(interaction_, table_weights[interaction_id], valence)
+
+        alternatives = self.alternatives
+        for i in xrange(0, len(alternatives), 2):
+            memory.add_alternative_interaction(interactions[alternatives[i]], interactions[alternatives[i + 1]])
+
+        for interaction_id in self.history:
+            memory.add_interaction_to_history(interactions[interaction_id])
+
+        if self.consolidation is not None:
+            state = dict(self.consolidation)
+            state["protected"] = [interactions[interaction_id] for interaction_id in state["protected"]]
+            memory.set_consolidation_state(state)
+
+    def get_columns(self):
+        """
+        Get the columns of the table as arrays.
+
+        :return: A dictionary mapping column names to arrays
+        """
+        return {
+            "kinds": array.array("B", self.kinds),
+            "a": array.array("i", self.a),
+            "b": array.array("i", self.b),
+            "stored": array.array("B", self.stored),
+            "order": array.array("i", self.order),
+            "weights": array.array("d", self.weights),
+            "valences": array.array("d", self.valences),
+            "alternatives": array.array("i", self.alternatives),
+            "history": array.array("i", self.history)
+        }
+
+    def set_columns(self, columns):
+        """
+        Set the columns of the table from arrays.
+
+        :param columns: A dictionary mapping column names to arrays
+        """
+        self.kinds = columns["kinds"]
+        self.a = columns["a"]
+        self.b = columns["b"]
+        self.stored = columns["stored"]
+        self.order = columns["order"]
+        self.weights = columns["weights"]
+        self.valences = columns["valences"]
+        self.alternatives = columns["alternatives"]
+        self.history = columns["history"]
+
+class Snapshot(object):
+    """
+    Class representing a snapshot of a world or of agents.
+    """
+
+    def __init__(self):
+        self.t = 0
+        self.experiment = None
+        self.world = None
+        self.agents = []
+        self.tables = []
+        # The frozen memories of the agents whose tables have not been built
+        # yet, by agent index
+        self.deferred = {}
+
+    def get_t(self):
+        return self.t
+
+    def get_experiment(self):
+        """
+        :return: The class path of the experiment the snapshot was taken of,
+                 or None
+        """
+        return self.experiment
+
+    def add_agent(self, agent_, deferred = False):
+        """
+        Add the state of an agent to the snapshot.
+
+        :param agent_: The agent
+        :param deferred: Whether to defer building the interaction table of
+                         the agent's memory (see complete). Only the agent's
+                         state and a frozen copy of its memory are captured,
+                         which is much faster, such that the agent can
+                         continue while the table is built.
+        :return: The index of the agent in the snapshot
+        """
+        memory = agent_.get_interaction_memory()
+        index = len(self.agents)
+        if deferred:
+            table = InteractionTable()
+            # The state may hold objects the agent changes (e.g., its
+            # perception handler), so it is copied
+            state = cPickle.loads(cPickle.dumps(agent_.get_snapshot_state(table), cPickle.HIGHEST_PROTOCOL))
+            self.deferred[index] = memory.freeze()
+        else:
+            table = InteractionTable.from_memory(memory)
+            state = agent_.get_snapshot_state(table)
+        state["class"] = class_path(agent_)
+        self.agents.append(state)
+        self.tables.append(table)
+        return index
+
+    def complete(self):
+        """
+        Build the interaction tables that were deferred when the agents were
+        added. This can be done on another thread than the one running the
+        agents.
+        """
+        for index, memory in sorted(self.deferred.items()):
+            InteractionTable.from_memory(memory, self.tables[index])
+        self.deferred = {}
+
+    @staticmethod
+    def capture_world(world, t = 0, experiment = None, deferred = False):
+        """
+        Take a snapshot of a world.
+
+        :param world: The world
+        :param t: The simulation time of the snapshot
+        :param experiment: Optional, the experiment the world belongs to
+        :param deferred: Whether to defer building the interaction tables of
+                         the agents' memories (see add_agent)
+        :return: The snapshot
+        """
+        snapshot = Snapshot()
+        snapshot.t = t
+        if experiment is not None:
+            snapshot.experiment = class_path(experiment)
+
+        classes = []
+        class_indices = {}
+        entity_classes = array.array("H")
+        xs = array.array("d")
+        ys = array.array("d")
+        rotations = array.array("d")
+        widths = array.array("H")
+        heights = array.array("H")
+        colors = {}
+        agents = {}
+
+        for index, entity in enumerate(world.get_entities()):
+            path = class_path(entity)
+            if path not in class_indices:
+                class_indices[path] = len(classes)
+                classes.append(path)
+            entity_classes.append(class_indices[path])
+            xs.append(entity.get_position().get_x())
+            ys.append(entity.get_position().get_y())
+            rotations.append(entity.get_rotation())
+            widths.append(entity.get_width())
+            heights.append(entity.get_height())
+            if "color" in entity.__dict__:
+                colors[index] = entity.color
+            if isinstance(entity, agent.Agent):
+                agents[index] = snapshot.add_agent(entity, deferred)
+
+        snapshot.world = {
+            "width": world.get_width(),
+            "height": world.get_height(),
+            "classes": classes,
+            "entity_classes": entity_classes,
+            "xs": xs,
+            "ys": ys,
+            "rotations": rotations,
+            "widths": widths,
+            "heights": heights,
+            "colors": colors,
+            "agents": agents
+        }
+
+        return snapshot
+
+    @staticmethod
+    def capture_agent(agent_):
+        """
+        Take a snapshot of an agent.
+
+        :param agent_: The agent
+        :return: The snapshot
+        """
+        snapshot = Snapshot()
+        snapshot.add_agent(agent_)
+        return snapshot
+
+    def restore_agent(self, agent_, index = 0):
+        """
+        Restore the state of an agent in the snapshot onto an agent.
+
+        :param agent_: The agent to restore the state onto
+        :param index: The index of the agent in the snapshot
+        """
+        table = self.tables[index]
+        if len(table.interactions) < len(table.kinds):
+            table.materialize()
+        old_memory = agent_.get_interaction_memory()
+        agent_.setup_interaction_memory()
+        memory = agent_.get_interaction_memory()
+        memory.valences = old_memory.valences
+        memory.boredom_handler = old_memory.boredom_handler
+        table.restore_memory(memory)
+
+        agent_.set_snapshot_state(self.agents[index], table)
+
+    def create_agent(self, index = 0):
+        """
+        Create an agent from the state of an agent in the snapshot.
+
+        :param index: The index of the agent in the snapshot
+        :return: The agent
+        """
+        agent_ = load_class(self.agents[index]["class"])()
+        self.restore_agent(agent_, index)
+        return agent_
+
+    def restore_world(self, world):
+        """
+        Restore the snapshot onto a world. The agents in the world (in order)
+        are restored to the state of the agents in the snapshot, such that
+        they keep the enact logic the world holds for them. All other
+        entities are replaced by the entities in the snapshot.
+
+        :param world: The world, e.g., as created by the experiment the
+                      snapshot was taken of
+        """
+        existing_agents = world.get_agents()
+        data = self.world
+
+        world.set_width(data["width"])
+        world.set_height(data["height"])
+
+        entities = []
+        for index in xrange(len(data["entity_classes"])):
+            if index in data["agents"]:
+                agent_index = data["agents"][index]
+                if agent_index < len(existing_agents):
+                    entity = existing_agents[agent_index]
+                    self.restore_agent(entity, agent_index)
+                else:
+                    entity = self.create_agent(agent_index)
+            else:
+                entity = load_class(data["classes"][data["entity_classes"][index]])()
+
+            entity.set_position((data["xs"][index], data["ys"][index]))
+            entity.set_rotation(data["rotations"][index])
+            if entity.get_width() != data["widths"][index]:
+                entity.set_width(data["widths"][index])
+            if entity.get_height() != data["heights"][index]:
+                entity.set_height(data["heights"][index])
+            if index in data["colors"]:
+                entity.set_color(data["colors"][index])
+            entities.append(entity)
+
+        world.entities = entities
+        world.position_entity_map_valid = False
+
+    def create_world(self):
+        """
+        Create a world from the snapshot. Note: the world has no enact logic.
+
+        :return: The world
+        """
+        import world
+        world_ = world.World()
+        self.restore_world(world_)
+        return world_
+
+    def write(self, file_path, compress = False):
+        """
+        Write the snapshot to a file.
+
+        :param file_path: The path of the file
+        :param compress: Whether to gzip-compress the file
+        """
+        write_chunks(self.serialize(), file_path, compress)
+
+    def serialize(self):
+        """
+        Serialize the snapshot, building the deferred interaction tables
+        first. The serialized snapshot does not refer to the world or agents,
+        so it can be written while they change.
+
+        :return: A list of strings, which concatenated are the contents of the
+                 snapshot file
+        """
+        self.complete()
+
+        columns = []
+        tables = []
+        offset = 0
+        for table in self.tables:
+            layout = {}
+            for name, column in sorted(table.get_columns().items()):
+                layout[name] = (column.typecode, offset, len(column))
+                columns.append(column)
+                offset += padded_size(column)
+            tables.append({
+                "columns": layout,
+                "names": table.names,
+                "perceptions": table.perceptions,
+                "int_valences": table.int_valences,
+                "consolidation": table.consolidation
+            })
+
+        manifest = cPickle.dumps({
+            "t": self.t,
+            "experiment": self.experiment,
+            "world": self.world,
+            "agents": self.agents,
+            "tables": tables
+        }, cPickle.HIGHEST_PROTOCOL)
+        manifest += "\0" * (-len(manifest) % ALIGNMENT)
+
+        chunks = [HEADER.pack(MAGIC, VERSION, len(manifest)), manifest]
+        for column in columns:
+            chunks.append(column.tostring())
+            chunks.append("\0" * (padded_size(column) - column.itemsize * len(column)))
+        return chunks
+
+    @staticmethod
+    def read_manifest(fp):
+        """
+        Read the header and manifest of a snapshot file.
+
+        :param fp: The snapshot file, positioned at its start
+        :return: The manifest
+        """
+        signature = fp.read(SIGNATURE.size)
+        if len(signature) < SIGNATURE.size:
+            raise IOError("Not a snapshot file")
+        (magic, version) = SIGNATURE.unpack(signature)
+        if magic != MAGIC:
+            raise IOError("Not a snapshot file")
+        if version not in HEADER_REST:
+            raise IOError("Unsupported snapshot version %s" % version)
+        header_rest = fp.read(HEADER_REST[version].size)
+        if len(header_rest) < HEADER_REST[version].size:
+            raise IOError("Not a snapshot file")
+        (manifest_length,) = HEADER_REST[version].unpack(header_rest)
+        return cPickle.loads(fp.read(manifest_length))
+
+    @staticmethod
+    def open(file_path):
+        """
+        Open a snapshot file, which may be gzip-compressed.
+
+        :param file_path: The path of the file
+        :return: The opened file
+        """
+        fp = open(file_path, "rb")
+        if fp.read(2) == "\x1f\x8b":
+            fp.close()
+            return gzip.open(file_path, "rb")
+        fp.seek(0)
+        return fp
+
+    @staticmethod
+    def read(file_path):
+        """
+        Read a snapshot from a file.
+
+        :param file_path: The path of the file
+        :return: The snapshot
+        """
+        with Snapshot.open(file_path) as fp:
+            manifest = Snapshot.read_manifest(fp)
+            data = fp.read()
+
+        snapshot = Snapshot()
+        snapshot.t = manifest["t"]
+        snapshot.experiment = manifest["experiment"]
+        snapshot.world = manifest["world"]
+        snapshot.agents = manifest["agents"]
+
+        for table_data in manifest["tables"]:
+            columns = {}
+            for name, (typecode, offset, length) in table_data["columns"].iteritems():
+                column = array.array(typecode)
+                column.fromstring(data[offset:offset + length * column.itemsize])
+                columns[name] = column
+
+            table = InteractionTable()
+            table.set_columns(columns)
+            table.names = table_data["names"]
+            table.perceptions = table_data["perceptions"]
+            table.int_valences = table_data.get("int_valences", [])
+            table.consolidation = table_data.get("consolidation")
+            snapshot.tables.append(table)
+
+        return snapshot
+
+def write_chunks(chunks, file_path, compress = False):
+    """
+    Write a serialized snapshot to a file.
+
+    :param chunks: The serialized snapshot, as returned by Snapshot.serialize
+    :param file_path: The path of the file
+    :param compress: Whether to gzip-compress the file
+    """
+    if compress:
+        fp = gzip.open(file_path, "wb")
+    else:
+        fp = open(file_path, "wb")
+
+    with fp:
+        for chunk in chunks:
+            fp.write(chunk)
+
+def padded_size(column):
+    """
+    Get the size of a column in the data section, including padding.
+
+    :param column: The column
+    :return: The size of the column in bytes
+    """
+    size = column.itemsize * len(column)
+    return size + (-size % ALIGNMENT)
+
+def save_world(world, file_path, t = 0, experiment = None, compress = False):
+    """
+    Save a snapshot of a world to a file.
+
+    :param world: The world
+    :param file_path: The path of the file
+    :param t: The simulation time
+    :param experiment: Optional, the experiment the world belongs to
+    :param compress: Whether to gzip-compress the file
+    """
+    Snapshot.capture_world(world, t, experiment).write(file_path, compress)
+
+def save_agent(agent_, file_path, compress = False):
+    """
+    Save a snapshot of an agent to a file.
+
+    :param agent_: The agent
+    :param file_path: The path of the file
+    :param compress: Whether to gzip-compress the file
+    """
+    Snapshot.capture_agent(agent_).write(file_path, compress)
@@ -5,11 +5,12 @@ Module that holds classes that represent the world.
 import abc
 import collections
 from random import shuffle
-import pygame
 import events
 import interaction
 import agent
 from entity import Position
+from utilities.profiler import Profiler, clock
+from utilities.metrics import Metrics
 
 class World(events.EventListener):
     """
@@ -194,12 +195,14 @@ class World(events.EventListener):
         they wish to enact and any potential (optional) data the agents return.
 
         :param agents: The agents to have prepare their interactions.
-        :return: A dictionary of agents mapping to a tuple with the interaction
+        :return: An ordered dictionary of agents mapping to a tuple with the interaction
                  they wish to enact and the data returned by their preparation 
                  (this data is to be delivered back to the agents (unmutated) 
                  when they are told which interaction was enacted).
         """
-        agents_data = {}
+        # Keep the preparation order, so that agents enact in the same
+        # (randomized) order as they prepared
+        agents_data = collections.OrderedDict()
         for agent in agents:
             val = agent.prepare_interaction()
             if isinstance(val, interaction.PrimitiveInteraction) or isinstance(val, interaction.PrimitivePerceptionInteraction):
@@ -243,7 +246,15 @@ class World(events.EventListener):
                 agents_interactions = {agent: primitive_interaction for agent, (primitive_interaction, data) in agents_data.items()}
             
             if len(agents_interactions) > 0:
-                enacted_ = callback(self, agents_interactions)
+                profiler = Profiler.get_profiler()
+                if profiler.is_enabled():
+                    enacted_ = profiler.call(
+                        "World.complex_enact_logic[%s]" % getattr(callback, "__name__", callback),
+                        callback,
+                        self,
+                        agents_interactions)
+                else:
+                    enacted_ = callback(self, agents_interactions)
                 enacted.update(enacted_)
 
         # Execute interactions
@@ -286,12 +297,21 @@ class World(events.EventListener):
                     agents.append(entity)
             shuffle(agents)
 
+            start = clock()
+
             # Build the position entity map to make entity_at lookup quick
             self.build_position_entity_map()
             agents_data = self.prepare(agents)
+            prepared = clock()
             
             # Agents will now enact in (and mutate) the world, so invalidate
             # the entity map
             self.position_entity_map_valid = False
 
             self.enact(agents_data)
+
+            metrics = Metrics.get_metrics()
+            metrics.count("World.ticks")
+            metrics.count("World.agent_steps", len(agents))
+            metrics.time("World.prepare", prepared - start)
+            metrics.time("World.enact", clock() - prepared)
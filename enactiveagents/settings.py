@@ -13,18 +13,75 @@ CELL_HEIGHT = 32
 MAX_FPS = 60
 #: Time per simulation step in miliseconds (a lower step time results in a faster simulation, 0 = equal to draw speed)
 SIMULATION_STEP_TIME = 50
+#: Run the simulation in its own thread, ticking as fast as possible (ignoring SIMULATION_STEP_TIME); the view draws the latest tick at MAX_FPS
+DECOUPLED_SIMULATION = False
+#: Number of worker threads writing saved simulation renders to disk
+RENDER_EXPORT_WORKERS = 2
+#: Maximum number of saved simulation renders waiting to be written (further renders are dropped)
+RENDER_EXPORT_QUEUE_SIZE = 32
+
+#: Use interaction memories that store interactions in array columns by integer id (less memory per interaction)
+ARRAY_INTERACTION_MEMORY = False
+
+#: Number of composite interactions agents consolidate per step: decaying their weights and forgetting weak ones (0 = never forget)
+CONSOLIDATION_BATCH_SIZE = 0
+#: Factor by which the weights of composite interactions decay per completed enaction (1 = no decay)
+CONSOLIDATION_DECAY = 0.999
+#: Weight below which composite interactions are forgotten
+CONSOLIDATION_MIN_WEIGHT = 0.5
+#: Weight above which composite interactions are stabilized; the interactions they consist of are not forgotten
+CONSOLIDATION_STABLE_WEIGHT = 3
+#: Maximum number of composite interactions in an agent's memory, enforced by consolidation (0 = unbounded)
+CONSOLIDATION_MAX_SIZE = 0
 
 LISTEN_PORT = 8418
 
 #: Port at which the internal web-server listens
 WEB_LISTEN_PORT = 8080
 
+#: Enable the profiling hooks (timers and call counters around the hot paths) at start-up
+PROFILING = False
+#: Number of ticks between profiling summaries printed to the console (0 = never print)
+PROFILING_SUMMARY_INTERVAL = 500
+
+#: Number of ticks between samples of the simulation metrics served at /metrics (0 = only sample when the metrics are requested)
+METRICS_SAMPLE_INTERVAL = 0
+#: Number of most recent metrics samples kept for the time series
+METRICS_HISTORY_SIZE = 300
+
+#: Minimum level of log messages to output ("DEBUG" additionally outputs the per-step agent and tick messages)
+LOG_LEVEL = "INFO"
+#: Number of debug log messages to buffer before writing them out
+LOG_BUFFER_SIZE = 1000
+#: Path of the file to write the log to (None = write the log to the console)
+LOG_FILE = None
+#: Whether to gzip-compress the log file
+LOG_COMPRESS = False
+
+#: Record all agent preparations and enactions to a binary trace file
+TRACE_RECORDING = False
+#: Number of ticks after which recorded trace events are flushed to disk
+TRACE_FLUSH_INTERVAL = 100
+
+#: Whether to gzip-compress saved snapshots
+SNAPSHOT_COMPRESS = False
+
+#: Number of ticks between background checkpoints (0 = no checkpoints)
+CHECKPOINT_INTERVAL = 0
+#: Number of most recent checkpoints to keep (0 = keep all)
+CHECKPOINT_KEEP = 3
+#: Whether to gzip-compress checkpoints
+CHECKPOINT_COMPRESS = True
+
 # Do not edit below this line.
 ROOT_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
 
 AGENT_DIR = os.path.join(ROOT_DIR, "_agents")
 WORLD_DIR = os.path.join(ROOT_DIR, "_worlds")
 EXPERIMENT_DIR = os.path.join(ROOT_DIR, "_experiments")
+TRACE_DIR = os.path.join(ROOT_DIR, "_traces")
+SNAPSHOT_DIR = os.path.join(ROOT_DIR, "_snapshots")
+CHECKPOINT_DIR = os.path.join(ROOT_DIR, "_checkpoints")
 SIMULATIONS_RENDERS_DIR = os.path.join(ROOT_DIR, "_renders")
 SIMULATION_RENDERS_DIR = os.path.join(SIMULATIONS_RENDERS_DIR, strftime("%Y%m%dT%H%M%S"))
 WEBROOT_DIR = os.path.join(ROOT_DIR, "webroot")
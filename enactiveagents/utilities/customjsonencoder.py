@@ -5,6 +5,25 @@ class CustomJSONEncoder(json.JSONEncoder):
     A custom JSON encoder to additionally encode some objects defined in this
     project.
     """
+
+    #: Functions turning objects into encodable objects, by class; filled
+    #: with the classes' to_json methods as classes are first encoded
+    encoders = {}
+
+    @staticmethod
+    def get_type_encoder(type_):
+        """
+        Get the function turning objects of a class into encodable objects.
+
+        :param type_: The class
+        :return: The function, or None if objects of the class cannot be
+                 encoded by this encoder
+        """
+        if type_ not in CustomJSONEncoder.encoders:
+            m = getattr(type_, 'to_json', None)
+            CustomJSONEncoder.encoders[type_] = m if callable(m) else None
+        return CustomJSONEncoder.encoders[type_]
+
     def default(self, obj):
         """
         Encode the object in JSON.
@@ -12,9 +31,91 @@ class CustomJSONEncoder(json.JSONEncoder):
         :param obj: The object to encode
         :return: The JSON encoding of the object
         """
-        if 'to_json' in dir(obj):
-            m = getattr(obj, 'to_json')
-            if callable(m):
-                return m()
+        encoder = self.encoders.get(obj.__class__)
+        if encoder is None:
+            encoder = self.get_type_encoder(obj.__class__)
+        if encoder is not None:
+            return encoder(obj)
 
         return json.JSONEncoder.default(self, obj)
+
+class TraceEncoder(object):
+    """
+    Encodes traces of agent events (a dictionary mapping agents to
+    dictionaries mapping kinds of events to lists of (interaction, valence)
+    events) in JSON, in the same format as the CustomJSONEncoder.
+
+    Agents enact the same few interactions over and over, so the JSON
+    fragment of each (equal) interaction is encoded once and cached, and the
+    traces are joined from the cached fragments.
+    """
+
+    #: Maximum number of cached fragments; the cache is cleared when it is
+    #: full
+    CACHE_SIZE = 10000
+
+    #: Functions encoding values of native types, by type
+    value_encoders = {
+        int: str,
+        long: str,
+        bool: lambda value: "true" if value else "false",
+        type(None): lambda value: "null"
+    }
+
+    def __init__(self):
+        self.encoder = CustomJSONEncoder()
+        self.fragments = {}
+
+    def encode_interaction(self, interaction_):
+        """
+        Encode an interaction, using the cached fragment if available.
+
+        :param interaction_: The interaction
+        :return: The JSON fragment of the interaction
+        """
+        fragment = self.fragments.get(interaction_)
+        if fragment is None:
+            fragment = self.encoder.encode(interaction_)
+            if len(self.fragments) >= self.CACHE_SIZE:
+                self.fragments = {}
+            self.fragments[interaction_] = fragment
+        return fragment
+
+    def encode_value(self, value):
+        """
+        Encode a value, e.g., a valence.
+
+        :param value: The value
+        :return: The JSON fragment of the value
+        """
+        encoder = self.value_encoders.get(type(value))
+        if encoder is not None:
+            return encoder(value)
+        return self.encoder.encode(value)
+
+    def encode_events(self, events):
+        """
+        Encode a list of events.
+
+        :param events: The (interaction, valence) events
+        :return: The JSON fragment of the events
+        """
+        return "[%s]" % ", ".join([
+            "[%s, %s]" % (self.encode_interaction(interaction_), self.encode_value(valence))
+            for (interaction_, valence) in events])
+
+    def encode(self, trace):
+        """
+        Encode a trace.
+
+        :param trace: The dictionary mapping agents to dictionaries mapping
+                      kinds of events to lists of events
+        :return: The JSON of the trace
+        """
+        return "{%s}" % ", ".join([
+            "%s: {%s}" % (
+                self.encoder.encode(agent),
+                ", ".join([
+                    "%s: %s" % (self.encoder.encode(kind), self.encode_events(events))
+                    for (kind, events) in agent_trace.iteritems()]))
+            for (agent, agent_trace) in trace.iteritems()])
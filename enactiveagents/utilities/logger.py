@@ -0,0 +1,101 @@
+"""
+Module implementing the application log: a level-filtered, buffered logger
+on top of the standard logging module.
+
+Log calls should pass their arguments separately (e.g.,
+``logger.debug("%s - Enacted: %s", name, interaction)``) so that messages are
+only formatted when their level is enabled.
+"""
+
+import sys
+import gzip
+import logging
+import logging.handlers
+import settings
+
+#: Name of the logger all application loggers are children of
+ROOT_LOGGER_NAME = "enactiveagents"
+
+logging.getLogger(ROOT_LOGGER_NAME).addHandler(logging.NullHandler())
+
+class CompressedFileHandler(logging.FileHandler):
+    """
+    A handler appending records to a gzip-compressed file.
+    """
+
+    def _open(self):
+        return gzip.open(self.baseFilename, "ab")
+
+def find_no_caller():
+    """
+    Stand-in for looking up the calling frame of a log record, which the log
+    format does not use and which is expensive to look up.
+
+    :return: The (file name, line number, function name) of an unknown caller
+    """
+    return ("(unknown file)", 0, "(unknown function)")
+
+def get_logger(name):
+    """
+    Get the logger for a part of the application. The logger does not look
+    up the calling frame of its records; loggers of other libraries are not
+    affected.
+
+    :param name: The name of the part of the application (e.g., the module name)
+    :return: The logger
+    """
+    logger = logging.getLogger("%s.%s" % (ROOT_LOGGER_NAME, name))
+    logger.findCaller = find_no_caller
+    return logger
+
+def setup(level = None, buffer_size = None, file_path = None, compress = None):
+    """
+    Set up the application log. Records at or above the given level are
+    written to the console or to a file. Debug records (e.g., the per-step
+    agent messages) are buffered and written in batches: the buffer is flushed
+    when it is full, when a record of a higher level is logged, and on exit.
+
+    Arguments that are not given are taken from the settings.
+
+    :param level: The minimum level of records to log (e.g., "DEBUG", "INFO")
+    :param buffer_size: The number of debug records to buffer before writing
+                        them
+    :param file_path: The path of the file to log to, None to log to the console
+    :param compress: Whether to gzip-compress the log file
+    :return: The application root logger
+    """
+    if level is None:
+        level = settings.LOG_LEVEL
+    if buffer_size is None:
+        buffer_size = settings.LOG_BUFFER_SIZE
+    if file_path is None:
+        file_path = settings.LOG_FILE
+    if compress is None:
+        compress = settings.LOG_COMPRESS
+
+    if file_path is None:
+        target = logging.StreamHandler(sys.stdout)
+    elif compress:
+        target = CompressedFileHandler(file_path)
+    else:
+        target = logging.FileHandler(file_path)
+    target.setFormatter(logging.Formatter("%(message)s"))
+
+    handler = logging.handlers.MemoryHandler(buffer_size, flushLevel = logging.INFO, target = target)
+
+    logger = logging.getLogger(ROOT_LOGGER_NAME)
+    for old_handler in logger.handlers[:]:
+        logger.removeHandler(old_handler)
+        old_handler.close()
+    logger.addHandler(handler)
+    logger.setLevel(level)
+    logger.propagate = False
+
+    return logger
+
+def flush():
+    """
+    Write all buffered records.
+    """
+    for handler in logging.getLogger(ROOT_LOGGER_NAME).handlers:
+        handler.flush()
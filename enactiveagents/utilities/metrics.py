@@ -0,0 +1,274 @@
+"""
+Module keeping live metrics of the simulation: its throughput, the time spent
+in each phase of a tick, and the growth of the agents' interaction memories
+and of the process memory.
+
+The simulation feeds counters and phase timings to the registry as it runs,
+and the registry is sampled into a fixed-size time series: by default only
+when the metrics are requested, or periodically. A request waits for the
+simulation to take a sample between two ticks (also while it is paused), so
+the webserver serves a fresh sample and the time series as JSON, and as
+plain text for metrics scrapers.
+"""
+
+import os
+import sys
+import collections
+import threading
+import settings
+from utilities.profiler import clock
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+def get_rss():
+    """
+    Get the memory used by this process.
+
+    :return: The resident set size of the process in bytes, or None if it is
+             not known on this platform. Where the current resident set size
+             cannot be read, this is the peak resident set size.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (IOError, OSError, IndexError, ValueError, AttributeError):
+        pass
+
+    if resource is None:
+        return None
+
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return rss
+    return rss * 1024
+
+def format_label(value):
+    """
+    Format a label value of the plain text metrics format.
+
+    :param value: The value
+    :return: The quoted and escaped value
+    """
+    return '"%s"' % str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+class Metrics(object):
+    """
+    Class to keep the counters and phase timings of the simulation, and a time
+    series of periodic samples of them.
+
+    Counters and timings are only written by the simulation; samples are
+    taken by the simulation and read by the webserver, and are guarded by a
+    lock.
+    """
+
+    metrics = None
+
+    #: The prefix of the names in the plain text metrics format
+    PREFIX = "enactiveagents"
+    #: Number of seconds a request waits for the simulation to take a sample
+    REQUEST_TIMEOUT = 1.0
+
+    def __init__(self, history_size = settings.METRICS_HISTORY_SIZE):
+        """
+        :param history_size: The number of most recent samples kept
+        """
+        self.lock = threading.Lock()
+        self.sampled = threading.Condition(self.lock)
+        self.history_size = history_size
+        self.sample_requested = False
+        self.samples_taken = 0
+        self.reset()
+
+    @staticmethod
+    def get_metrics():
+        """
+        Static method to get the metrics object. The first time this method
+        is called, a metrics object is created. Afterwards, on subsequent
+        calls that same object will be returned.
+
+        :returns: Metrics -- the metrics object.
+        """
+        if Metrics.metrics == None:
+            Metrics.metrics = Metrics()
+
+        return Metrics.metrics
+
+    def reset(self):
+        """
+        Clear all counters, timings and samples collected so far.
+        """
+        self.counters = {}
+        self.phases = {}
+        self.start_time = clock()
+        self.previous = (self.start_time, {}, {})
+        with self.lock:
+            self.series = collections.deque(maxlen = self.history_size)
+            self.latest = None
+
+    def count(self, name, n = 1):
+        """
+        Increment a counter.
+
+        :param name: The name of the counter
+        :param n: The amount to increment the counter by
+        """
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def time(self, name, elapsed):
+        """
+        Add the time spent in a phase of a tick.
+
+        :param name: The name of the phase
+        :param elapsed: The time spent in the phase in seconds
+        """
+        phase = self.phases.get(name)
+        if phase is None:
+            self.phases[name] = [1, elapsed]
+        else:
+            phase[0] += 1
+            phase[1] += elapsed
+
+    def request_sample(self, timeout = REQUEST_TIMEOUT):
+        """
+        Request a sample, to be taken by the simulation between two ticks,
+        and wait for it. Called by the webserver when the metrics are
+        requested.
+
+        :param timeout: The maximum number of seconds to wait
+        :return: True if the sample was taken, False if the wait timed out
+                 (e.g., when no simulation is sampling the metrics)
+        """
+        deadline = clock() + timeout
+        with self.lock:
+            samples_taken = self.samples_taken
+            self.sample_requested = True
+            while self.samples_taken == samples_taken:
+                remaining = deadline - clock()
+                if remaining <= 0:
+                    return False
+                self.sampled.wait(remaining)
+            return True
+
+    def is_sample_requested(self):
+        """
+        :return: True if a sample has been requested since the last sample
+        """
+        return self.sample_requested
+
+    def sample(self, t, agents):
+        """
+        Take a sample of the metrics: the rates and mean phase times since the
+        previous sample, and the current memory use.
+
+        :param t: The simulation time
+        :param agents: The agents to sample the interaction memories of
+        :return: The sample
+        """
+        self.sample_requested = False
+        now = clock()
+        counters = dict(self.counters)
+        phases = dict((name, tuple(phase)) for (name, phase) in self.phases.iteritems())
+        (previous_time, previous_counters, previous_phases) = self.previous
+        self.previous = (now, counters, phases)
+
+        elapsed = now - previous_time
+        rates = {}
+        for name, value in counters.iteritems():
+            rates[name] = (value - previous_counters.get(name, 0)) / elapsed if elapsed > 0 else 0.0
+
+        phase_means = {}
+        for name, (calls, total) in phases.iteritems():
+            (previous_calls, previous_total) = previous_phases.get(name, (0, 0.0))
+            if calls > previous_calls:
+                phase_means[name] = (total - previous_total) / (calls - previous_calls)
+
+        agent_samples = {}
+        for agent in agents:
+            interaction_memory = agent.get_interaction_memory()
+            agent_samples[str(agent)] = {
+                "composites": interaction_memory.get_composite_count(),
+                "total_weight": interaction_memory.get_total_weight()
+            }
+
+        sample = {
+            "t": t,
+            "time": now - self.start_time,
+            "rates": rates,
+            "phases": phase_means,
+            "composites": sum(agent_sample["composites"] for agent_sample in agent_samples.itervalues()),
+            "total_weight": sum(agent_sample["total_weight"] for agent_sample in agent_samples.itervalues()),
+            "rss": get_rss()
+        }
+
+        with self.lock:
+            self.series.append(sample)
+            self.latest = (sample, counters, agent_samples)
+            self.samples_taken += 1
+            self.sampled.notify_all()
+        return sample
+
+    def summary(self):
+        """
+        Get the latest sample and the time series.
+
+        :return: A dictionary holding the counters and per-agent interaction
+                 memory sizes at the latest sample, the latest sample, and
+                 the series of samples (oldest first).
+        """
+        with self.lock:
+            series = list(self.series)
+            latest = self.latest
+
+        if latest is None:
+            return {"counters": {}, "agents": {}, "latest": None, "series": series}
+
+        (sample, counters, agent_samples) = latest
+        return {
+            "counters": counters,
+            "agents": agent_samples,
+            "latest": sample,
+            "series": series
+        }
+
+    def format_text(self):
+        """
+        Format the latest sample in the plain text format of metrics scrapers
+        (one "name{labels} value" line per metric).
+
+        :return: A list of lines
+        """
+        with self.lock:
+            latest = self.latest
+
+        if latest is None:
+            return []
+
+        (sample, counters, agent_samples) = latest
+        lines = []
+
+        def add(name, value, label = None, label_value = None):
+            if value is None:
+                return
+            if label is None:
+                lines.append("%s_%s %s" % (self.PREFIX, name, value))
+            else:
+                lines.append("%s_%s{%s=%s} %s" % (self.PREFIX, name, label, format_label(label_value), value))
+
+        add("t", sample["t"])
+        for name in sorted(counters):
+            add("count_total", counters[name], "counter", name)
+        for name in sorted(sample["rates"]):
+            add("rate_per_second", sample["rates"][name], "counter", name)
+        for name in sorted(sample["phases"]):
+            add("phase_seconds", sample["phases"][name], "phase", name)
+        add("composites", sample["composites"])
+        add("total_weight", sample["total_weight"])
+        for name in sorted(agent_samples):
+            add("agent_composites", agent_samples[name]["composites"], "agent", name)
+            add("agent_total_weight", agent_samples[name]["total_weight"], "agent", name)
+        add("rss_bytes", sample["rss"])
+        return lines
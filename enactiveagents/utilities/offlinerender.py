@@ -0,0 +1,225 @@
+"""
+Module to render recorded runs offline, e.g., to make videos of long runs
+without drawing them during the simulation.
+
+Frames are drawn by the world view onto an offscreen surface, so they have
+the same shapes and colors as the live view, and written as PNG files
+("t<tick>.png", as saved by the live view). A run is either a recorded
+trace, which is replayed (optionally seeking from the checkpoints of the
+run), or a series of snapshots. Rendering is split by frame range over
+worker processes.
+
+Requires NumPy.
+"""
+
+import os
+import multiprocessing
+from time import strftime
+import pygame
+import settings
+import model.snapshot
+from appstate import AppState
+from view import view
+from utilities import replay
+from utilities import tracereader
+
+def create_view(world, cell_size):
+    """
+    Create a view drawing a world onto an offscreen surface.
+
+    :param world: The world
+    :param cell_size: The (width, height) of a cell in pixels
+    :return: The view
+    """
+    AppState.get_state().set_world(world)
+    surface = pygame.Surface((world.get_width() * cell_size[0], world.get_height() * cell_size[1]))
+    return view.View(surface)
+
+def save_frame(view_, output_dir, t):
+    """
+    Draw a frame and write it to a file.
+
+    :param view_: The view to draw with
+    :param output_dir: The directory to write the frame to
+    :param t: The simulation time of the frame
+    """
+    view_.draw_entities()
+    pygame.image.save(view_.surface, os.path.join(output_dir, "t%s.png" % t))
+
+def render_trace_range(experiment, trace_path, checkpoint_dir, start, end, output_dir, cell_size):
+    """
+    Render a range of frames of a recorded trace. Each frame shows the world
+    after a tick.
+
+    :param experiment: The importable path of the experiment class that was
+                       recorded
+    :param trace_path: The path of the trace file
+    :param checkpoint_dir: The directory holding the checkpoints of the run,
+                           or None to replay from the start
+    :param start: The first tick to render
+    :param end: The tick to stop rendering at (exclusive)
+    :param output_dir: The directory to write the frames to
+    :param cell_size: The (width, height) of a cell in pixels
+    :return: The number of frames rendered
+    """
+    world = model.snapshot.load_class(experiment)().get_world()
+    trace = tracereader.TraceReader(trace_path)
+    if checkpoint_dir is None:
+        replay_ = replay.Replay(world, trace)
+        replay_.fast_forward(start)
+    else:
+        replay_ = replay.Replay.from_checkpoint(world, trace, checkpoint_dir, start)
+
+    view_ = create_view(world, cell_size)
+    rendered = 0
+    while replay_.get_tick() < end and replay_.has_next():
+        t = replay_.get_tick()
+        replay_.step()
+        view_.agent_interaction.update(replay_.enacted)
+        save_frame(view_, output_dir, t)
+        rendered += 1
+    return rendered
+
+def render_snapshot_range(file_paths, output_dir, cell_size):
+    """
+    Render a frame for each of a series of snapshots. Agents are drawn in the
+    color of the last interaction they enacted (the last interaction in their
+    interaction history), as in the live view.
+
+    :param file_paths: The paths of the snapshot files
+    :param output_dir: The directory to write the frames to
+    :param cell_size: The (width, height) of a cell in pixels
+    :return: The number of frames rendered
+    """
+    for file_path in file_paths:
+        snapshot = model.snapshot.Snapshot.read(file_path)
+        world = snapshot.create_world()
+        view_ = create_view(world, cell_size)
+        for agent in world.get_agents():
+            history = agent.get_interaction_memory().get_interaction_history()
+            if len(history) > 0:
+                view_.agent_interaction[agent] = history[-1]
+        save_frame(view_, output_dir, snapshot.get_t())
+    return len(file_paths)
+
+def create_output_dir(output_dir = None):
+    """
+    Create the directory to write frames to.
+
+    :param output_dir: Optional, the directory, by default a new directory in
+                       the renders directory (such that the frames are not
+                       mixed with those saved by the live view)
+    :return: The directory
+    """
+    if output_dir is None:
+        output_dir = os.path.join(settings.SIMULATION_RENDERS_DIR, strftime("%Y%m%dT%H%M%S"))
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    return output_dir
+
+def split_range(start, end, parts):
+    """
+    Split a range into contiguous parts of (nearly) equal size.
+
+    :param start: The start of the range
+    :param end: The end of the range (exclusive)
+    :param parts: The number of parts
+    :return: A list of (start, end) tuples of the non-empty parts
+    """
+    size = max(0, end - start)
+    bounds = [start + size * i // parts for i in range(parts + 1)]
+    return [(bounds[i], bounds[i + 1]) for i in range(parts) if bounds[i] < bounds[i + 1]]
+
+def _render_trace_range(args):
+    return render_trace_range(*args)
+
+def _render_snapshot_range(args):
+    return render_snapshot_range(*args)
+
+def run_pool(function, tasks, processes):
+    """
+    Run rendering tasks on a pool of worker processes.
+
+    :param function: The function to run on the arguments of each task
+    :param tasks: A list of argument tuples
+    :param processes: The number of worker processes
+    :return: The total number of frames rendered
+    """
+    if processes <= 1 or len(tasks) <= 1:
+        return sum(function(task) for task in tasks)
+
+    pool = multiprocessing.Pool(processes)
+    try:
+        return sum(pool.map(function, tasks))
+    finally:
+        pool.close()
+        pool.join()
+
+def render_trace(
+    experiment,
+    trace_path,
+    start = 0,
+    end = None,
+    checkpoint_dir = None,
+    output_dir = None,
+    processes = None,
+    cell_size = (settings.CELL_WIDTH, settings.CELL_HEIGHT)):
+    """
+    Render the frames of a recorded trace in parallel. The frame range is split
+    into one contiguous part per process; each process seeks to the start of
+    its part (from the latest checkpoint before it, if checkpoints are given)
+    and replays and renders its part.
+
+    :param experiment: The experiment class that was recorded (or its
+                       importable path)
+    :param trace_path: The path of the trace file
+    :param start: The first tick to render
+    :param end: Optional, the tick to stop rendering at (exclusive), by
+                default the end of the trace
+    :param checkpoint_dir: Optional, the directory holding the checkpoints of
+                           the run
+    :param output_dir: Optional, the directory to write the frames to, by
+                       default a new directory in the renders directory
+    :param processes: Optional, the number of worker processes, by default the
+                      number of CPUs
+    :param cell_size: The (width, height) of a cell in pixels
+    :return: The number of frames rendered
+    """
+    if not isinstance(experiment, basestring):
+        experiment = "%s.%s" % (experiment.__module__, experiment.__name__)
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    output_dir = create_output_dir(output_dir)
+
+    # Index the trace once, before the workers read it
+    trace = tracereader.TraceReader(trace_path)
+    if end is None:
+        ticks = trace.get_events()["tick"]
+        end = int(ticks[-1]) + 1 if len(ticks) > 0 else 0
+
+    tasks = [
+        (experiment, trace_path, checkpoint_dir, part_start, part_end, output_dir, cell_size)
+        for (part_start, part_end) in split_range(start, end, processes)]
+    return run_pool(_render_trace_range, tasks, processes)
+
+def render_snapshots(file_paths, output_dir = None, processes = None, cell_size = (settings.CELL_WIDTH, settings.CELL_HEIGHT)):
+    """
+    Render a frame for each of a series of snapshots (e.g., the checkpoints of
+    a run) in parallel.
+
+    :param file_paths: The paths of the snapshot files
+    :param output_dir: Optional, the directory to write the frames to, by
+                       default a new directory in the renders directory
+    :param processes: Optional, the number of worker processes, by default the
+                      number of CPUs
+    :param cell_size: The (width, height) of a cell in pixels
+    :return: The number of frames rendered
+    """
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    output_dir = create_output_dir(output_dir)
+
+    tasks = [
+        (file_paths[part_start:part_end], output_dir, cell_size)
+        for (part_start, part_end) in split_range(0, len(file_paths), processes)]
+    return run_pool(_render_snapshot_range, tasks, processes)
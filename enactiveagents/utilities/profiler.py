@@ -0,0 +1,234 @@
+"""
+Module implementing lightweight profiling hooks: timers and call counters
+around the hot paths of the simulation.
+"""
+
+import time
+import timeit
+import functools
+import importlib
+
+#: The clock used to time sections; a monotonic clock if the interpreter
+#: provides one, otherwise the most precise wall clock available.
+clock = getattr(time, "monotonic", timeit.default_timer)
+
+class Profiler(object):
+    """
+    Class to keep timings and call counts of named sections of code.
+
+    Methods listed in TARGETS are only wrapped with timers while profiling is
+    enabled. When profiling is disabled the original methods are restored, so
+    the instrumented code runs at full speed.
+    """
+
+    profiler = None
+
+    #: The hot paths to instrument, as (module, class, method) tuples
+    TARGETS = [
+        ("events", "EventManager", "post_event"),
+        ("model.world", "World", "prepare"),
+        ("model.world", "World", "enact"),
+        ("model.world", "World", "build_position_entity_map"),
+        ("model.agent", "Agent", "get_perception"),
+        ("model.agent", "ConstructiveAgent", "activate_interactions"),
+        ("model.agent", "ConstructiveAgent", "propose_interactions"),
+        ("model.agent", "ConstructiveAgent", "consider_alternative_interactions"),
+        ("model.boredomhandler", "BoredomHandler", "process_boredom_batch"),
+        ("model.boredomhandler", "PassthroughBoredomHandler", "process_boredom"),
+        ("model.boredomhandler", "PassthroughBoredomHandler", "process_boredom_batch"),
+        ("model.boredomhandler", "WeightBoredomHandler", "process_boredom"),
+        ("model.boredomhandler", "WeightBoredomHandler", "process_boredom_batch"),
+        ("model.boredomhandler", "RepetitiveBoredomHandler", "process_boredom"),
+        ("model.boredomhandler", "RepetitiveBoredomHandler", "process_boredom_batch"),
+        ("model.boredomhandler", "WeightRepetitiveBoredomHandler", "process_boredom"),
+        ("model.boredomhandler", "WeightRepetitiveBoredomHandler", "process_boredom_batch"),
+        ("model.interactionmemory", "InteractionMemory", "get_activated_interactions"),
+        ("model.interactionmemory", "InteractionMemory", "get_weight"),
+        ("model.interactionmemory", "InteractionMemory", "get_valence"),
+        ("model.interactionmemory", "InteractionMemory", "get_valences"),
+        ("model.interactionmemory", "InteractionMemory", "get_proclivity"),
+        ("model.interactionmemory", "InteractionMemory", "get_proclivities"),
+        ("model.interactionmemory", "InteractionMemory", "get_alternative_interactions"),
+        ("model.interactionmemory", "InteractionMemory", "get_interactions_with_alternative"),
+        ("model.interactionmemory", "HomeostaticInteractionMemory", "get_valence"),
+        ("model.interactionmemory", "HomeostaticInteractionMemory", "get_valences"),
+        ("model.interactionmemory", "ArrayInteractionMemory", "get_activated_interactions"),
+        ("model.interactionmemory", "ArrayInteractionMemory", "get_weight"),
+        ("model.interactionmemory", "ArrayInteractionMemory", "get_alternative_interactions"),
+        ("model.interactionmemory", "ArrayInteractionMemory", "get_interactions_with_alternative"),
+    ]
+
+    def __init__(self):
+        self.enabled = False
+        self.originals = {}
+        self.reset()
+
+    @staticmethod
+    def get_profiler():
+        """
+        Static method to get the profiler object. The first time this method
+        is called, a profiler object is created. Afterwards, on subsequent
+        calls that same object will be returned.
+
+        :returns: Profiler -- the profiler object.
+        """
+        if Profiler.profiler == None:
+            Profiler.profiler = Profiler()
+
+        return Profiler.profiler
+
+    def reset(self):
+        """
+        Clear all timings and counters collected so far.
+        """
+        self.sections = {}
+        self.counters = {}
+        self.start_time = clock()
+
+    def enable(self):
+        """
+        Enable profiling: wrap all target methods with timers.
+        """
+        if self.enabled:
+            return
+
+        for (module_name, class_name, method_name) in self.TARGETS:
+            cls = getattr(importlib.import_module(module_name), class_name)
+            # Only wrap methods the class defines itself; inherited methods
+            # are wrapped through the class defining them.
+            if method_name not in cls.__dict__:
+                continue
+            original = cls.__dict__[method_name]
+            self.originals[(cls, method_name)] = original
+            setattr(cls, method_name, self.wrap("%s.%s" % (class_name, method_name), original))
+
+        self.enabled = True
+        self.reset()
+
+    def disable(self):
+        """
+        Disable profiling: restore the original target methods.
+        """
+        for (cls, method_name), original in self.originals.iteritems():
+            setattr(cls, method_name, original)
+
+        self.originals = {}
+        self.enabled = False
+
+    def toggle(self):
+        """
+        Toggle profiling on or off, depending on the current setting.
+        """
+        if self.enabled:
+            self.disable()
+        else:
+            self.enable()
+
+    def is_enabled(self):
+        return self.enabled
+
+    def wrap(self, name, f):
+        """
+        Wrap a function with a timer.
+
+        :param name: The name of the section the function's timings are added to
+        :param f: The function to wrap
+        :return: The wrapped function
+        """
+        @functools.wraps(f)
+        def timed(*args, **kwargs):
+            start = clock()
+            try:
+                return f(*args, **kwargs)
+            finally:
+                self.add(name, clock() - start)
+        return timed
+
+    def call(self, name, f, *args):
+        """
+        Call a function, timing the call if profiling is enabled. Used for
+        callables that are not methods, such as enact logic callbacks.
+
+        :param name: The name of the section
+        :param f: The function to call
+        :return: The return value of the function
+        """
+        if not self.enabled:
+            return f(*args)
+
+        start = clock()
+        try:
+            return f(*args)
+        finally:
+            self.add(name, clock() - start)
+
+    def add(self, name, elapsed):
+        """
+        Add a timing to a section.
+
+        :param name: The name of the section
+        :param elapsed: The time spent in the section in seconds
+        """
+        section = self.sections.get(name)
+        if section is None:
+            self.sections[name] = [1, elapsed, elapsed]
+        else:
+            section[0] += 1
+            section[1] += elapsed
+            if elapsed > section[2]:
+                section[2] = elapsed
+
+    def count(self, name, n = 1):
+        """
+        Increment a counter, if profiling is enabled.
+
+        :param name: The name of the counter
+        :param n: The amount to increment the counter by
+        """
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def summary(self):
+        """
+        Get a summary of the timings and counters collected so far.
+
+        :return: A dictionary holding the elapsed wall time, the counters, and
+                 for every section its call count, total, mean and maximum
+                 time in seconds.
+        """
+        sections = {}
+        for name, (calls, total, maximum) in self.sections.items():
+            sections[name] = {
+                "calls": calls,
+                "total": total,
+                "mean": total / calls,
+                "max": maximum
+            }
+
+        return {
+            "enabled": self.enabled,
+            "elapsed": clock() - self.start_time,
+            "counters": dict(self.counters),
+            "sections": sections
+        }
+
+    def format_summary(self):
+        """
+        Format the summary as a table, with the most expensive sections first.
+
+        :return: The summary as a list of lines
+        """
+        summary = self.summary()
+        lines = ["Profile over %.2fs:" % summary["elapsed"]]
+        lines.append(" %-60s %10s %10s %10s %10s" % ("section", "calls", "total (s)", "mean (us)", "max (us)"))
+        sections = sorted(summary["sections"].items(), key = lambda x: x[1]["total"], reverse = True)
+        for name, section in sections:
+            lines.append(" %-60s %10d %10.3f %10.1f %10.1f" % (
+                name,
+                section["calls"],
+                section["total"],
+                section["mean"] * 1e6,
+                section["max"] * 1e6))
+        for name, value in sorted(summary["counters"].items()):
+            lines.append(" %-60s %10d" % (name, value))
+        return lines
@@ -0,0 +1,312 @@
+"""
+Module to deterministically replay recorded traces.
+
+A replay feeds the recorded intentions and preparations of the agents in a
+trace back through the world's enact logic and the agents'
+enacted_interaction, without any decision-making. This reconstructs the
+world state and the agents' memories at any tick, much faster than running
+the simulation itself. Replaying checks that the interactions the world
+enacts are the interactions that were recorded.
+
+Every agent type must post the interactions it intends or prepares, so its
+runs can be replayed. check_experiments checks this for the experiments in
+experiment.basic; run it with ``python -m utilities.replay``.
+
+Requires NumPy.
+"""
+
+import os
+import shutil
+import tempfile
+import inspect
+import collections
+import numpy
+import events
+import model.interaction
+from appstate import AppState
+from view import tracerecorder
+from view import checkpointer
+from utilities import tracereader
+from utilities.logger import get_logger
+import model.snapshot
+
+logger = get_logger(__name__)
+
+class ReplayError(Exception):
+    """
+    Raised when a replay diverges from the recorded trace.
+    """
+    pass
+
+class Replay(events.EventListener):
+    """
+    Class to replay a trace onto a world.
+    """
+
+    #: Number of events read from the trace at a time
+    BLOCK_SIZE = 1 << 16
+
+    def __init__(self, world, trace, start_tick = 0, agents = None):
+        """
+        :param world: The world to replay onto; it should be in the state it
+                      was in at the start tick of the replay
+        :param trace: The trace reader of the recorded trace
+        :param start_tick: The tick to start replaying at
+        :param agents: Optional, a list mapping trace agent ids to the agents in
+                       the world. By default agents are matched by name, or by
+                       their order in the world if the names do not match
+                       (e.g., when the world was freshly created by the
+                       experiment that was recorded)
+        """
+        self.world = world
+        self.trace = trace
+        self.tick = start_tick
+        self.interactions = [None] * len(trace.get_interactions())
+        self.event_manager = events.EventManager()
+        self.event_manager.register_listener(self)
+        self.enacted = {}
+
+        if agents is None:
+            agents = self.match_agents()
+        self.agents = agents
+
+        self.position = int(numpy.searchsorted(trace.get_events()["tick"], start_tick))
+        self.block = []
+        self.block_position = 0
+
+    @staticmethod
+    def from_checkpoint(world, trace, directory, tick):
+        """
+        Seek to a tick: restore the latest checkpoint at or before the tick
+        onto a world, and replay the trace from there up to the tick.
+
+        :param world: The world to replay onto, e.g., freshly created by the
+                      experiment that was recorded
+        :param trace: The trace reader of the recorded trace
+        :param directory: The directory holding the checkpoints of the
+                          recorded run
+        :param tick: The tick to seek to
+        :return: The replay, positioned at the tick
+        """
+        checkpoint = checkpointer.get_latest_checkpoint(directory, tick)
+        if checkpoint is None:
+            start_tick = 0
+        else:
+            (start_tick, file_path) = checkpoint
+            model.snapshot.Snapshot.read(file_path).restore_world(world)
+
+        replay = Replay(world, trace, start_tick)
+        replay.fast_forward(tick)
+        return replay
+
+    def match_agents(self):
+        """
+        Match the agents in the trace to the agents in the world.
+
+        :return: A list mapping trace agent ids to agents
+        """
+        agents = self.world.get_agents()
+        by_name = dict((agent.get_name(), agent) for agent in agents)
+        names = self.trace.get_agents()
+
+        if all(name in by_name for name in names):
+            return [by_name[name] for name in names]
+        elif len(names) <= len(agents):
+            return agents[:len(names)]
+        else:
+            raise ReplayError("Cannot match the %s agents in the trace to the %s agents in the world" % (len(names), len(agents)))
+
+    def get_tick(self):
+        """
+        :return: The tick that will be replayed next
+        """
+        return self.tick
+
+    def get_interaction(self, interaction_id):
+        """
+        Get the interaction object of an interaction id in the trace.
+
+        :param interaction_id: The id of the interaction
+        :return: The interaction
+        """
+        interaction_ = self.interactions[interaction_id]
+        if interaction_ is None:
+            (kind, a, b) = self.trace.get_interactions()[interaction_id]
+            if kind == tracerecorder.INTERACTION_COMPOSITE:
+                interaction_ = model.interaction.CompositeInteraction(self.get_interaction(a), self.get_interaction(b))
+            elif kind == tracerecorder.INTERACTION_PRIMITIVE_PERCEPTION:
+                interaction_ = model.interaction.PrimitivePerceptionInteraction(self.get_interaction(a), b)
+            else:
+                interaction_ = model.interaction.PrimitiveInteraction(a, b)
+            self.interactions[interaction_id] = interaction_
+        return interaction_
+
+    def next_event(self):
+        """
+        Get the next event of the trace without consuming it.
+
+        :return: The event as a (type, tick, agent, interaction, valence) tuple,
+                 or None if the end of the trace has been reached
+        """
+        if self.block_position >= len(self.block):
+            self.block = self.trace.get_events()[self.position:self.position + self.BLOCK_SIZE].tolist()
+            self.block_position = 0
+            self.position += len(self.block)
+            if len(self.block) == 0:
+                return None
+        return self.block[self.block_position]
+
+    def has_next(self):
+        """
+        :return: True if there are events left to replay
+        """
+        return self.next_event() is not None
+
+    def step(self):
+        """
+        Replay one tick.
+        """
+        agents_data = []
+        enactions = []
+
+        while True:
+            event = self.next_event()
+            if event is None or event[1] != self.tick:
+                break
+            self.block_position += 1
+
+            (record_type, tick, agent_id, interaction_id, valence) = event
+            agent = self.agents[agent_id]
+            interaction_ = self.get_interaction(interaction_id)
+            if record_type == tracerecorder.RECORD_INTENTION:
+                agent.intend_interaction(interaction_)
+            elif record_type == tracerecorder.RECORD_PREPARATION:
+                agents_data.append((agent, (interaction_, agent.get_preparation_data(interaction_))))
+            elif record_type == tracerecorder.RECORD_ENACTION:
+                enactions.append((agent, interaction_))
+
+        state = AppState.get_state()
+        event_manager = getattr(state, "event_manager", None)
+        state.set_event_manager(self.event_manager)
+        state.set_t(self.tick)
+        try:
+            self.enacted = {}
+            if len(agents_data) > 0:
+                self.world.build_position_entity_map()
+                self.world.position_entity_map_valid = False
+                self.world.enact(collections.OrderedDict(agents_data))
+        finally:
+            state.set_event_manager(event_manager)
+
+        for agent, interaction_ in enactions:
+            if self.enacted.get(agent) != interaction_:
+                raise ReplayError("Replay diverged at t = %s: %s enacted %s, but %s was recorded" % (
+                    self.tick,
+                    agent.get_name(),
+                    self.enacted.get(agent),
+                    interaction_))
+
+        self.tick += 1
+
+    def fast_forward(self, tick):
+        """
+        Replay until the given tick is reached, i.e., the world and agents are
+        in the state they were in at the start of the given tick (or until the
+        end of the trace is reached).
+
+        :param tick: The tick to replay to
+        """
+        while self.tick < tick and self.has_next():
+            self.step()
+
+        AppState.get_state().set_t(self.tick)
+
+    def notify(self, event):
+        if isinstance(event, events.AgentEnactionEvent):
+            self.enacted[event.agent] = event.action
+
+def check_replay(experiment, ticks):
+    """
+    Check that a run of an experiment can be replayed: run the experiment for
+    a number of ticks while recording its trace, replay the trace onto a
+    freshly created world of the experiment, and compare the positions of
+    the agents at the end.
+
+    :param experiment: The experiment class
+    :param ticks: The number of ticks to run
+    :raises ReplayError: If the replay diverges from the run
+    """
+    state = AppState.get_state()
+    (event_manager_, world_, t) = (getattr(state, "event_manager", None), getattr(state, "world", None), state.get_t())
+    directory = tempfile.mkdtemp()
+    try:
+        # Run and record the experiment
+        event_manager = events.EventManager()
+        state.set_event_manager(event_manager)
+        state.set_t(0)
+        world = experiment().get_world()
+        state.set_world(world)
+        event_manager.register_listener(world)
+        trace_path = os.path.join(directory, "check.trace")
+        recorder = tracerecorder.TraceRecorder(trace_path, world = world)
+        event_manager.register_listener(recorder)
+        for _ in range(ticks):
+            event_manager.post_event(events.TickEvent())
+            event_manager.post_event(events.TickEndEvent())
+            state.increment_t()
+        recorder.close()
+
+        # Replay it onto a fresh world
+        replay_world = experiment().get_world()
+        state.set_world(replay_world)
+        replay_ = Replay(replay_world, tracereader.TraceReader(trace_path))
+        replay_.fast_forward(ticks)
+
+        for (agent, replayed_agent) in zip(world.get_agents(), replay_world.get_agents()):
+            if agent.get_position() != replayed_agent.get_position():
+                raise ReplayError("Replay diverged: %s ended at %s, but was replayed to %s" % (
+                    agent.get_name(),
+                    agent.get_position(),
+                    replayed_agent.get_position()))
+    finally:
+        state.set_event_manager(event_manager_)
+        state.set_world(world_)
+        state.set_t(t)
+        shutil.rmtree(directory)
+
+def check_experiments(ticks = 500):
+    """
+    Check that runs of all experiments in experiment.basic can be replayed.
+    Experiments that cannot be created without arguments or files (e.g.,
+    those loading a saved world or agent) are skipped.
+
+    :param ticks: The number of ticks to run each experiment
+    :return: A dictionary mapping the names of the checked experiments to
+             None if their replay succeeded, or the error if it failed
+    """
+    import experiment.basic
+    import experiment.experiment
+
+    results = {}
+    for name, experiment_ in sorted(inspect.getmembers(experiment.basic, inspect.isclass)):
+        if not issubclass(experiment_, experiment.experiment.Experiment) or experiment_.__module__ != experiment.basic.__name__:
+            continue
+
+        try:
+            experiment_()
+        except (TypeError, EnvironmentError) as e:
+            logger.warning("Skipping %s, it cannot be created: %s", name, e)
+            continue
+
+        try:
+            check_replay(experiment_, ticks)
+        except ReplayError as e:
+            logger.error("Replaying %s failed: %s", name, e)
+            results[name] = e
+        else:
+            logger.info("Replaying %s succeeded", name)
+            results[name] = None
+    return results
+
+if __name__ == "__main__":
+    check_experiments()
@@ -0,0 +1,393 @@
+"""
+Module to read trace files written by the trace recorder, and to analyse
+them offline.
+
+Reading a trace indexes it once: the agent event records are
+extracted from the compressed chunks into a flat file of fixed-size records
+next to the trace, which is then memory-mapped as a NumPy structured array.
+Subsequent reads only index the chunks appended to the trace since.
+
+Requires NumPy.
+"""
+
+import os
+import zlib
+import cPickle
+import numpy
+from view import tracerecorder
+
+#: The record layout of the agent events in the index
+EVENT_DTYPE = numpy.dtype([
+    ("type", "u1"),
+    ("tick", "<u4"),
+    ("agent", "<u4"),
+    ("interaction", "<u4"),
+    ("valence", "<f8")
+])
+
+# The layout of a length-prefixed event record in a chunk payload
+_PREFIXED_EVENT_DTYPE = numpy.dtype([("length", "<u2")] + EVENT_DTYPE.descr)
+
+INDEX_VERSION = 1
+
+class TraceReader(object):
+    """
+    Class to read a trace file.
+    """
+
+    #: Number of events processed at a time by the analysis methods
+    BLOCK_SIZE = 1 << 22
+
+    def __init__(self, file_path, index_path = None):
+        """
+        :param file_path: The path of the trace file
+        :param index_path: The path prefix of the index files, by default the
+                           path of the trace file
+        """
+        self.file_path = file_path
+        if index_path is None:
+            index_path = file_path
+        self.events_path = index_path + ".events"
+        self.meta_path = index_path + ".meta"
+
+        self.offset = 0
+        self.count = 0
+        self.agents = []
+        self.interactions = []
+        self.load_meta()
+        self.update()
+
+    def load_meta(self):
+        """
+        Load the index metadata if the trace has been indexed before.
+        """
+        if not os.path.exists(self.meta_path) or not os.path.exists(self.events_path):
+            return
+
+        with open(self.meta_path, "rb") as fp:
+            meta = cPickle.load(fp)
+
+        if meta["version"] != INDEX_VERSION:
+            return
+
+        self.offset = meta["offset"]
+        self.count = meta["count"]
+        self.agents = meta["agents"]
+        self.interactions = meta["interactions"]
+
+    def save_meta(self):
+        """
+        Save the index metadata.
+        """
+        meta = {
+            "version": INDEX_VERSION,
+            "offset": self.offset,
+            "count": self.count,
+            "agents": self.agents,
+            "interactions": self.interactions
+        }
+
+        tmp_path = self.meta_path + ".tmp"
+        with open(tmp_path, "wb") as fp:
+            cPickle.dump(meta, fp, cPickle.HIGHEST_PROTOCOL)
+        if os.path.exists(self.meta_path):
+            os.remove(self.meta_path)
+        os.rename(tmp_path, self.meta_path)
+
+    def update(self):
+        """
+        Index all complete chunks that have been appended to the trace since
+        it was last indexed, and memory-map the events.
+        """
+        offset = self.offset
+        events_mode = "ab" if self.offset > 0 else "wb"
+        with open(self.file_path, "rb") as trace, open(self.events_path, events_mode) as events_fp:
+            # Discard events of an interrupted previous update
+            events_fp.truncate(self.count * EVENT_DTYPE.itemsize)
+            events_fp.seek(0, os.SEEK_END)
+
+            if self.offset == 0:
+                header = trace.read(tracerecorder.HEADER.size)
+                if len(header) < tracerecorder.HEADER.size:
+                    raise IOError("%s is not a trace file" % self.file_path)
+                (magic, version) = tracerecorder.HEADER.unpack(header)
+                if magic != tracerecorder.MAGIC or version != tracerecorder.VERSION:
+                    raise IOError("%s is not a trace file of version %s" % (self.file_path, tracerecorder.VERSION))
+                self.offset = tracerecorder.HEADER.size
+
+            trace.seek(self.offset)
+            while True:
+                chunk_header = trace.read(tracerecorder.CHUNK_HEADER.size)
+                if len(chunk_header) < tracerecorder.CHUNK_HEADER.size:
+                    break
+                (compressed_size, size) = tracerecorder.CHUNK_HEADER.unpack(chunk_header)
+                compressed = trace.read(compressed_size)
+                if len(compressed) < compressed_size:
+                    # The chunk is still being written
+                    break
+
+                events = self.index_payload(zlib.decompress(compressed))
+                events_fp.write(events)
+                self.count += len(events) // EVENT_DTYPE.itemsize
+                self.offset += tracerecorder.CHUNK_HEADER.size + compressed_size
+
+        # Only save the metadata if anything was indexed, such that several
+        # readers (e.g., processes) can read an indexed trace at the same time
+        if self.offset != offset:
+            self.save_meta()
+
+        if self.count > 0:
+            self.events = numpy.memmap(self.events_path, dtype = EVENT_DTYPE, mode = "r", shape = (self.count,))
+        else:
+            self.events = numpy.zeros(0, dtype = EVENT_DTYPE)
+
+    def index_payload(self, payload):
+        """
+        Index the records of a chunk payload. Agent and interaction records are
+        added to the lookup tables.
+
+        :param payload: The uncompressed chunk payload
+        :return: The event records of the payload, as a byte string of
+                 EVENT_DTYPE records
+        """
+        # Fast path: most chunks hold event records only, these can be
+        # converted in one go
+        if len(payload) % _PREFIXED_EVENT_DTYPE.itemsize == 0:
+            records = numpy.frombuffer(payload, dtype = _PREFIXED_EVENT_DTYPE)
+            if (numpy.all(records["length"] == EVENT_DTYPE.itemsize)
+                and numpy.all(numpy.in1d(records["type"], tracerecorder.EVENT_RECORD_TYPES))):
+                # Strip the length prefixes
+                raw = numpy.frombuffer(payload, dtype = numpy.uint8).reshape(-1, _PREFIXED_EVENT_DTYPE.itemsize)
+                return raw[:, tracerecorder.RECORD_LENGTH.size:].tostring()
+
+        events = []
+        position = 0
+        while position < len(payload):
+            (length,) = tracerecorder.RECORD_LENGTH.unpack_from(payload, position)
+            position += tracerecorder.RECORD_LENGTH.size
+            record = payload[position:position + length]
+            position += length
+
+            record_type = ord(record[0])
+            if record_type in tracerecorder.EVENT_RECORD_TYPES:
+                events.append(record)
+            elif record_type == tracerecorder.RECORD_AGENT:
+                (_, agent_id) = tracerecorder.AGENT_RECORD.unpack_from(record)
+                self.set_entry(self.agents, agent_id, unpack_string(record, tracerecorder.AGENT_RECORD.size)[0])
+            elif record_type == tracerecorder.RECORD_INTERACTION:
+                (_, interaction_id, kind) = tracerecorder.INTERACTION_RECORD.unpack_from(record)
+                self.set_entry(self.interactions, interaction_id, self.parse_interaction(kind, record, tracerecorder.INTERACTION_RECORD.size))
+
+        return "".join(events)
+
+    def parse_interaction(self, kind, record, position):
+        """
+        Parse the data of an interaction record.
+
+        :param kind: The kind of interaction
+        :param record: The record
+        :param position: The position of the interaction data in the record
+        :return: A tuple (kind, name, result) for primitives, (kind,
+                 primitive id, perception) for primitive perceptions, and
+                 (kind, pre id, post id) for composites
+        """
+        if kind == tracerecorder.INTERACTION_COMPOSITE:
+            (pre, post) = tracerecorder.IDS.unpack_from(record, position)
+            return (kind, pre, post)
+        elif kind == tracerecorder.INTERACTION_PRIMITIVE_PERCEPTION:
+            (primitive,) = tracerecorder.ID.unpack_from(record, position)
+            (perception, position) = unpack_string(record, position + tracerecorder.ID.size)
+            return (kind, primitive, perception)
+        else:
+            (name, position) = unpack_string(record, position)
+            (result, position) = unpack_string(record, position)
+            return (kind, name, result)
+
+    @staticmethod
+    def set_entry(table, index, value):
+        if index >= len(table):
+            table.extend([None] * (index + 1 - len(table)))
+        table[index] = value
+
+    def get_events(self):
+        """
+        Get all agent events (preparations, enactions and intentions) of the
+        trace.
+
+        :return: A (memory-mapped) structured array of EVENT_DTYPE
+        """
+        return self.events
+
+    def get_agents(self):
+        """
+        :return: The list of agent names, indexed by agent id
+        """
+        return self.agents
+
+    def get_agent_id(self, name):
+        """
+        :param name: The name of the agent
+        :return: The id of the agent
+        """
+        return self.agents.index(name)
+
+    def get_interactions(self):
+        """
+        :return: The list of interaction descriptions, indexed by interaction id
+        """
+        return self.interactions
+
+    def get_label(self, interaction_id):
+        """
+        Get the label of an interaction (as printed by the interaction classes).
+
+        :param interaction_id: The id of the interaction
+        :return: The label of the interaction
+        """
+        (kind, a, b) = self.interactions[interaction_id]
+        if kind == tracerecorder.INTERACTION_COMPOSITE:
+            return "<%s, %s>" % (self.get_label(a), self.get_label(b))
+        elif kind == tracerecorder.INTERACTION_PRIMITIVE_PERCEPTION:
+            return "%s:%s" % (self.get_label(a), b)
+        else:
+            return "(%s, %s)" % (a, b)
+
+    def get_primitive_ids(self):
+        """
+        Get, for each interaction, the id of its primitive interaction (i.e.,
+        primitive perception interactions are mapped to their primitive).
+        Composites are mapped to themselves.
+
+        :return: An array mapping interaction ids to primitive interaction ids
+        """
+        primitive_ids = numpy.arange(len(self.interactions), dtype = numpy.uint32)
+        for interaction_id, (kind, a, b) in enumerate(self.interactions):
+            if kind == tracerecorder.INTERACTION_PRIMITIVE_PERCEPTION:
+                primitive_ids[interaction_id] = a
+        return primitive_ids
+
+    def find_interactions(self, name, result = None):
+        """
+        Find the primitive and primitive perception interactions with a given
+        name and (optionally) result.
+
+        :param name: The name of the primitive interaction
+        :param result: The result of the primitive interaction
+        :return: A boolean array, indexed by interaction id, that is true for
+                 the matching interactions
+        """
+        matches = numpy.zeros(len(self.interactions), dtype = bool)
+        for interaction_id, (kind, a, b) in enumerate(self.interactions):
+            if kind == tracerecorder.INTERACTION_PRIMITIVE and a == name and (result is None or b == result):
+                matches[interaction_id] = True
+        return matches[self.get_primitive_ids()]
+
+    def blocks(self, record_type = tracerecorder.RECORD_ENACTION, agent = None):
+        """
+        Iterate over the events in blocks of at most BLOCK_SIZE events, such
+        that large traces are processed in bounded memory.
+
+        :param record_type: The type of events to select (None = all)
+        :param agent: The id of the agent to select events of (None = all)
+        :return: A generator of structured arrays of the selected events
+        """
+        for start in xrange(0, self.count, self.BLOCK_SIZE):
+            block = self.events[start:start + self.BLOCK_SIZE]
+            mask = None
+            if record_type is not None:
+                mask = block["type"] == record_type
+            if agent is not None:
+                agent_mask = block["agent"] == agent
+                mask = agent_mask if mask is None else mask & agent_mask
+            yield block if mask is None else block[mask]
+
+    def get_tick_count(self):
+        """
+        :return: The number of ticks covered by the trace
+        """
+        if self.count == 0:
+            return 0
+        return int(self.events["tick"][-1]) + 1
+
+    def valence_over_time(self, agent = None, bin_size = 1, record_type = tracerecorder.RECORD_ENACTION):
+        """
+        Get the mean valence of events over time.
+
+        :param agent: The id of the agent (None = all agents)
+        :param bin_size: The number of ticks to average over
+        :param record_type: The type of events
+        :return: A tuple of an array of the first tick of each bin, and an
+                 array of the mean valence in each bin (NaN if the bin has
+                 no events)
+        """
+        bins = (self.get_tick_count() + bin_size - 1) // bin_size
+        sums = numpy.zeros(bins)
+        counts = numpy.zeros(bins)
+        for block in self.blocks(record_type, agent):
+            indices = block["tick"] // bin_size
+            sums += numpy.bincount(indices, weights = block["valence"], minlength = bins)
+            counts += numpy.bincount(indices, minlength = bins)
+
+        with numpy.errstate(invalid = "ignore", divide = "ignore"):
+            means = sums / counts
+        return (numpy.arange(bins) * bin_size, means)
+
+    def interaction_histogram(self, agent = None, record_type = tracerecorder.RECORD_ENACTION, primitives_only = False):
+        """
+        Count how often each interaction occurs.
+
+        :param agent: The id of the agent (None = all agents)
+        :param record_type: The type of events
+        :param primitives_only: Whether to count primitive perception
+                                interactions as their primitive interaction
+        :return: An array of counts, indexed by interaction id
+        """
+        counts = numpy.zeros(len(self.interactions), dtype = numpy.int64)
+        primitive_ids = self.get_primitive_ids() if primitives_only else None
+        for block in self.blocks(record_type, agent):
+            ids = block["interaction"]
+            if primitives_only:
+                ids = primitive_ids[ids]
+            counts += numpy.bincount(ids, minlength = len(self.interactions))
+        return counts
+
+    def fail_rates(self, name, fail_result = "Fail"):
+        """
+        Get, per agent, the fraction of enacted interactions with a given name
+        that had a given (failing) result.
+
+        :param name: The name of the interaction (e.g., "Step")
+        :param fail_result: The result indicating failure
+        :return: An array of rates, indexed by agent id (NaN if the agent never
+                 enacted the interaction)
+        """
+        attempts = self.find_interactions(name)
+        failures = self.find_interactions(name, fail_result)
+        attempt_counts = numpy.zeros(len(self.agents))
+        failure_counts = numpy.zeros(len(self.agents))
+        for block in self.blocks(tracerecorder.RECORD_ENACTION):
+            attempt_counts += numpy.bincount(block["agent"], weights = attempts[block["interaction"]], minlength = len(self.agents))
+            failure_counts += numpy.bincount(block["agent"], weights = failures[block["interaction"]], minlength = len(self.agents))
+
+        with numpy.errstate(invalid = "ignore", divide = "ignore"):
+            return failure_counts / attempt_counts
+
+    def step_fail_rates(self):
+        """
+        Get, per agent, the fraction of steps that failed.
+
+        :return: An array of rates, indexed by agent id
+        """
+        return self.fail_rates("Step")
+
+def unpack_string(record, position):
+    """
+    Unpack a length-prefixed string.
+
+    :param record: The record to unpack the string from
+    :param position: The position of the string in the record
+    :return: A tuple of the string and the position after the string
+    """
+    (length,) = tracerecorder.RECORD_LENGTH.unpack_from(record, position)
+    position += tracerecorder.RECORD_LENGTH.size
+    return (record[position:position + length], position + length)
@@ -1,9 +1,18 @@
 """
 Prints a history of agent events to file.
+
+The history is captured at the end of each tick, and encoded as JSON at most
+once per captured history, so that the webserver can serve it from its own
+threads without racing the simulation. The events of each tick are also
+published (as JSON) to subscribers, e.g., clients of the webserver's event
+stream.
 """
 
+import Queue
+import collections
+import hashlib
+import threading
 import events
-import json
 import utilities.customjsonencoder
 
 class AgentEvents(events.EventListener):
@@ -11,8 +20,28 @@ class AgentEvents(events.EventListener):
     View class
     """
 
+    #: Number of most recent events per agent and kind kept in the history
+    HISTORY_SIZE = 20
+    #: Number of ticks of events a subscriber can lag behind before it is
+    #: dropped
+    SUBSCRIBER_QUEUE_SIZE = 100
+
     def __init__(self):
         self.history = {}
+        self.encoder = utilities.customjsonencoder.TraceEncoder()
+        self.changed = False
+
+        # The history captured at the end of the last tick (in which events
+        # happened), and its encoding as a (JSON, ETag) tuple
+        self.lock = threading.Lock()
+        self.captured = {}
+        self.version = 0
+        self.encoded = None
+
+        # The subscribers, and the events of the current tick to publish to
+        # them
+        self.subscribers = set()
+        self.deltas = {}
 
     def create_if_not_exists(self, agent):
         """
@@ -21,23 +50,124 @@ class AgentEvents(events.EventListener):
         :param agent: The agent to add to the history
         """
         if str(agent) not in self.history:
-            self.history[str(agent)] = {"preparation": [], "enaction": []}
+            self.history[str(agent)] = {
+                "preparation": collections.deque(maxlen = self.HISTORY_SIZE),
+                "enaction": collections.deque(maxlen = self.HISTORY_SIZE)}
+
+    def capture(self):
+        """
+        Capture the history, to be encoded and served until the next capture.
+        """
+        captured = dict(
+            (agent, dict((kind, list(history)) for (kind, history) in agent_history.iteritems()))
+            for (agent, agent_history) in self.history.iteritems())
+        with self.lock:
+            self.captured = captured
+            self.version += 1
+            self.encoded = None
+        self.changed = False
+
+    def get_version(self):
+        """
+        :return: The version of the captured history, incremented on each
+                 capture
+        """
+        return self.version
+
+    def get_json(self):
+        """
+        Get the captured history encoded as JSON. The encoding is cached until
+        the history is captured again.
+
+        :return: A (JSON, ETag) tuple
+        """
+        return self.get_encoded()[:2]
+
+    def get_encoded(self):
+        """
+        Get the captured history encoded as JSON, with its version.
+
+        :return: A (JSON, ETag, version) tuple
+        """
+        with self.lock:
+            if self.encoded is not None:
+                return self.encoded
+            (captured, version) = (self.captured, self.version)
+
+        # Encode without holding the lock, such that the simulation never
+        # waits for the encoding
+        encoded = self.encoder.encode(captured)
+        encoded = (encoded, '"%s-%s"' % (version, hashlib.md5(encoded).hexdigest()), version)
+        with self.lock:
+            if self.version == version:
+                self.encoded = encoded
+        return encoded
+
+    def subscribe(self):
+        """
+        Subscribe to the events of each tick.
+
+        :return: The subscriber
+        """
+        subscriber = Subscriber(self.SUBSCRIBER_QUEUE_SIZE)
+        with self.lock:
+            self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        """
+        :param subscriber: The subscriber to remove
+        """
+        with self.lock:
+            self.subscribers.discard(subscriber)
+
+    def add_delta(self, agent, kind, event):
+        """
+        Add an event to publish to the subscribers at the end of the tick.
+
+        :param agent: The name of the agent
+        :param kind: The kind of event ("preparation" or "enaction")
+        :param event: The (action, valence) of the event
+        """
+        if agent not in self.deltas:
+            self.deltas[agent] = {"preparation": [], "enaction": []}
+        self.deltas[agent][kind].append(event)
+
+    def publish(self):
+        """
+        Publish the events of the tick to the subscribers, as JSON mapping
+        agents to their new preparation and enaction events (in the format of
+        the history). The events are tagged with the version of the history
+        they were captured in.
+        """
+        with self.lock:
+            subscribers = list(self.subscribers)
+        if len(subscribers) == 0:
+            self.deltas = {}
+            return
+
+        message = (self.version, self.encoder.encode(self.deltas))
+        self.deltas = {}
+        for subscriber in subscribers:
+            if not subscriber.put(message):
+                self.unsubscribe(subscriber)
 
     def notify(self, event):
         if isinstance(event, events.AgentPreparationEvent):
             self.create_if_not_exists(event.agent)
-
             self.history[str(event.agent)]["preparation"].append((event.action, event.valence))
-
-            if len(self.history[str(event.agent)]["preparation"]) > 20:
-                self.history[str(event.agent)]["preparation"].pop(0)
+            self.changed = True
+            self.add_delta(str(event.agent), "preparation", (event.action, event.valence))
         elif isinstance(event, events.AgentEnactionEvent):
             self.create_if_not_exists(event.agent)
-
             self.history[str(event.agent)]["enaction"].append((event.action, event.valence))
-
-            if len(self.history[str(event.agent)]["enaction"]) > 20:
-                self.history[str(event.agent)]["enaction"].pop(0)
+            self.changed = True
+            self.add_delta(str(event.agent), "enaction", (event.action, event.valence))
+        elif isinstance(event, events.TickEndEvent):
+            if self.changed:
+                self.capture()
+            if self.deltas:
+                self.publish()
 
     def write(self, fp):
         """
@@ -45,4 +175,47 @@ class AgentEvents(events.EventListener):
 
         :param fp: a write()-supporting file-like object
         """
-        return json.dump(self.history, fp, cls = utilities.customjsonencoder.CustomJSONEncoder)
+        fp.write(self.get_json()[0])
+
+class Subscriber(object):
+    """
+    Class representing a subscriber to the events of each tick, with a
+    bounded queue of published events. A subscriber that lags too far
+    behind is dropped: it stops receiving events.
+    """
+
+    def __init__(self, size):
+        """
+        :param size: The maximum number of messages in the queue
+        """
+        self.queue = Queue.Queue(size)
+        self.dropped = False
+
+    def put(self, message):
+        """
+        Add a message to the queue, dropping the subscriber if it is full.
+
+        :param message: The message
+        :return: False if the subscriber was dropped
+        """
+        try:
+            self.queue.put_nowait(message)
+            return True
+        except Queue.Full:
+            self.dropped = True
+            return False
+
+    def get(self, timeout = None):
+        """
+        Get the next message.
+
+        :param timeout: Optional, the number of seconds to wait for a message
+        :return: The message, or None if there was no message in time
+        """
+        try:
+            return self.queue.get(True, timeout)
+        except Queue.Empty:
+            return None
+
+    def is_dropped(self):
+        return self.dropped
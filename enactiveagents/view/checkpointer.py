@@ -0,0 +1,236 @@
+"""
+Periodically writes checkpoints (snapshots of the world, its agents and the
+experiment) in the background, pausing the simulation only to capture them.
+
+The state is captured at a tick boundary, copying the agents' interaction
+memories without reading them (see InteractionMemory.freeze). The capture is
+serialized, (compressed and) written on a worker thread while the simulation
+continues, so the pause stays short for large memories (see measure_stall).
+The process is not forked: other threads (e.g., of the webserver or the
+render export) may hold locks that a forked child would never see released.
+
+Checkpoints are written to a temporary file and renamed when complete, so a
+crash never leaves a partial checkpoint behind. Only the most recent
+checkpoints are kept.
+"""
+
+import os
+import re
+import glob
+import random
+import threading
+import timeit
+from time import strftime
+import events
+import settings
+import model.snapshot
+import model.agent
+import model.interaction
+import model.interactionmemory
+from appstate import AppState
+from utilities.logger import get_logger
+
+logger = get_logger(__name__)
+
+CHECKPOINT_FILE_PATTERN = re.compile(r"^t(\d+)\.snap$")
+
+def get_checkpoints(directory):
+    """
+    Get the (complete) checkpoints in a directory.
+
+    :param directory: The checkpoint directory
+    :return: A list of (t, file path) tuples, sorted by simulation time
+    """
+    checkpoints = []
+    for file_path in glob.glob(os.path.join(directory, "t*.snap")):
+        match = CHECKPOINT_FILE_PATTERN.match(os.path.basename(file_path))
+        if match:
+            checkpoints.append((int(match.group(1)), file_path))
+    return sorted(checkpoints)
+
+def get_latest_checkpoint(directory, t = None):
+    """
+    Get the latest checkpoint in a directory.
+
+    :param directory: The checkpoint directory
+    :param t: Optional, the simulation time the checkpoint may not be later
+              than
+    :return: A (t, file path) tuple, or None if there is no such checkpoint
+    """
+    checkpoints = [checkpoint for checkpoint in get_checkpoints(directory) if t is None or checkpoint[0] <= t]
+    if len(checkpoints) == 0:
+        return None
+    return checkpoints[-1]
+
+class Checkpointer(events.EventListener):
+    """
+    View class
+    """
+
+    def __init__(
+        self,
+        interval = settings.CHECKPOINT_INTERVAL,
+        keep = settings.CHECKPOINT_KEEP,
+        directory = None,
+        compress = settings.CHECKPOINT_COMPRESS):
+        """
+        :param interval: The number of ticks between checkpoints
+        :param keep: The number of checkpoints to keep (0 = keep all)
+        :param directory: The directory to write checkpoints to, by default a
+                          new directory in the checkpoints directory
+        :param compress: Whether to gzip-compress checkpoints
+        """
+        if directory is None:
+            directory = os.path.join(settings.CHECKPOINT_DIR, strftime("%Y%m%dT%H%M%S"))
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self.interval = interval
+        self.keep = keep
+        self.directory = directory
+        self.compress = compress
+        self.ticks = 0
+        self.due = False
+        self.pending = None
+
+    def get_directory(self):
+        return self.directory
+
+    def is_pending(self):
+        """
+        Check whether a checkpoint is still being written.
+
+        :return: True if a checkpoint is still being written
+        """
+        if self.pending is None:
+            return False
+
+        if self.pending.is_alive():
+            return True
+
+        self.pending = None
+        self.rotate()
+        return False
+
+    def wait(self):
+        """
+        Wait until the pending checkpoint (if any) has been written.
+        """
+        if self.pending is None:
+            return
+
+        self.pending.join()
+
+        self.pending = None
+        self.rotate()
+
+    def rotate(self):
+        """
+        Remove all but the most recent checkpoints.
+        """
+        if self.keep <= 0:
+            return
+
+        for (t, file_path) in get_checkpoints(self.directory)[:-self.keep]:
+            os.remove(file_path)
+
+    def write(self, snapshot, t):
+        """
+        Serialize a snapshot and write it as a checkpoint.
+
+        :param snapshot: The snapshot
+        :param t: The simulation time of the snapshot
+        """
+        file_path = os.path.join(self.directory, "t%08d.snap" % t)
+        try:
+            model.snapshot.write_chunks(snapshot.serialize(), file_path + ".tmp", self.compress)
+            os.rename(file_path + ".tmp", file_path)
+        except Exception:
+            logger.exception("Writing the checkpoint %s failed", file_path)
+
+    def checkpoint(self):
+        """
+        Write a checkpoint of the current world in the background.
+        """
+        if self.is_pending():
+            logger.warning("Skipping checkpoint: the previous checkpoint is still being written")
+            return
+
+        state = AppState.get_state()
+        t = state.get_t()
+
+        snapshot = model.snapshot.Snapshot.capture_world(state.get_world(), t, state.get_experiment(), True)
+        self.pending = threading.Thread(target = self.write, args = (snapshot, t), name = "Checkpoint writer")
+        self.pending.start()
+
+    def notify(self, event):
+        if isinstance(event, events.TickEvent):
+            self.is_pending()
+
+            self.ticks += 1
+            if self.interval > 0 and self.ticks >= self.interval:
+                self.ticks = 0
+                self.due = True
+        elif isinstance(event, events.ControlEvent):
+            # Control events are posted between ticks; checkpoint the world as
+            # it is at the start of the tick
+            if self.due:
+                self.due = False
+                self.checkpoint()
+        elif isinstance(event, events.QuitEvent):
+            self.wait()
+
+def measure_stall(sizes = (10000, 100000, 1000000), array_memory = False):
+    """
+    Measure how long a checkpoint pauses the simulation, for agents with
+    interaction memories of increasing size: the time to capture the agent,
+    compared to the time to serialize the capture on the worker thread and to
+    capture and serialize it at once.
+
+    :param sizes: The numbers of (random) composite interactions in the memory
+    :param array_memory: Whether to measure an array-backed interaction memory
+    :return: A list of (size, capture time, serialize time, capture and
+             serialize time) tuples, in seconds
+    """
+    agent_ = model.agent.ConstructiveAgent()
+    if array_memory:
+        agent_.set_interaction_memory(model.interactionmemory.ArrayInteractionMemory())
+    else:
+        agent_.set_interaction_memory(model.interactionmemory.InteractionMemory())
+    memory = agent_.get_interaction_memory()
+
+    random_ = random.Random(0)
+    primitives = [model.interaction.PrimitiveInteraction(name, result) for name in ("Step", "Turn", "Feel") for result in ("Succeed", "Fail")]
+    for primitive in primitives:
+        memory.add_interaction(primitive, 1, 1)
+    composites = []
+
+    results = []
+    for size in sizes:
+        while len(composites) < size:
+            pre = random_.choice(composites) if composites and random_.random() < 0.5 else random_.choice(primitives)
+            composite = model.interaction.CompositeInteraction(pre, random_.choice(primitives))
+            if not memory.has_interaction(composite):
+                memory.add_interaction(composite)
+                composites.append(composite)
+        agent_.context = composites[-2:]
+        agent_.history = composites[-10:]
+
+        snapshot = model.snapshot.Snapshot()
+        capture = timeit.default_timer()
+        snapshot.add_agent(agent_, True)
+        serialize = timeit.default_timer()
+        snapshot.serialize()
+        end = timeit.default_timer()
+        snapshot = model.snapshot.Snapshot()
+        snapshot.add_agent(agent_)
+        snapshot.serialize()
+        results.append((size, serialize - capture, end - serialize, timeit.default_timer() - end))
+        logger.info(
+            "%d composite interactions: capture %.4fs, serialize %.4fs, capture and serialize %.4fs",
+            *results[-1])
+    return results
+
+if __name__ == "__main__":
+    measure_stall()
+    measure_stall(array_memory = True)
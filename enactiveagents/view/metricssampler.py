@@ -0,0 +1,47 @@
+"""
+Samples the simulation metrics for the webserver to serve, when they are
+requested or periodically.
+
+Requested samples are taken on control events, which are posted between
+ticks also while the simulation is paused, such that requests are answered
+within a frame.
+"""
+
+import events
+import settings
+import model.agent
+from appstate import AppState
+from utilities.metrics import Metrics
+
+class MetricsSampler(events.EventListener):
+    """
+    View class
+    """
+
+    def __init__(self, interval = settings.METRICS_SAMPLE_INTERVAL):
+        """
+        :param interval: The number of ticks between samples (0 = only
+                         sample when the metrics are requested)
+        """
+        self.interval = interval
+        self.ticks = 0
+
+    def sample(self):
+        """
+        Sample the metrics of the world's agents.
+        """
+        agents = [
+            entity
+            for entity in AppState.get_state().get_world().get_entities()
+            if isinstance(entity, model.agent.Agent)]
+        Metrics.get_metrics().sample(AppState.get_state().get_t(), agents)
+
+    def notify(self, event):
+        if isinstance(event, events.ControlEvent):
+            if Metrics.get_metrics().is_sample_requested():
+                self.sample()
+        elif isinstance(event, events.TickEndEvent):
+            self.ticks += 1
+            if Metrics.get_metrics().is_sample_requested() or (self.interval > 0 and self.ticks >= self.interval):
+                self.ticks = 0
+                self.sample()
@@ -0,0 +1,49 @@
+"""
+Periodically writes a summary of the profiling hooks to the log, and
+writes it as json for the webserver.
+"""
+
+import json
+import events
+import settings
+from utilities.profiler import Profiler
+from utilities.logger import get_logger
+
+logger = get_logger(__name__)
+
+class ProfileSummary(events.EventListener):
+    """
+    View class
+    """
+
+    def __init__(self, interval = settings.PROFILING_SUMMARY_INTERVAL):
+        """
+        :param interval: The number of ticks between printed summaries (0 =
+                         never print a summary)
+        """
+        self.interval = interval
+        self.ticks = 0
+
+    def print_summary(self):
+        """
+        Print the profiling summary to the log.
+        """
+        logger.info("\n".join(Profiler.get_profiler().format_summary()))
+
+    def notify(self, event):
+        if isinstance(event, events.TickEvent):
+            if not Profiler.get_profiler().is_enabled() or self.interval <= 0:
+                return
+
+            self.ticks += 1
+            if self.ticks >= self.interval:
+                self.ticks = 0
+                self.print_summary()
+
+    def write(self, fp):
+        """
+        Writes the profiling summary as json to a stream.
+
+        :param fp: a write()-supporting file-like object
+        """
+        return json.dump(Profiler.get_profiler().summary(), fp)
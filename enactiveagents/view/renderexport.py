@@ -0,0 +1,103 @@
+"""
+Exports renders (e.g., of the simulation) to image files in the background.
+
+Frames are copied into a bounded queue and encoded and written by a pool of
+worker threads, so the simulation does not wait for compression and disk
+I/O. When the workers cannot keep up and the queue is full, frames are
+dropped instead of blocking the simulation.
+"""
+
+import threading
+import Queue
+import pygame
+import settings
+from utilities.logger import get_logger
+
+logger = get_logger(__name__)
+
+class RenderExporter(object):
+    """
+    Class to export renders to image files on worker threads.
+    """
+
+    def __init__(self, workers = settings.RENDER_EXPORT_WORKERS, queue_size = settings.RENDER_EXPORT_QUEUE_SIZE):
+        """
+        :param workers: The number of worker threads
+        :param queue_size: The maximum number of frames waiting to be written
+        """
+        self.queue = Queue.Queue(queue_size)
+        self.lock = threading.Lock()
+        self.exported = 0
+        self.dropped = 0
+
+        self.workers = []
+        for i in range(workers):
+            worker = threading.Thread(target = self.work, name = "Render export %s" % i)
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
+
+    def get_exported(self):
+        """
+        :return: The number of frames written
+        """
+        return self.exported
+
+    def get_dropped(self):
+        """
+        :return: The number of frames dropped because the queue was full
+        """
+        return self.dropped
+
+    def export(self, surface, file_path):
+        """
+        Export a frame: copy the surface to write it to a file in the
+        background. The frame is dropped if too many frames are waiting to be
+        written.
+
+        :param surface: The surface to export
+        :param file_path: The path of the image file to write
+        :return: True if the frame was queued, False if it was dropped
+        """
+        if self.queue.full():
+            # Do not copy frames that would be dropped
+            self.drop(file_path)
+            return False
+
+        try:
+            self.queue.put_nowait((surface.copy(), file_path))
+        except Queue.Full:
+            self.drop(file_path)
+            return False
+        return True
+
+    def drop(self, file_path):
+        """
+        Drop a frame.
+
+        :param file_path: The path of the image file of the frame
+        """
+        self.dropped += 1
+        if self.dropped == 1 or self.dropped % 100 == 0:
+            logger.warning("Dropped %s render(s) (latest %s): the render export cannot keep up", self.dropped, file_path)
+
+    def work(self):
+        """
+        Write the queued frames.
+        """
+        while True:
+            (surface, file_path) = self.queue.get()
+            try:
+                pygame.image.save(surface, file_path)
+                with self.lock:
+                    self.exported += 1
+            except Exception:
+                logger.exception("Could not write render %s", file_path)
+            finally:
+                self.queue.task_done()
+
+    def wait(self):
+        """
+        Wait until all queued frames have been written.
+        """
+        self.queue.join()
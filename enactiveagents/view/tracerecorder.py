@@ -0,0 +1,268 @@
+"""
+Records the full history of agent events to a compact binary trace file.
+
+A trace file starts with a header (the magic string ``EATRACE\\0`` followed by
+the format version as an unsigned short), followed by chunks. Each chunk
+consists of its compressed and uncompressed payload size (two unsigned
+ints), followed by the zlib-compressed payload. A payload is a sequence of
+records, each prefixed with its length (an unsigned short). The first byte
+of each record is its type:
+
+- RECORD_AGENT: agent id (uint), agent name (utf-8)
+- RECORD_INTERACTION: interaction id (uint), interaction kind (ubyte), and
+  for primitives the name and result (length-prefixed strings), for primitive
+  perceptions the primitive id (uint) and the perception (utf-8), and for
+  composites the pre and post interaction ids (uints)
+- RECORD_PREPARATION and RECORD_ENACTION: tick (uint), agent id (uint),
+  interaction id (uint), valence (double)
+- RECORD_INTENTION: as above, the valence is not recorded (NaN)
+
+Agents and interactions are interned: each is given an integer id and
+written once, the first time it is seen. All values are little-endian.
+"""
+
+import os
+import errno
+import atexit
+import struct
+import zlib
+from time import strftime
+import events
+import settings
+import model.interaction
+from appstate import AppState
+
+MAGIC = "EATRACE\0"
+VERSION = 1
+
+HEADER = struct.Struct("<8sH")
+CHUNK_HEADER = struct.Struct("<II")
+RECORD_LENGTH = struct.Struct("<H")
+
+RECORD_AGENT = 1
+RECORD_INTERACTION = 2
+RECORD_PREPARATION = 3
+RECORD_ENACTION = 4
+RECORD_INTENTION = 5
+
+#: The types of records of agent events, which share the same layout
+EVENT_RECORD_TYPES = (RECORD_PREPARATION, RECORD_ENACTION, RECORD_INTENTION)
+
+INTERACTION_PRIMITIVE = 0
+INTERACTION_PRIMITIVE_PERCEPTION = 1
+INTERACTION_COMPOSITE = 2
+
+EVENT_RECORD = struct.Struct("<BIIId")
+AGENT_RECORD = struct.Struct("<BI")
+INTERACTION_RECORD = struct.Struct("<BIB")
+ID = struct.Struct("<I")
+IDS = struct.Struct("<II")
+
+def pack_string(string):
+    """
+    Pack a string as a length-prefixed utf-8 byte string.
+
+    :param string: The string to pack
+    :return: The packed string
+    """
+    if isinstance(string, unicode):
+        string = string.encode("utf-8")
+    else:
+        string = str(string)
+    return RECORD_LENGTH.pack(len(string)) + string
+
+def create_trace_file(directory):
+    """
+    Create a new, uniquely named trace file in a directory. Files are named
+    after the current time, with a counter appended if a file of that name
+    already exists (e.g., of another run started in the same second).
+
+    :param directory: The directory
+    :return: The path of the file and the file, opened for writing
+    """
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+
+    name = strftime("%Y%m%dT%H%M%S")
+    n = 0
+    while True:
+        file_path = os.path.join(directory, "%s.trace" % name if n == 0 else "%s-%s.trace" % (name, n))
+        try:
+            fd = os.open(file_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0))
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+            n += 1
+        else:
+            return (file_path, os.fdopen(fd, "wb"))
+
+class TraceRecorder(events.EventListener):
+    """
+    View class
+    """
+
+    #: Number of uncompressed payload bytes after which a chunk is written
+    CHUNK_SIZE = 1 << 16
+    #: The zlib compression level of chunks
+    COMPRESSION_LEVEL = 6
+
+    def __init__(self, file_path = None, flush_interval = settings.TRACE_FLUSH_INTERVAL, world = None):
+        """
+        :param file_path: The path of the trace file to write, by default a
+                          new file in the traces directory. Traces cannot be
+                          appended to, so the file must not exist yet (or be
+                          empty)
+        :param flush_interval: The number of ticks after which buffered
+                               records are written to the file
+        :param world: Optional, the world whose agents are recorded up front,
+                      so that agent ids follow the order of the agents in the
+                      world (which allows replaying onto a freshly created
+                      world)
+        """
+        if file_path is None:
+            (file_path, self.fp) = create_trace_file(settings.TRACE_DIR)
+        else:
+            # The ids of agents and interactions are only unique within one
+            # recording, so a recording cannot be appended to another
+            if os.path.exists(file_path) and os.path.getsize(file_path) > 0:
+                raise IOError(errno.EEXIST, "The trace file already exists", file_path)
+            self.fp = open(file_path, "wb")
+
+        self.file_path = file_path
+        self.flush_interval = flush_interval
+        self.ticks = 0
+        self.agent_ids = {}
+        self.interaction_ids = {}
+        self.buffer = []
+        self.buffer_size = 0
+
+        self.fp.write(HEADER.pack(MAGIC, VERSION))
+        atexit.register(self.close)
+
+        if world is not None:
+            for agent in world.get_agents():
+                self.get_agent_id(agent)
+
+    def get_file_path(self):
+        return self.file_path
+
+    def write_record(self, record):
+        """
+        Add a length-prefixed record to the buffer, and write a chunk if the
+        buffer is full.
+
+        :param record: The record to add
+        """
+        self.buffer.append(RECORD_LENGTH.pack(len(record)))
+        self.buffer.append(record)
+        self.buffer_size += RECORD_LENGTH.size + len(record)
+
+        if self.buffer_size >= self.CHUNK_SIZE:
+            self.write_chunk()
+
+    def write_chunk(self):
+        """
+        Compress the buffered records and write them to the file as a chunk.
+        """
+        if self.buffer_size == 0:
+            return
+
+        payload = "".join(self.buffer)
+        compressed = zlib.compress(payload, self.COMPRESSION_LEVEL)
+        self.fp.write(CHUNK_HEADER.pack(len(compressed), len(payload)))
+        self.fp.write(compressed)
+
+        self.buffer = []
+        self.buffer_size = 0
+
+    def flush(self):
+        """
+        Write all buffered records to the file.
+        """
+        if self.fp.closed:
+            return
+
+        self.write_chunk()
+        self.fp.flush()
+
+    def close(self):
+        """
+        Write all buffered records and close the file.
+        """
+        self.flush()
+        self.fp.close()
+
+    def get_agent_id(self, agent):
+        """
+        Get the id of an agent, recording the agent if it has not been seen yet.
+
+        :param agent: The agent
+        :return: The id of the agent
+        """
+        agent_id = self.agent_ids.get(agent)
+        if agent_id is None:
+            agent_id = len(self.agent_ids)
+            self.agent_ids[agent] = agent_id
+            self.write_record(AGENT_RECORD.pack(RECORD_AGENT, agent_id) + pack_string(agent.get_name()))
+        return agent_id
+
+    def get_interaction_id(self, interaction_):
+        """
+        Get the id of an interaction, recording the interaction (and the
+        interactions it consists of) if it has not been seen yet.
+
+        :param interaction_: The interaction
+        :return: The id of the interaction
+        """
+        interaction_id = self.interaction_ids.get(interaction_)
+        if interaction_id is not None:
+            return interaction_id
+
+        if isinstance(interaction_, model.interaction.CompositeInteraction):
+            data = IDS.pack(self.get_interaction_id(interaction_.get_pre()), self.get_interaction_id(interaction_.get_post()))
+            kind = INTERACTION_COMPOSITE
+        elif isinstance(interaction_, model.interaction.PrimitivePerceptionInteraction):
+            data = ID.pack(self.get_interaction_id(interaction_.get_primitive_interaction())) + pack_string(interaction_.perception)
+            kind = INTERACTION_PRIMITIVE_PERCEPTION
+        else:
+            data = pack_string(interaction_.get_name()) + pack_string(interaction_.get_result())
+            kind = INTERACTION_PRIMITIVE
+
+        interaction_id = len(self.interaction_ids)
+        self.interaction_ids[interaction_] = interaction_id
+        self.write_record(INTERACTION_RECORD.pack(RECORD_INTERACTION, interaction_id, kind) + data)
+        return interaction_id
+
+    def record_event(self, record_type, event, valence = None):
+        """
+        Record an agent preparation, enaction or intention event.
+
+        :param record_type: The type of the record
+        :param event: The event
+        :param valence: The valence to record, by default the valence of the
+                        event
+        """
+        if valence is None:
+            valence = event.valence
+
+        self.write_record(EVENT_RECORD.pack(
+            record_type,
+            AppState.get_state().get_t(),
+            self.get_agent_id(event.agent),
+            self.get_interaction_id(event.action),
+            valence))
+
+    def notify(self, event):
+        if isinstance(event, events.AgentPreparationEvent):
+            self.record_event(RECORD_PREPARATION, event)
+        elif isinstance(event, events.AgentEnactionEvent):
+            self.record_event(RECORD_ENACTION, event)
+        elif isinstance(event, events.AgentIntentionEvent):
+            self.record_event(RECORD_INTENTION, event, float("nan"))
+        elif isinstance(event, events.TickEvent):
+            self.ticks += 1
+            if self.flush_interval > 0 and self.ticks >= self.flush_interval:
+                self.ticks = 0
+                self.flush()
+        elif isinstance(event, events.QuitEvent):
+            self.close()
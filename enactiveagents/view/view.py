@@ -10,15 +10,22 @@ import pygame
 import model
 from appstate import AppState
 import settings
+import renderexport
 
 class View(events.EventListener):
     """
     View class.
+
+    Only what changed is redrawn: walls are static and drawn once onto a
+    cached background, and sprites are only redrawn (and the display only
+    updated) where an entity moved, rotated or changed color.
+
+    When the simulation runs in its own thread, the view draws the state of
+    the world it captured (between two ticks) instead of the live world.
     """
 
-    sprites = {}
-    agent_interaction = {}
     created_renders_dir = False
+    render_exporter = None
 
     def __init__(self, surface):
         """
@@ -27,26 +34,195 @@ class View(events.EventListener):
         :param surface: The surface of the view.
         """
         self.surface = surface
-        self.group = pygame.sprite.RenderUpdates()
+        # Sprites are drawn in the order they were added (i.e., the order of
+        # the entities in the world), such that overlapping sprites are drawn
+        # the same way every time
+        self.group = pygame.sprite.OrderedUpdates()
+        self.sprites = {}
+        self.agent_interaction = {}
+
+        self.background = None
+        self.walls = frozenset()
+        self.highlight_rect = None
+
+        # The size of a cell on the canvas, and the images of sprites by
+        # shape, size, color and rotation (for that cell size)
+        self.cell_size = None
+        self.images = {}
+
+        # The captured simulation time, entities and states of the entities
+        # (None = draw the live world)
+        self.frame = None
+
+    def capture(self):
+        """
+        Capture the state of the world to draw. Should be called while the
+        world is not being updated.
+        """
+        self.frame = None
+        entities = list(AppState.get_state().get_world().get_entities())
+        states = dict((entity, self.get_entity_state(entity)) for entity in entities)
+        self.frame = (AppState.get_state().get_t(), entities, states)
 
-    def draw_entities(self):
+    def get_entities(self):
+        """
+        :return: The entities to draw
+        """
+        if self.frame is not None:
+            return self.frame[1]
+        return AppState.get_state().get_world().get_entities()
+
+    def get_entity_state(self, entity):
         """
-        Draw all the entities in the world onto the canvas.
+        Get the state of an entity that determines how it is drawn.
+
+        :param entity: The entity
+        :return: A tuple of the position, rotation and color of the entity
+        """
+        if self.frame is not None:
+            return self.frame[2][entity]
+        position = entity.get_position()
+        return (position.get_x(), position.get_y(), entity.get_rotation(), self.get_entity_color(entity))
+
+    def get_entity_color(self, entity):
+        """
+        Get the color an entity should be drawn in. The color can change, e.g.
+        depending on the interaction an agent has just enacted.
+
+        :param entity: The entity
+        :return: The color the entity should be drawn in
+        """
+        color = entity.get_color()
+        if entity in self.agent_interaction:
+            interaction = self.agent_interaction[entity]
+            if isinstance(interaction, model.interaction.PrimitivePerceptionInteraction):
+                interaction = interaction.get_primitive_interaction()
+            if interaction.get_name() == "Step" and interaction.get_result() == "Fail":
+                color = (255,0,0,255)
+        return color
+
+    def update_cell_size(self):
+        """
+        Update the size of a cell on the canvas, e.g., after the canvas or
+        world was resized. Cached sprite images are discarded if the size
+        changed.
+
+        :return: A boolean indicating whether the size changed
         """
         world = AppState.get_state().get_world()
-        
+        cell_size = (
+            round(float(self.surface.get_width()) / world.get_width()),
+            round(float(self.surface.get_height()) / world.get_height()))
+        if cell_size == self.cell_size:
+            return False
+        self.cell_size = cell_size
+        self.images = {}
+        return True
+
+    def get_image(self, shape, size, color, rotation):
+        """
+        Get the image of a sprite, rendering it if it was not cached.
+
+        :param shape: The shape of the sprite as a tuple of vertices (in
+                      cells)
+        :param size: The (width, height) of the sprite in cells
+        :param color: The color of the sprite
+        :param rotation: The rotation of the sprite in degrees
+        :return: The image of the sprite
+        """
+        color = tuple(color)
+        key = (shape, size, color, rotation % 360)
+        image = self.images.get(key)
+        if image is None:
+            (cell_width, cell_height) = self.cell_size
+
+            # Draw the scaled shape onto a surface
+            image = pygame.Surface([size[0] * cell_width, size[1] * cell_height])
+            image.set_colorkey((0, 0, 0))
+            pygame.draw.polygon(
+                image, 
+                color, 
+                [[x * cell_width, y * cell_height] for (x, y) in shape],
+                0)
+
+            if rotation % 360 != 0:
+                image = rot_center(image, rotation % 360)
+            self.images[key] = image
+        return image
+
+    def store_background(self, walls):
+        """
+        Draw the static walls onto the background.
+
+        :param walls: The set of walls
+        """
+        self.walls = walls
+        self.background = pygame.Surface(self.surface.get_size())
+        self.background.fill([0,0,0])
+        for wall in walls:
+            Sprite(wall, self).draw(self.background)
+
+    def draw_entities(self):
+        """
+        Draw the entities in the world that changed onto the canvas.
+
+        :return: A list of the rectangles of the canvas that changed, or None
+                 if the whole canvas was redrawn
+        """
+        entities = self.get_entities()
+        walls = frozenset(entity for entity in entities if isinstance(entity, model.structure.Wall))
+        redraw = (
+            self.update_cell_size()
+            or self.background is None 
+            or walls != self.walls 
+            or self.background.get_size() != self.surface.get_size())
+        if redraw:
+            self.store_background(walls)
+
+        dirty_rects = []
+
         # Create sprites for entities we do not have sprites for yet
-        for entity in AppState.get_state().get_world().get_entities():
-            if entity not in self.sprites.keys():
+        for entity in entities:
+            if entity not in walls and entity not in self.sprites:
                 self.sprites[entity] = Sprite(entity, self)
                 self.group.add(self.sprites[entity])
         # Remove sprites for entities that were removed
+        entities = set(entities)
         for entity in self.sprites.keys():
-            if entity not in AppState.get_state().get_world().get_entities():
-                self.group.remove(self.sprites[entity])
-                del self.sprites[entity]
-        
-        self.group.draw(self.surface)
+            if entity not in entities or entity in walls:
+                sprite = self.sprites.pop(entity)
+                self.group.remove(sprite)
+                if sprite.drawn_rect is not None:
+                    dirty_rects.append(sprite.drawn_rect)
+
+        if redraw:
+            self.surface.blit(self.background, (0, 0))
+            for sprite in self.group.sprites():
+                sprite.draw(self.surface)
+            return None
+
+        # Clear the areas where the changed sprites were and will be drawn
+        sprites = self.group.sprites()
+        changed = set()
+        for sprite in sprites:
+            if sprite.changed():
+                changed.add(sprite)
+                if sprite.drawn_rect is not None:
+                    dirty_rects.append(sprite.drawn_rect)
+                dirty_rects.append(sprite.get_draw_rect().clip(self.surface.get_rect()))
+        if self.highlight_rect is not None:
+            dirty_rects.append(self.highlight_rect)
+        for rect in dirty_rects:
+            self.surface.blit(self.background, rect, rect)
+
+        # Draw the changed sprites and the sprites overlapping the cleared
+        # areas, in order
+        if dirty_rects:
+            for sprite in sprites:
+                if sprite in changed or sprite.drawn_rect.collidelist(dirty_rects) >= 0:
+                    sprite.draw(self.surface)
+
+        return dirty_rects
 
     def draw_mouse_highlight(self):
         """
@@ -55,7 +231,9 @@ class View(events.EventListener):
         if pygame.mouse.get_focused():
             cell = self.window_coords_to_world_coords(pygame.mouse.get_pos())
             rect = (cell[0]*self.get_cell_width(), cell[1]*self.get_cell_height(), self.get_cell_width(), self.get_cell_height());
-            pygame.draw.rect(self.surface, (255,125,55,255), rect, 1);
+            self.highlight_rect = pygame.draw.rect(self.surface, (255,125,55,255), rect, 1);
+        else:
+            self.highlight_rect = None
 
     def get_cell_width(self):
         """
@@ -64,7 +242,9 @@ class View(events.EventListener):
         :return: The width of a single cell on the canvas.
         :rtype: int
         """
-        return round(float(self.surface.get_width()) / AppState.get_state().get_world().get_width())
+        if self.cell_size is None:
+            self.update_cell_size()
+        return self.cell_size[0]
     
     def get_cell_height(self):
         """
@@ -73,7 +253,9 @@ class View(events.EventListener):
         :return: The height of a single cell on the canvas.
         :rtype: int
         """
-        return round(float(self.surface.get_height()) / AppState.get_state().get_world().get_height())
+        if self.cell_size is None:
+            self.update_cell_size()
+        return self.cell_size[1]
 
     def window_coords_to_world_coords(self, coords):
         """
@@ -91,11 +273,15 @@ class View(events.EventListener):
         """
         Draw the world.
         """
-        self.surface.fill([0,0,0])
-        self.surface.convert()
-        self.draw_entities()
+        highlight_rect = self.highlight_rect
+        dirty_rects = self.draw_entities()
         self.draw_mouse_highlight()
-        pygame.display.flip()
+        if dirty_rects is None:
+            pygame.display.flip()
+        else:
+            if self.highlight_rect is not None and self.highlight_rect != highlight_rect:
+                dirty_rects.append(self.highlight_rect)
+            pygame.display.update(dirty_rects)
 
         if save_to_file:
             self.save_surface_to_file()
@@ -106,14 +292,27 @@ class View(events.EventListener):
             os.makedirs(settings.SIMULATION_RENDERS_DIR)
             self.created_renders_dir = True
 
-        path = os.path.join(settings.SIMULATION_RENDERS_DIR, "t%s.png" % AppState.get_state().get_t())
-        pygame.image.save(self.surface, path)
+        if self.frame is not None:
+            t = self.frame[0]
+        else:
+            t = AppState.get_state().get_t()
+        path = os.path.join(settings.SIMULATION_RENDERS_DIR, "t%s.png" % t)
+
+        # Write the render in the background
+        if self.render_exporter is None:
+            self.render_exporter = renderexport.RenderExporter()
+        self.render_exporter.export(self.surface, path)
 
     def notify(self, event):
         if isinstance(event, events.AgentEnactionEvent):
             self.agent_interaction[event.agent] = event.action
+        elif isinstance(event, events.CaptureEvent):
+            self.capture()
         elif isinstance(event, events.DrawEvent):
             self.draw(event.get_save_to_file())
+        elif isinstance(event, events.QuitEvent):
+            if self.render_exporter is not None:
+                self.render_exporter.wait()
 
 
 class Sprite(pygame.sprite.Sprite):
@@ -126,31 +325,14 @@ class Sprite(pygame.sprite.Sprite):
         self.entity = entity
         self.view = view
 
-        self.color = self.get_color()
-        self.store_image()
+        # The shape and size (in cells) of the sprite
+        self.shape = tuple(tuple(vertex) for vertex in self.get_shape())
+        self.size = (self.entity.get_width(), self.entity.get_height())
 
-    def store_image(self):
-        """
-        The the image of the sprite on a surface.
-        """
-        # Create the surface (image) of the sprite
-        self.surface = pygame.Surface([self.entity.get_width() * self.view.get_cell_width(), self.entity.get_height() * self.view.get_cell_height()])
-        self.surface.set_colorkey((0, 0, 0))
-
-        # Scale the sprite's shape
-        self.shape = []
-        for s in self.get_shape():
-            self.shape.append([
-                s[0] * self.view.get_cell_width(),
-                s[1] * self.view.get_cell_height()
-            ])
-
-        # Draw the shape onto the surface
-        pygame.draw.polygon(
-            self.surface, 
-            self.color, 
-            self.shape,
-            0)
+        # The rectangle and state (position, rotation and color) the sprite
+        # was last drawn with
+        self.drawn_rect = None
+        self.drawn_state = None
 
     def get_color(self):
         """
@@ -159,27 +341,47 @@ class Sprite(pygame.sprite.Sprite):
 
         :return: The color the sprite should be
         """
-        color = self.entity.get_color()
-        if self.entity in self.view.agent_interaction:
-            interaction = self.view.agent_interaction[self.entity]
-            if isinstance(interaction, model.interaction.PrimitivePerceptionInteraction):
-                interaction = interaction.get_primitive_interaction()
-            if interaction.get_name() == "Step" and interaction.get_result() == "Fail":
-                color = (255,0,0,255)
-        return color
+        return self.get_state()[3]
+
+    def get_state(self):
+        """
+        Get the state of the sprite that determines how it is drawn.
+
+        :return: A tuple of the position, rotation and color of the sprite
+        """
+        return self.view.get_entity_state(self.entity)
+
+    def changed(self):
+        """
+        Test whether the sprite changed since it was last drawn.
 
-    def get_surface(self):
+        :return: A boolean indicating whether the sprite has to be redrawn
         """
-        Get the surface (image) of the sprite. Update the surface if the color
-        of the sprite has to change.
+        return self.drawn_state != self.get_state()
 
-        :return: The surface (image) of the sprite.
+    def get_draw_rect(self):
         """
-        color = self.get_color()
-        if color != self.color:
-            self.color = color
-            self.store_image()
-        return self.surface
+        Get the rectangle the sprite will be drawn onto in its current state.
+
+        :return: The rectangle in canvas coordinates
+        """
+        (x, y, rotation, color) = self.get_state()
+        (cell_width, cell_height) = self.view.cell_size
+        return pygame.Rect(x * cell_width, y * cell_height, self.size[0] * cell_width, self.size[1] * cell_height)
+
+    def draw(self, surface):
+        """
+        Draw the sprite onto a surface.
+
+        :param surface: The surface to draw onto
+        :return: The rectangle of the surface that was drawn onto
+        """
+        (x, y, rotation, color) = self.drawn_state = self.get_state()
+        (cell_width, cell_height) = self.view.cell_size
+        self.drawn_rect = surface.blit(
+            self.view.get_image(self.shape, self.size, color, rotation), 
+            (x * cell_width, y * cell_height))
+        return self.drawn_rect
 
     def get_shape(self):
         """
@@ -207,11 +409,13 @@ class Sprite(pygame.sprite.Sprite):
         Get the rectangle of the sprite (i.e., its bounding box in canvas
         coordinates).
         """
+        (x, y, rotation, color) = self.get_state()
+        (cell_width, cell_height) = (self.view.get_cell_width(), self.view.get_cell_height())
         return pygame.Rect(
-            self.entity.get_position().get_x() * self.view.get_cell_width(), 
-            self.entity.get_position().get_y() * self.view.get_cell_height(), 
-            self.view.get_cell_width(),
-            self.view.get_cell_height()
+            x * cell_width, 
+            y * cell_height, 
+            cell_width,
+            cell_height
         )
 
     @property
@@ -219,12 +423,10 @@ class Sprite(pygame.sprite.Sprite):
         """
         Get the image of the sprite.
         """
-        surface = self.get_surface()
-        if self.entity.get_rotation() != 0:
-            surface = rot_center(surface, self.entity.get_rotation())
-            return surface
-        else:
-            return surface
+        if self.view.cell_size is None:
+            self.view.update_cell_size()
+        (x, y, rotation, color) = self.get_state()
+        return self.view.get_image(self.shape, self.size, color, rotation)
 
 def rot_center(image, angle):
     """
@@ -3,10 +3,23 @@ Module to hold webserver-related code
 """
 
 import os
+import socket
 import SimpleHTTPServer
 import SocketServer
+import json
 import threading
 import settings
+from utilities.metrics import Metrics
+
+#: Number of seconds after which an idle event stream sends a keep-alive
+STREAM_KEEP_ALIVE = 15
+
+class ThreadingServer(SocketServer.ThreadingTCPServer):
+    """
+    A webserver handling each request in its own thread.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
 
 def start():
     """
@@ -26,15 +39,93 @@ def _start():
     os.chdir(settings.WEBROOT_DIR)
 
     handler = RequestHandler
-    httpd = SocketServer.TCPServer(("", settings.WEB_LISTEN_PORT), handler)
+    httpd = ThreadingServer(("", settings.WEB_LISTEN_PORT), handler)
     httpd.serve_forever()
 
 class RequestHandler(SimpleHTTPServer.SimpleHTTPRequestHandler):
     def do_GET(self):
         if self.path == "/data/traces.json":
+            self.send_cached_json(*trace_view.get_json())
+        elif self.path == "/data/traces/stream":
+            self.send_trace_stream()
+        elif self.path == "/data/profile.json":
             self.send_response(200)
             self.send_header('Content-type', 'text/json')
             self.end_headers()
-            trace_view.write(self.wfile)
+            profile_view.write(self.wfile)
+        elif self.path == "/data/metrics.json":
+            Metrics.get_metrics().request_sample()
+            self.send_body(json.dumps(Metrics.get_metrics().summary()), 'text/json')
+        elif self.path == "/metrics":
+            Metrics.get_metrics().request_sample()
+            self.send_body("".join(line + "\n" for line in Metrics.get_metrics().format_text()), 'text/plain; version=0.0.4')
         else:
             SimpleHTTPServer.SimpleHTTPRequestHandler.do_GET(self)
+
+    def send_body(self, body, content_type):
+        """
+        Send a response that must not be cached.
+
+        :param body: The body of the response
+        :param content_type: The content type of the body
+        """
+        self.send_response(200)
+        self.send_header('Content-type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_cached_json(self, body, etag):
+        """
+        Send JSON with an ETag, or 304 Not Modified if the client has the
+        current version.
+
+        :param body: The encoded JSON
+        :param etag: The ETag of the JSON
+        """
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('Content-type', 'text/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_trace_stream(self):
+        """
+        Stream the trace history as server-sent events: first the full history
+        (a "snapshot" event), then the new events of each tick (as message
+        events). The stream ends when the client lags too far behind; the
+        client then reconnects and receives the full history again.
+        """
+        subscriber = trace_view.subscribe()
+        try:
+            (body, etag, version) = trace_view.get_encoded()
+
+            self.send_response(200)
+            self.send_header('Content-type', 'text/event-stream')
+            self.send_header('Cache-Control', 'no-cache')
+            self.end_headers()
+            self.wfile.write("retry: 1000\nevent: snapshot\ndata: %s\n\n" % body)
+
+            while not subscriber.is_dropped():
+                message = subscriber.get(STREAM_KEEP_ALIVE)
+                if message is None:
+                    # Also detects clients that disconnected
+                    self.wfile.write(": keep-alive\n\n")
+                    continue
+
+                (message_version, delta) = message
+                if message_version > version:
+                    self.wfile.write("data: %s\n\n" % delta)
+        except socket.error:
+            pass
+        finally:
+            trace_view.unsubscribe(subscriber)
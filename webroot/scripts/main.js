@@ -1,8 +1,72 @@
 var TRACES_FILE = "data/traces.json";
+var TRACES_STREAM = "data/traces/stream";
+var HISTORY_SIZE = 20;
+
+var getEnactionSymbol = function(interactionValence) {
+    var interaction = interactionValence[0];
+    if(interaction.interaction) {
+        interaction = interaction.interaction
+    }
+    switch(interaction.name) {
+        case "Step":
+            if(interaction.result == "Succeed") {
+                return "&#x2192;";
+            } else {
+                return "&#x21DD;";
+            }
+        case "Turn Left":
+            return "&#x2B0F;";
+        case "Turn Right":
+            return "&#x21B4;";
+        case "Feel":
+            if(interaction.result == "Succeed") {
+                return "&#x25A0;";
+            } else {
+                return "&#x25A1;";
+            }
+        default:
+            return "?";
+    }
+};
+
+var traceViews = {};
+
+var getTraceView = function(agent) {
+    // Get the element holding the traces of an agent, creating it if needed
+    if(!traceViews[agent]) {
+        var div = $("<div>");
+        var traces = $("<div>").addClass('traces');
+        div.append($("<p>").text(agent));
+        div.append(traces);
+        $("#traces").append(div);
+        traceViews[agent] = traces;
+    }
+    return traceViews[agent];
+};
+
+var appendEnactions = function(agent, enactions) {
+    // Append enactions to the traces of an agent, keeping the most recent
+    var traces = getTraceView(agent);
+    for(var i = 0; i < enactions.length; i++) {
+        traces.append($("<span>").html(" " + getEnactionSymbol(enactions[i])));
+    }
+    var symbols = traces.children();
+    if(symbols.length > HISTORY_SIZE) {
+        symbols.slice(0, symbols.length - HISTORY_SIZE).remove();
+    }
+};
+
+var showTraces = function(data) {
+    $("#traces").empty();
+    traceViews = {};
+    for(agent in data) {
+        appendEnactions(agent, data[agent]["enaction"]);
+    }
+};
 
 var doTraces = (function () {
     var prevData = null;
-    return function() { 
+    return function() {
         $.ajax({
             url: TRACES_FILE,
             dataType: "text"
@@ -11,66 +75,37 @@ var doTraces = (function () {
                 return;
             }
             prevData = data;
-            data = $.parseJSON(data);
-            
-            var tracesContainer = $("#traces");
-            tracesContainer.empty();
-            
-            for(agent in data) {
-                agentHistory = data[agent];
-                var div = $("<div>");
-                var traces = $("<div>").addClass('traces');
-                div.append($("<p>").text(agent));
-                div.append(traces);
-                
-                for(var i = 0; i < agentHistory["enaction"].length; i++) {
-                    var interactionValence = agentHistory["enaction"][i];
-                    var interaction = interactionValence[0];
-                    if(interaction.interaction) {
-                        interaction = interaction.interaction
-                    }
-                    var valence = interactionValence[1];
-                    traces.append(" ");
-                    switch(interaction.name) {
-                        case "Step":
-                            if(interaction.result == "Succeed") {
-                                traces.append("&#x2192;");
-                            } else {
-                                traces.append("&#x21DD;");
-                            }
-                            break;
-                        case "Turn Left":
-                            traces.append("&#x2B0F;");
-                            break;
-                        case "Turn Right":
-                            traces.append("&#x21B4;");
-                            break;
-                        case "Feel":
-                            if(interaction.result == "Succeed") {
-                                traces.append("&#x25A0;");
-                            } else {
-                                traces.append("&#x25A1;");
-                            }
-                            break;
-                        default:
-                            traces.append("?");
-                    }
-                }
-                
-                tracesContainer.append(div);
-            }
-        }).always(function() { 
+            showTraces($.parseJSON(data));
+        }).always(function() {
             setTimeout(function() { doTraces(); }, 100);
         });
     };
 })();
 
-(function() {
+var streamTraces = function() {
+    // Receive the full history once (and on reconnecting), and after that
+    // only the new events of each tick
+    var source = new EventSource(TRACES_STREAM);
+    source.addEventListener("snapshot", function(e) {
+        showTraces($.parseJSON(e.data));
+    });
+    source.onmessage = function(e) {
+        var delta = $.parseJSON(e.data);
+        for(agent in delta) {
+            appendEnactions(agent, delta[agent]["enaction"]);
+        }
+    };
+};
+
+$(function() {
     // Main entry-point function
-    doTraces();
-})();
+    if(window.EventSource) {
+        streamTraces();
+    } else {
+        doTraces();
+    }
+});
 
 hashCode = function(s){
-  return s.split("").reduce(function(a,b){a=((a<<5)-a)+b.charCodeAt(0);return a&a},0);              
+  return s.split("").reduce(function(a,b){a=((a<<5)-a)+b.charCodeAt(0);return a&a},0);
 }
-
@@ -0,0 +1,99 @@
+var METRICS_FILE = "data/metrics.json";
+var METRICS_INTERVAL = 1000;
+
+// The charted metrics: a title, a function getting the value of a sample,
+// and a function formatting a value
+var CHARTS = [
+    ["Ticks per second", function(sample) { return sample.rates["World.ticks"]; }, function(value) { return value.toFixed(1); }],
+    ["Prepare time per tick (ms)", function(sample) { return sample.phases["World.prepare"] * 1000; }, function(value) { return value.toFixed(2); }],
+    ["Enact time per tick (ms)", function(sample) { return sample.phases["World.enact"] * 1000; }, function(value) { return value.toFixed(2); }],
+    ["Composite interactions", function(sample) { return sample.composites; }, function(value) { return value.toFixed(0); }],
+    ["Total weight", function(sample) { return sample.total_weight; }, function(value) { return value.toFixed(0); }],
+    ["Resident memory (MB)", function(sample) { return sample.rss === null ? null : sample.rss / 1048576; }, function(value) { return value.toFixed(1); }]
+];
+
+var chartViews = [];
+
+var getChartView = function(i) {
+    // Get the canvas and value label of a chart, creating them if needed
+    if(!chartViews[i]) {
+        var div = $("<div>").addClass("chart");
+        var value = $("<span>").addClass("value");
+        var canvas = $("<canvas>").attr({width: 420, height: 60});
+        div.append($("<p>").text(CHARTS[i][0] + ": ").append(value));
+        div.append(canvas);
+        $("#metrics").append(div);
+        chartViews[i] = {canvas: canvas[0], value: value};
+    }
+    return chartViews[i];
+};
+
+var drawChart = function(canvas, values) {
+    // Draw a line chart of the values, scaled to fit the canvas
+    var context = canvas.getContext("2d");
+    context.clearRect(0, 0, canvas.width, canvas.height);
+    if(values.length < 2) {
+        return;
+    }
+    var min = Math.min.apply(null, values);
+    var max = Math.max.apply(null, values);
+    var range = (max - min) || 1;
+    context.strokeStyle = "#219b8e";
+    context.beginPath();
+    for(var i = 0; i < values.length; i++) {
+        var x = i * (canvas.width - 1) / (values.length - 1);
+        var y = canvas.height - 1 - (values[i] - min) * (canvas.height - 2) / range;
+        if(i == 0) {
+            context.moveTo(x, y);
+        } else {
+            context.lineTo(x, y);
+        }
+    }
+    context.stroke();
+};
+
+var showCharts = function(series) {
+    for(var i = 0; i < CHARTS.length; i++) {
+        var view = getChartView(i);
+        var values = [];
+        for(var j = 0; j < series.length; j++) {
+            var value = CHARTS[i][1](series[j]);
+            if(typeof value == "number" && isFinite(value)) {
+                values.push(value);
+            }
+        }
+        view.value.text(values.length > 0 ? CHARTS[i][2](values[values.length - 1]) : "-");
+        drawChart(view.canvas, values);
+    }
+};
+
+var showAgents = function(agents) {
+    var table = $("#agents").empty();
+    table.append($("<tr>").append(
+        $("<th>").text("Agent"),
+        $("<th>").text("Composite interactions"),
+        $("<th>").text("Total weight")));
+    for(agent in agents) {
+        table.append($("<tr>").append(
+            $("<td>").text(agent),
+            $("<td>").text(agents[agent].composites),
+            $("<td>").text(agents[agent].total_weight)));
+    }
+};
+
+var doMetrics = function() {
+    $.ajax({
+        url: METRICS_FILE,
+        dataType: "json"
+    }).done(function(data) {
+        showCharts(data.series);
+        showAgents(data.agents);
+    }).always(function() {
+        setTimeout(function() { doMetrics(); }, METRICS_INTERVAL);
+    });
+};
+
+$(function() {
+    // Main entry-point function
+    doMetrics();
+});